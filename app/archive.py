@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+종료된 거래의 로컬 보관소
+- 캐시에서 내보낸 done/cancel 거래를 마켓/날짜별 압축 JSONL 파일(<root>/<market>/<YYYY-MM-DD>.jsonl.gz)에 추가합니다.
+- zstandard 모듈이 있으면 compression="zstd"로 .jsonl.zst 파일을 쓸 수 있습니다.
+- 추가는 버퍼에 모았다가 flush 때 파티션마다 압축 프레임 하나로 붙여 씁니다 (여러 프레임이 이어진 파일도 정상적으로 읽힙니다).
+  add는 버퍼에 넣기만 하므로 호출부가 잠금을 쥔 채 불러도 압축/파일 쓰기를 하지 않습니다.
+- 읽기는 파일을 한 줄씩 푸는 제너레이터라 전체 이력을 메모리에 올리지 않습니다.
+- Firestore가 원본이므로 flush 전에 프로세스가 죽으면 그 사이 거래는 보관소에만 빠집니다.
+
+예)
+  python -m app.archive --root trade_archive --market KRW-BTC --since 2024-05-01
+"""
+import argparse
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import zstandard  # type: ignore
+except Exception:
+    zstandard = None
+
+try:
+    from zoneinfo import ZoneInfo
+except Exception:
+    ZoneInfo = None
+
+log = logging.getLogger("trade")
+
+_SUFFIX = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _open_text(path: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard 모듈이 필요합니다. pip install zstandard 로 설치해 주세요.")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+class TradeArchive:
+    """마켓/날짜로 나눈 압축 JSONL 거래 보관소"""
+
+    def __init__(self, root: str, compression: str = "gzip", timezone: str = "Asia/Seoul", flush_size: int = 500):
+        if compression not in _SUFFIX:
+            raise ValueError(f"알 수 없는 압축 방식: {compression} (가능: {', '.join(_SUFFIX)})")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstandard 모듈이 필요합니다. pip install zstandard 로 설치해 주세요.")
+        self.root = root
+        self.compression = compression
+        self.flush_size = flush_size
+        self._tz = None
+        if ZoneInfo is not None:
+            try:
+                self._tz = ZoneInfo(timezone)
+            except Exception:
+                log.warning(f"시간대를 찾지 못해 UTC 기준으로 날짜를 나눕니다: {timezone}")
+        # (market, day) -> 아직 쓰지 않은 JSON 줄
+        self._buffer: Dict[tuple, List[str]] = {}
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _day(self, trade: Dict[str, Any]) -> str:
+        ts = trade.get('sell_complete_time') or trade.get('updated_at') or trade.get('buy_create_time') or 0
+        tz = self._tz or datetime.timezone.utc
+        return datetime.datetime.fromtimestamp(float(ts), tz).strftime("%Y-%m-%d")
+
+    def path_for(self, market: str, day: str, compression: Optional[str] = None) -> str:
+        return os.path.join(self.root, market, day + _SUFFIX[compression or self.compression])
+
+    def add(self, trade: Dict[str, Any]) -> bool:
+        """
+        거래 하나를 보관 대기열에 넣습니다. 파일에는 쓰지 않습니다.
+        :return: flush_size만큼 모였으면 True (호출부가 잠금 밖에서 flush합니다)
+        """
+        key = (trade.get('market') or "unknown", self._day(trade))
+        line = json.dumps(trade, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._buffer.setdefault(key, []).append(line)
+            self._buffered += 1
+            return self._buffered >= self.flush_size
+
+    def flush(self) -> int:
+        """버퍼의 거래를 파티션 파일에 붙여 쓰고 쓴 건수를 반환합니다."""
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+            self._buffered = 0
+        written = 0
+        with self._write_lock:
+            for (market, day), lines in buffer.items():
+                path = self.path_for(market, day)
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    data = "".join(lines).encode("utf-8")
+                    if self.compression == "zstd":
+                        data = zstandard.ZstdCompressor().compress(data)
+                    else:
+                        data = gzip.compress(data)
+                    with open(path, "ab") as fp:
+                        fp.write(data)
+                    written += len(lines)
+                except Exception as e:
+                    log.error(f"거래 보관 파일 쓰기 실패 ({path}, {len(lines)}건): {e}")
+        return written
+
+    def close(self):
+        self.flush()
+
+    # ---- 읽기 ----
+
+    def markets(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def partitions(self, market: str) -> List[tuple]:
+        """(day, path) 목록을 날짜 순으로 반환합니다."""
+        directory = os.path.join(self.root, market)
+        if not os.path.isdir(directory):
+            return []
+        result = []
+        for name in os.listdir(directory):
+            for suffix in _SUFFIX.values():
+                if name.endswith(suffix):
+                    result.append((name[:-len(suffix)], os.path.join(directory, name)))
+        return sorted(result)
+
+    def iter_trades(self, market: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        보관된 거래를 파티션 날짜 순으로 한 건씩 돌려줍니다 (버퍼에 남은 거래는 포함하지 않습니다).
+        :param since: 이 날짜(YYYY-MM-DD) 이후 파티션만
+        :param until: 이 날짜(YYYY-MM-DD) 이전 파티션만 (포함)
+        """
+        for m in ([market] if market else self.markets()):
+            for day, path in self.partitions(m):
+                if (since and day < since) or (until and day > until):
+                    continue
+                with _open_text(path) as fp:
+                    for line in fp:
+                        if line.strip():
+                            yield json.loads(line)
+
+
+def main():
+    p = argparse.ArgumentParser(description="보관된 거래 이력 조회 (JSONL로 출력)")
+    p.add_argument("--root", type=str, default="trade_archive", help="보관소 디렉터리")
+    p.add_argument("--market", type=str, default="", help="마켓 (없으면 전체)")
+    p.add_argument("--since", type=str, default="", help="YYYY-MM-DD 이후")
+    p.add_argument("--until", type=str, default="", help="YYYY-MM-DD 이전 (포함)")
+    args = p.parse_args()
+    archive = TradeArchive(args.root)
+    for trade in archive.iter_trades(args.market or None, args.since or None, args.until or None):
+        print(json.dumps(trade, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
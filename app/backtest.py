@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+run_once 전략 백테스트
+- 과거 분봉/체결 파일을 스트리밍으로 읽어 SimExchange에 넣고, 실거래와 같은 run_once 결정 코드를 실행합니다.
+- 거래 기록은 MemoryTradeDB 위의 FirestoreCache에 저장되므로 Firestore 없이 동작합니다.
+- 실거래의 이벤트 기반 실행(MarketTriggers)처럼 판단 경계를 넘거나 매도가 체결된 주기에만 run_once를 실행합니다.
+  나머지 캔들은 SimExchange 체결만 처리합니다. 결과는 매 주기 run_once를 실행할 때와 같습니다.
+  (주문 수 상한에 걸려 매 주기 주문을 현재가로 바꾸는 구간은 실거래처럼 매 주기 실행합니다.)
+- 결과로 실현 손익, 자본 사용량, 미체결 주문 수의 시계열과 요약을 JSON으로 출력합니다.
+
+예) python -m app.backtest --data KRW-BTC_1m.csv --market KRW-BTC --krw 10000 --tp 1.0
+"""
+import argparse
+import csv
+import json
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from . import metrics
+from .config import Settings
+from .firestore_trade_db import FirestoreCache
+from .ledger import BalanceLedger
+from .memory_trade_db import MemoryTradeDB
+from .sim_exchange import SimExchange
+from .tiers import DEFAULT_TIER_TABLE, load_tier_table
+from .trade import run_once
+from .triggers import MarketTriggers
+
+log = logging.getLogger("trade")
+
+# (timestamp, open, high, low, close)
+Candle = Tuple[float, float, float, float, float]
+
+# 업비트 캔들 API 필드명도 그대로 읽을 수 있도록 열 이름 후보를 둡니다.
+_TS_KEYS = ("timestamp", "ts", "time", "candle_date_time_utc", "datetime")
+_OPEN_KEYS = ("open", "opening_price")
+_HIGH_KEYS = ("high", "high_price")
+_LOW_KEYS = ("low", "low_price")
+_CLOSE_KEYS = ("close", "trade_price", "price")
+
+
+def _pick(header: list[str], keys: tuple) -> Optional[str]:
+    for key in keys:
+        if key in header:
+            return key
+    return None
+
+
+def _parse_ts(value: str) -> float:
+    try:
+        ts = float(value)
+    except ValueError:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    # 밀리초 단위 타임스탬프
+    return ts / 1000.0 if ts > 1e11 else ts
+
+
+def read_candles(path: str) -> Iterator[Candle]:
+    """
+    CSV 분봉(또는 체결) 파일을 시간순으로 한 줄씩 읽습니다.
+    open/high/low 열이 없으면 체결 파일로 보고 가격 하나로 캔들을 만듭니다.
+    """
+    with open(path, newline="", encoding="utf-8") as fp:
+        reader = csv.reader(fp)
+        header = [h.strip().lower() for h in next(reader)]
+        ts_key = _pick(header, _TS_KEYS)
+        close_key = _pick(header, _CLOSE_KEYS)
+        if ts_key is None or close_key is None:
+            raise SystemExit(f"캔들 파일에 시간/가격 열이 없습니다: {path} ({header})")
+        i_ts = header.index(ts_key)
+        i_close = header.index(close_key)
+        keys = [_pick(header, k) for k in (_OPEN_KEYS, _HIGH_KEYS, _LOW_KEYS)]
+        i_open, i_high, i_low = [header.index(k) if k else i_close for k in keys]
+        for row in reader:
+            if not row:
+                continue
+            yield (
+                _parse_ts(row[i_ts]),
+                float(row[i_open]),
+                float(row[i_high]),
+                float(row[i_low]),
+                float(row[i_close]),
+            )
+
+
+class BacktestRecorder:
+    """캐시 상태 변화로 실현 손익/자본 사용량을 O(1)로 누적합니다."""
+
+    def __init__(self):
+        self.realized_pnl = 0.0
+        self.capital_in_use = 0.0
+        self.max_capital_in_use = 0.0
+        self.buys = 0
+        self.sells = 0
+        self.samples: list[Dict[str, Any]] = []
+
+    def on_trade_update(self, prev_state: Optional[str], trade: dict):
+        state = trade.get('state')
+        buy_amount = trade.get('buy_amount') or 0.0
+        if prev_state is None and state == 'waiting':
+            self.buys += 1
+            self.capital_in_use += buy_amount
+            self.max_capital_in_use = max(self.max_capital_in_use, self.capital_in_use)
+        elif prev_state == 'waiting' and state in {'done', 'cancel'}:
+            self.capital_in_use -= buy_amount
+            if state == 'done':
+                self.sells += 1
+                self.realized_pnl += (trade.get('sell_amount') or 0.0) - buy_amount
+
+    def sample(self, ts: float, sim: SimExchange, open_orders: int):
+        self.samples.append({
+            "ts": ts,
+            "realized_pnl": round(self.realized_pnl, 2),
+            "capital_in_use": round(self.capital_in_use, 2),
+            "open_orders": open_orders,
+            "krw": round(sim.krw, 2),
+            "equity": round(sim.krw + sim.asset_value(), 2),
+        })
+
+
+def run_backtest(
+    cfg: Settings,
+    candles: Iterable[Candle],
+    initial_krw: float = 1_000_000.0,
+    fee_rate: float = 0.0005,
+    sample_every_sec: float = 86400.0,
+) -> Dict[str, Any]:
+    """캔들 스트림을 시뮬레이션하고 결과 보고서를 반환합니다. cfg.market의 첫 마켓만 사용합니다."""
+    # 캔들마다 경계 평가와 run_once를 돌리므로 운영 지표 기록(단계 타이머, 캐시 조회 카운터)은 끕니다.
+    previous = metrics.set_enabled(False)
+    try:
+        return _run_backtest(cfg, candles, initial_krw, fee_rate, sample_every_sec)
+    finally:
+        metrics.set_enabled(previous)
+
+
+def _run_backtest(
+    cfg: Settings,
+    candles: Iterable[Candle],
+    initial_krw: float,
+    fee_rate: float,
+    sample_every_sec: float,
+) -> Dict[str, Any]:
+    market = cfg.market[0]
+    sim = SimExchange(krw=initial_krw, fee_rate=fee_rate)
+    db = FirestoreCache(MemoryTradeDB())
+    # 모의 거래소 잔고 조회는 비용이 없으므로 매번 실제 잔고와 맞춥니다.
+    ledger = BalanceLedger(sim, reconcile_interval_sec=0)
+    recorder = BacktestRecorder()
+    db.add_listener(recorder.on_trade_update)
+    # 모의 거래소 상태는 캔들로만 바뀌고 체결은 아래에서 따로 확인하므로, 실거래의 안전용 heartbeat 실행은 하지 않습니다.
+    triggers = MarketTriggers(cfg, db, [market], heartbeat_sec=math.inf)
+    db.add_listener(triggers.on_trade_update)
+
+    last_buy_price: Optional[float] = None
+    next_run_ts: Optional[float] = None
+    next_sample_ts: Optional[float] = None
+    first_ts = last_ts = None
+    candle_count = 0
+    # 마지막 run_once 이후 체결된 매도가 있는지 보려고 미체결 매도 수를 기억합니다.
+    # 체결 기록(check_pending)은 run_once가 하므로 캔들 고가로 체결되면 종가가 경계 안이어도 실행합니다.
+    open_asks = 0
+    for ts, open_, high, low, close in candles:
+        sim.feed_candle(market, ts, open_, high, low, close)
+        candle_count += 1
+        if first_ts is None:
+            first_ts = ts
+            next_run_ts = ts
+            next_sample_ts = ts
+        last_ts = ts
+        if ts >= next_run_ts:
+            next_run_ts = ts + cfg.interval_sec
+            if triggers.due({market: close}, now=ts) or sim.open_order_count() != open_asks:
+                last_buy_price = run_once(cfg, sim, db, market, last_buy_price, None, ledger)
+                open_asks = sim.open_order_count()
+        if ts >= next_sample_ts:
+            recorder.sample(ts, sim, db.get_waiting_trades_count_by_market(market))
+            next_sample_ts = ts + sample_every_sec
+
+    if last_ts is not None:
+        recorder.sample(last_ts, sim, db.get_waiting_trades_count_by_market(market))
+
+    equity = sim.krw + sim.asset_value()
+    return {
+        "market": market,
+        "candles": candle_count,
+        "start_ts": first_ts,
+        "end_ts": last_ts,
+        "initial_krw": initial_krw,
+        "final_krw": round(sim.krw, 2),
+        "final_equity": round(equity, 2),
+        "return_pct": round((equity / initial_krw - 1.0) * 100.0, 4) if initial_krw else 0.0,
+        "realized_pnl": round(recorder.realized_pnl, 2),
+        "buys": recorder.buys,
+        "sells": recorder.sells,
+        "open_orders": db.get_waiting_trades_count_by_market(market),
+        "capital_in_use": round(recorder.capital_in_use, 2),
+        "max_capital_in_use": round(recorder.max_capital_in_use, 2),
+        "series": recorder.samples,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="run_once 전략 백테스트")
+    p.add_argument("--data", required=True, help="분봉/체결 CSV 파일 (timestamp, open, high, low, close)")
+    p.add_argument("--market", required=True, help="예: KRW-BTC (호가단위 계산에 사용)")
+    p.add_argument("--krw", type=float, required=True, help="주기마다 매수할 KRW 금액 (0이면 자동 거래 금액 모드)")
+    p.add_argument("--tp", type=float, required=True, help="매도조건: +X%% 익절")
+    p.add_argument("--interval", type=int, default=60, help="전략 실행 주기(초, 캔들 시간 기준)")
+    p.add_argument("--skip-buy-within", type=float, default=0.3)
+    p.add_argument("--max-order-count", type=int, default=10)
+    p.add_argument("--tier-table", type=str, default="", help="자동 거래 금액 모드(--krw 0)의 구간 테이블 JSON 파일")
+    p.add_argument("--initial-krw", type=float, default=1_000_000.0, help="시작 KRW 잔고")
+    p.add_argument("--fee", type=float, default=0.0005, help="거래 수수료율 (기본 0.05%%)")
+    p.add_argument("--sample-every", type=float, default=86400.0, help="시계열 기록 간격(초)")
+    p.add_argument("--out", type=str, default="", help="결과 JSON 파일 경로 (없으면 표준출력)")
+    p.add_argument("--verbose", action="store_true", help="매매 로그 출력")
+    return p
+
+
+def settings_for_backtest(args) -> Settings:
+    return Settings(
+        access_key="",
+        secret_key="",
+        market=[args.market],
+        krw=float(args.krw),
+        interval_sec=int(args.interval),
+        tp_ratio=float(args.tp),
+        firestore_credential_path="",
+        skip_buy_within_ratio=float(args.skip_buy_within),
+        buy_fill_timeout_sec=0.0,
+        max_order_count=int(args.max_order_count),
+        tier_table=load_tier_table(args.tier_table) if args.tier_table else DEFAULT_TIER_TABLE,
+    )
+
+
+def main():
+    args = build_parser().parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format="%(message)s")
+    report = run_backtest(
+        settings_for_backtest(args),
+        read_candles(args.data),
+        initial_krw=args.initial_krw,
+        fee_rate=args.fee,
+        sample_every_sec=args.sample_every,
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
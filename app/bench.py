@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+성능 벤치마크
+- FirestoreCache 조회(1k/10k/100k 거래), run_once 한 사이클, check_pending_sell_orders,
+  호가단위/수량 반올림 처리량을 측정합니다.
+- 거래소와 저장소는 SimExchange / MemoryTradeDB를 사용하므로 네트워크 없이 실행됩니다.
+- 결과는 JSON으로 저장하며, 기준(baseline) 결과보다 threshold 이상 느려진 항목이 있으면 종료 코드 1로 끝납니다.
+
+- 저장소의 bench_baseline.json은 --quick 결과입니다. 비교도 --quick으로 실행해야 같은 항목끼리 비교됩니다.
+  코드나 측정 환경이 바뀌어 기준을 새로 잡을 때는 저장소 루트에서 아래처럼 다시 저장해 커밋합니다.
+    python -m app.bench --quick --save-baseline
+
+예)
+  python -m app.bench --quick                         # bench_baseline.json 대비 비교
+  python -m app.bench --quick --threshold 0.2         # 기준 대비 20% 넘게 느려지면 실패
+  python -m app.bench --save-baseline --baseline bench_full.json   # 전체 크기 결과를 별도 파일로 저장
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import time
+import timeit
+from typing import Any, Callable, Dict, Optional
+
+from .config import Settings
+from .firestore_trade_db import FirestoreCache
+from .ledger import BalanceLedger
+from .memory_trade_db import MemoryTradeDB
+from .sim_exchange import SimExchange
+from .trade import check_pending_sell_orders, run_once
+from .util import round_price_to_tick, round_prices_to_tick, round_volume
+
+MARKETS = ["KRW-BTC", "KRW-ETH", "KRW-XRP", "KRW-SOL"]
+BASE_PRICE = 50_000_000.0
+
+log = logging.getLogger("trade")
+
+
+def measure(
+    fn: Callable[..., Any],
+    repeat: int = 3,
+    min_time: float = 0.2,
+    setup: Optional[Callable[[], Any]] = None,
+) -> Dict[str, float]:
+    """fn 한 번의 실행 시간(초)을 최소 min_time 동안 반복 측정하여 가장 빠른 값을 반환합니다.
+
+    setup을 주면 매 실행 전에 (측정 시간 밖에서) 호출하고 그 반환값을 fn에 넘깁니다.
+    상태를 바꾸는 작업을 매번 같은 초기 상태에서 측정할 때 사용합니다.
+    """
+    if setup is None:
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        number = max(int(number * min_time / 0.2), 1)
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        return {"sec_per_op": best, "ops_per_sec": 1.0 / best if best > 0 else 0.0, "number": number}
+
+    def run(count: int) -> float:
+        elapsed = 0.0
+        for _ in range(count):
+            state = setup()
+            started = time.perf_counter()
+            fn(state)
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    first = run(1)
+    number = max(int(min_time / first), 1) if first > 0 else 1
+    best = min(run(number) for _ in range(repeat)) / number
+    return {"sec_per_op": best, "ops_per_sec": 1.0 / best if best > 0 else 0.0, "number": number}
+
+
+def _bench_settings(**kwargs) -> Settings:
+    values = dict(
+        access_key="",
+        secret_key="",
+        market=[MARKETS[0]],
+        krw=10000.0,
+        interval_sec=0,
+        tp_ratio=1.0,
+        firestore_credential_path="",
+        buy_fill_timeout_sec=0.0,
+    )
+    values.update(kwargs)
+    return Settings(**values)
+
+
+def _populate(n: int, sim: Optional[SimExchange] = None, markets: list[str] = MARKETS) -> FirestoreCache:
+    """n개의 대기중 거래를 만듭니다. sim을 주면 실제 지정가 매도 주문도 걸어 둡니다."""
+    rng = random.Random(n)
+    cache = FirestoreCache(MemoryTradeDB())
+    for i in range(n):
+        market = markets[i % len(markets)]
+        buy_price = round_price_to_tick(BASE_PRICE * (1.0 + rng.uniform(0.0, 0.1)), market=market)
+        sell_price = round_price_to_tick(buy_price * 1.01, market=market)
+        # 일부는 손절 재주문 대상(매도가 < 매수가)으로 만듭니다.
+        if i % 20 == 0:
+            sell_price = round_price_to_tick(buy_price * 0.99, market=market)
+        volume = round_volume(10000.0 / buy_price, 8)
+        sell_uuid = f"bench-sell-{i}"
+        if sim is not None:
+            sim.assets[market] = sim.assets.get(market, 0.0) + volume
+            sell_uuid = sim.sell_limit(market, volume, max(sell_price, BASE_PRICE * 1.01))["uuid"]
+        cache.upsert_trade({
+            'buy_uuid': f"bench-buy-{i}",
+            'buy_price': buy_price,
+            'buy_quantity': volume,
+            'buy_amount': 10000.0,
+            'buy_create_time': 0,
+            'sell_uuid': sell_uuid,
+            'sell_price': sell_price,
+            'sell_amount': None,
+            'sell_complete_time': None,
+            'state': 'waiting',
+            'market': market,
+        })
+    return cache
+
+
+def bench_cache_queries(sizes: list[int], results: Dict[str, Any]):
+    for n in sizes:
+        cache = _populate(n)
+        market = MARKETS[0]
+        sell_uuid = f"bench-sell-{n // 2}"
+        cases = {
+            "get_waiting_trades_by_market": lambda: cache.get_waiting_trades_by_market(market),
+            "get_waiting_loss_trades_by_market": lambda: cache.get_waiting_loss_trades_by_market(market),
+            "get_min_price_waiting_trade": lambda: cache.get_min_price_waiting_trade(market),
+            "get_max_price_waiting_trade": lambda: cache.get_max_price_waiting_trade(market),
+            "get_waiting_trades_count_by_market": lambda: cache.get_waiting_trades_count_by_market(market),
+            "get_waiting_trade_count_all_market": cache.get_waiting_trade_count_all_market,
+            "get_trade_by_sell_uuid": lambda: cache.get_trade_by_sell_uuid(sell_uuid),
+        }
+        for name, fn in cases.items():
+            results[f"cache.{name}[n={n}]"] = measure(fn)
+
+
+def bench_run_once(open_counts: list[int], results: Dict[str, Any]):
+    market = MARKETS[0]
+    # 대기 주문 수를 일정하게 유지하도록 매수 대신 기존 주문 변경 경로를 탑니다.
+    cfg = _bench_settings(max_order_count=-1)
+
+    def fresh(n: int):
+        # run_once는 주문을 바꾸고 캐시를 갱신하므로 매 실행마다 같은 초기 상태를 새로 만듭니다.
+        sim = SimExchange(krw=1_000_000_000.0)
+        sim.set_price(market, BASE_PRICE)
+        cache = _populate(n, sim, markets=[market])
+        return sim, cache, BalanceLedger(sim, reconcile_interval_sec=0)
+
+    for n in open_counts:
+        # 초기 상태를 만드는 비용이 run_once보다 훨씬 크므로 측정 시간은 짧게 잡습니다.
+        results[f"run_once[open={n}]"] = measure(
+            lambda state: run_once(cfg, state[0], state[1], market, None, None, state[2]),
+            min_time=0.02,
+            setup=lambda n=n: fresh(n),
+        )
+
+
+def bench_check_pending(sizes: list[int], results: Dict[str, Any]):
+    market = MARKETS[0]
+    for n in sizes:
+        sim = SimExchange()
+        sim.set_price(market, BASE_PRICE)
+        cache = _populate(n, sim, markets=[market])
+        cfg = _bench_settings()
+        results[f"check_pending_sell_orders[waiting={n}]"] = measure(
+            lambda: check_pending_sell_orders(cfg, sim, cache, market)
+        )
+
+
+def bench_rounding(results: Dict[str, Any], count: int = 100_000):
+    rng = random.Random(0)
+    prices = [10 ** rng.uniform(-2, 8) for _ in range(count)]
+    volumes = [rng.uniform(0, 100) for _ in range(count)]
+
+    def loop_prices():
+        for p in prices:
+            round_price_to_tick(p, 'up')
+
+    def loop_volumes():
+        for v in volumes:
+            round_volume(v, 8)
+
+    # 항목당 시간으로 기록해 데이터 크기와 무관하게 비교합니다.
+    for name, fn in {
+        "util.round_price_to_tick": loop_prices,
+        "util.round_prices_to_tick": lambda: round_prices_to_tick(prices, 'up'),
+        "util.round_volume": loop_volumes,
+    }.items():
+        r = measure(fn, repeat=3)
+        r["sec_per_op"] /= count
+        r["ops_per_sec"] *= count
+        results[name] = r
+
+
+def run_all(quick: bool = False, only: str = "") -> Dict[str, Any]:
+    sizes = [1_000, 10_000] if quick else [1_000, 10_000, 100_000]
+    open_counts = [0, 100, 1_000] if quick else [0, 100, 1_000, 10_000]
+    pending_sizes = [1_000, 10_000] if quick else [1_000, 10_000, 50_000]
+    groups = {
+        "cache": lambda r: bench_cache_queries(sizes, r),
+        "run_once": lambda r: bench_run_once(open_counts, r),
+        "check_pending": lambda r: bench_check_pending(pending_sizes, r),
+        "rounding": bench_rounding,
+    }
+    results: Dict[str, Any] = {}
+    for name, fn in groups.items():
+        if only and only not in name:
+            continue
+        started = time.perf_counter()
+        fn(results)
+        print(f"[bench] {name} 완료 ({time.perf_counter() - started:.1f}초)", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "time": int(time.time()),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> list[str]:
+    """기준 대비 threshold(0.2 == 20%)보다 느려진 항목을 반환합니다."""
+    regressions = []
+    base_results = baseline.get("results", {})
+    for name, r in sorted(current["results"].items()):
+        base = base_results.get(name)
+        if not base or not base.get("sec_per_op"):
+            continue
+        ratio = r["sec_per_op"] / base["sec_per_op"]
+        r["baseline_sec_per_op"] = base["sec_per_op"]
+        r["ratio"] = ratio
+        if ratio > 1.0 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def format_results(report: Dict[str, Any]) -> str:
+    lines = [f"{'항목':<58} {'1회(us)':>12} {'기준대비':>9}"]
+    for name, r in sorted(report["results"].items()):
+        ratio = f"{r['ratio']:.2f}x" if "ratio" in r else "-"
+        lines.append(f"{name:<58} {r['sec_per_op'] * 1e6:>12.3f} {ratio:>9}")
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="CoinBox 성능 벤치마크")
+    p.add_argument("--baseline", type=str, default="bench_baseline.json", help="기준 결과 JSON 파일")
+    p.add_argument("--save-baseline", action="store_true", help="이번 결과를 기준 파일로 저장")
+    p.add_argument("--threshold", type=float, default=0.2, help="허용 성능 저하 비율 (0.2 == 20%%)")
+    p.add_argument("--out", type=str, default="", help="결과 JSON 파일 경로")
+    p.add_argument("--quick", action="store_true", help="작은 데이터 크기만 측정")
+    p.add_argument("--only", type=str, default="", help="이름에 이 문자열이 포함된 그룹만 실행 (cache, run_once, check_pending, rounding)")
+    return p
+
+
+def main():
+    args = build_parser().parse_args()
+    # 로그 출력 비용은 측정에서 제외합니다.
+    logging.disable(logging.CRITICAL)
+    report = run_all(quick=args.quick, only=args.only)
+
+    regressions: list[str] = []
+    if not args.save_baseline:
+        try:
+            with open(args.baseline, encoding="utf-8") as fp:
+                baseline = json.load(fp)
+        except FileNotFoundError:
+            print(f"기준 파일이 없어 비교를 건너뜁니다: {args.baseline}", file=sys.stderr)
+        else:
+            if baseline.get("meta", {}).get("quick") != args.quick:
+                print(f"기준 파일과 --quick 설정이 달라 일부 항목만 비교됩니다: {args.baseline}", file=sys.stderr)
+            regressions = compare(report, baseline, args.threshold)
+            report["regressions"] = regressions
+            report["threshold"] = args.threshold
+
+    print(format_results(report))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fp:
+            fp.write(text)
+        print(f"기준 결과를 저장했습니다: {args.baseline}")
+
+    if regressions:
+        print(f"성능 저하 {len(regressions)}건 (허용 {args.threshold:.0%} 초과): {', '.join(regressions)}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
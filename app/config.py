@@ -3,6 +3,9 @@
 from dataclasses import dataclass
 import os
 
+from .tiers import DEFAULT_TIER_TABLE, TierTable, load_tier_table
+from .shard import default_worker_id
+
 
 @dataclass
 class Settings:
@@ -20,6 +23,46 @@ class Settings:
     skip_buy_within_ratio: float = 0.3  # 이전 매수가 대비 X% 이내면 매수 스킵
     buy_fill_timeout_sec: float = 30.0  # 매수 주문 체결 대기 타임아웃
     max_order_count: int = 10 # 매도 최대 갯수
+    workers: int = 1  # 2 이상이면 마켓들을 워커 풀에서 병렬 실행
+    market_delay_sec: float = 5.0  # 순차 실행 시 마켓 사이 대기 시간
+    ticker_ttl_sec: float = 10.0  # 현재가 스냅샷 유효 시간
+    write_behind: bool = False  # Firestore 쓰기를 저널 + 배치 반영으로 처리
+    journal_path: str = "trade_journal.jsonl"  # write-behind 로컬 저널 경로
+    flush_size: int = 100  # 대기 건수가 이 값 이상이면 즉시 배치 반영
+    flush_interval_sec: float = 1.0  # 배치 반영 주기
+    snapshot_path: str = "trade_snapshot.db"  # 캐시 로컬 스냅샷 경로 (빈 값이면 사용 안 함)
+    full_reload: bool = False  # 시작 시 스냅샷을 무시하고 Firestore 전체 재로딩
+    websocket: bool = False  # WebSocket ticker/myOrder 이벤트로 체결/가격 반영
+    ws_url: str = "wss://api.upbit.com/websocket/v1"  # 공개(ticker) 스트림 주소
+    ws_private_url: str = "wss://api.upbit.com/websocket/v1/private"  # 개인(myOrder) 스트림 주소
+    balance_reconcile_sec: float = 300.0  # 로컬 KRW 장부를 실제 잔고와 맞추는 주기
+    tier_table: TierTable = DEFAULT_TIER_TABLE  # 자동 거래 금액 모드의 구간 테이블
+    sim_seed: int = 0  # 드라이런 모의 거래소 가격 과정 시드
+    sim_start_price: float = 100_000.0  # 드라이런 시작 가격
+    sim_volatility: float = 0.001  # 드라이런 한 단계 가격 변동성 (0.001 == 0.1%)
+    sim_liquidity_krw: float = 1_000_000.0  # 드라이런 한 단계 평균 체결 가능 거래대금 (0이면 전량 체결)
+    sim_step_sec: float = 1.0  # 드라이런 가격 한 단계가 나타내는 시간(초)
+    sim_krw: float = 1_000_000.0  # 드라이런 시작 KRW 잔고
+    sim_fee_rate: float = 0.0005  # 드라이런 거래 수수료율
+    metrics_port: int = 0  # 지표(/metrics) HTTP 포트 (0이면 사용 안 함)
+    http_backend: str = "native"  # REST 호출 방식: native(keep-alive 세션) | pyupbit
+    upbit_api_url: str = "https://api.upbit.com"  # REST API 주소 (로컬 대역 서버 테스트용)
+    event_trigger: bool = True  # 가격이 판단 경계를 넘은 마켓만 run_once 실행
+    heartbeat_sec: float = 300.0  # 경계를 넘지 않아도 마켓별로 run_once를 실행하는 최대 간격
+    archive_dir: str = "trade_archive"  # 캐시에서 내보낸 종료 거래 보관 디렉터리 (빈 값이면 보관 안 함)
+    archive_compression: str = "gzip"  # 보관 파일 압축: gzip | zstd
+    pnl_checkpoint_path: str = "pnl_checkpoint.json"  # 실현 손익 누계 체크포인트 (빈 값이면 저장 안 함)
+    pnl_checkpoint_sec: float = 60.0  # 손익 체크포인트 저장 주기(초)
+    shard: bool = False  # 여러 워커가 마켓 lease를 나눠 갖는 분할 실행
+    worker_id: str = ""  # 분할 실행 워커 ID (기본: 호스트명-PID)
+    lease_ttl_sec: float = 30.0  # 마켓 lease 만료 시간(초). heartbeat는 이 값의 1/3 주기
+    event_journal_path: str = "events.jsonl"  # 구조화 이벤트 저널 (빈 값이면 기록 안 함)
+    event_journal_max_mb: float = 64.0  # 이 크기를 넘으면 .1, .2 ... 로 회전
+    event_journal_backups: int = 5  # 보관할 회전 파일 수
+    event_debug_sample: float = 0.01  # 디버그 이벤트 표본 비율 (1이면 전부, 0이면 기록 안 함)
+    trade_store: str = "firestore"  # 거래 저장소: firestore | sqlite | memory
+    trade_store_path: str = "trade_store.db"  # sqlite 저장소 파일
+    market_data_path: str = ""  # 현재가를 분봉/틱 링 버퍼로 기록할 공유 시세 파일 (빈 값이면 기록 안 함)
 
     @staticmethod
     def from_env_and_args(args) -> "Settings":
@@ -28,6 +71,17 @@ class Settings:
         if not args.dry_run and (not access or not secret):
             raise SystemExit("실거래 모드에서 UPBIT_ACCESS_KEY / UPBIT_SECRET_KEY 환경변수를 설정해 주세요. (또는 --dry-run 사용)")
 
+        shard = bool(args.shard)
+        worker_id = args.worker_id or default_worker_id()
+        journal_path = args.journal_path
+        pnl_checkpoint_path = args.pnl_checkpoint
+        event_journal_path = args.event_journal
+        if shard:
+            # 같은 호스트의 워커끼리 로컬 파일이 겹치지 않도록 워커 ID를 붙입니다.
+            journal_path = _per_worker_path(journal_path, worker_id)
+            pnl_checkpoint_path = _per_worker_path(pnl_checkpoint_path, worker_id)
+            event_journal_path = _per_worker_path(event_journal_path, worker_id)
+
         return Settings(
             access_key=access,
             secret_key=secret,
@@ -41,4 +95,53 @@ class Settings:
             skip_buy_within_ratio=float(args.skip_buy_within),
             buy_fill_timeout_sec=float(args.fill_timeout),
             max_order_count=int(args.max_order_count),
+            workers=int(args.workers),
+            market_delay_sec=float(args.market_delay),
+            ticker_ttl_sec=float(args.ticker_ttl),
+            write_behind=bool(args.write_behind),
+            journal_path=journal_path,
+            flush_size=int(args.flush_size),
+            flush_interval_sec=float(args.flush_interval),
+            snapshot_path=args.snapshot_path,
+            full_reload=bool(args.full_reload),
+            websocket=bool(args.websocket),
+            ws_url=args.ws_url,
+            ws_private_url=args.ws_private_url,
+            balance_reconcile_sec=float(args.balance_reconcile),
+            tier_table=load_tier_table(args.tier_table) if args.tier_table else DEFAULT_TIER_TABLE,
+            sim_seed=int(args.sim_seed),
+            sim_start_price=float(args.sim_start_price),
+            sim_volatility=float(args.sim_volatility),
+            sim_liquidity_krw=float(args.sim_liquidity),
+            sim_step_sec=float(args.sim_step),
+            sim_krw=float(args.sim_krw),
+            sim_fee_rate=float(args.sim_fee),
+            metrics_port=int(args.metrics_port),
+            http_backend=args.http_backend,
+            upbit_api_url=args.upbit_url,
+            event_trigger=not bool(args.no_event_trigger),
+            heartbeat_sec=float(args.heartbeat),
+            archive_dir=args.archive_dir,
+            archive_compression=args.archive_compression,
+            pnl_checkpoint_path=pnl_checkpoint_path,
+            pnl_checkpoint_sec=float(args.pnl_checkpoint_interval),
+            shard=shard,
+            worker_id=worker_id,
+            lease_ttl_sec=float(args.lease_ttl),
+            event_journal_path=event_journal_path,
+            event_journal_max_mb=float(args.event_journal_max_mb),
+            event_journal_backups=int(args.event_journal_backups),
+            event_debug_sample=float(args.event_debug_sample),
+            # 저장소를 지정하지 않으면 드라이런은 메모리, 실거래는 Firestore를 씁니다.
+            trade_store=args.store or ("memory" if args.dry_run else "firestore"),
+            trade_store_path=args.store_path,
+            market_data_path=args.market_data,
         )
+
+
+def _per_worker_path(path: str, worker_id: str) -> str:
+    """trade_journal.jsonl -> trade_journal.<worker_id>.jsonl (빈 값은 그대로)"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{worker_id}{ext}"
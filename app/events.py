@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+구조화 이벤트 저널
+- 매매 경로는 주문/체결/주문 변경/매수 스킵 판단 같은 이벤트를 emit()으로 큐에 넣기만 합니다.
+  직렬화와 파일 쓰기는 백그라운드 스레드가 배치로 처리하므로 사이클 경로에서 문자열 포맷팅과 I/O가 빠집니다.
+- 기록은 한 줄에 하나의 JSON 객체(JSONL)이며, 파일이 max_bytes를 넘으면 events.jsonl.1, .2 ... 로 밀어냅니다.
+- 디버그 이벤트는 kind별 카운터로 결정적으로 표본 추출합니다 (debug_sample=0.01이면 100건 중 1건).
+- 큐가 가득 차면 이벤트를 버리고 coinbox_events_dropped_total을 올립니다 (매매는 기다리지 않습니다).
+- run_once가 사용한 현재가는 price 이벤트로 모두 남기므로, 저널을 백테스트 가격 파일로 내보내 같은 판단을 재현할 수 있습니다.
+- emit()에 넘기는 값은 숫자/문자열 같은 불변 값이어야 합니다 (직렬화는 나중에 다른 스레드에서 일어납니다).
+
+예)
+  python -m app.events --path events.jsonl --kind skip --market KRW-BTC
+  python -m app.events --path events.jsonl --market KRW-BTC --prices > KRW-BTC_replay.csv
+  python -m app.backtest --data KRW-BTC_replay.csv --market KRW-BTC --krw 10000 --tp 1.0
+"""
+import argparse
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+from .metrics import REGISTRY
+
+log = logging.getLogger("trade")
+
+# 이벤트 종류
+PRICE = "price"  # run_once가 사용한 현재가
+SKIP = "skip"  # 매수를 건너뛴 판단과 그 비율
+ORDER_PLACED = "order_placed"  # 시장가 매수 / 지정가 매도 주문
+FILL = "fill"  # 매수 체결 결과, 매도 체결/취소 반영
+REPRICE = "reprice"  # 매도 주문 가격 변경
+ORDER_CHECK = "order_check"  # (debug) 대기 매도 주문 상태 확인
+LOWEST_TRADE = "lowest_trade"  # (debug) 스킵 판단에 쓴 최저 매도가 거래
+
+EVENTS_WRITTEN = REGISTRY.counter("coinbox_events_written_total", "이벤트 저널에 기록한 이벤트 수", ("kind",))
+EVENTS_DROPPED = REGISTRY.counter("coinbox_events_dropped_total", "큐가 가득 차 버린 이벤트 수")
+
+_STOP = object()
+
+
+def _dumps(record: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record, default=str) + b"\n"
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+class EventJournal:
+    """이벤트를 큐에 받아 백그라운드에서 JSONL 파일로 쓰는 저널"""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        backups: int = 5,
+        debug_sample: float = 0.01,
+        queue_size: int = 100_000,
+        flush_interval_sec: float = 0.5,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.debug_sample = min(max(debug_sample, 0.0), 1.0)
+        self.flush_interval_sec = flush_interval_sec
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._seq = itertools.count(1)
+        # kind -> 디버그 이벤트 카운터 (표본 추출용).
+        # emit()은 마켓/재호가 스레드에서 함께 불리므로 읽고-쓰기 대신 next()가 원자적인 itertools.count를 씁니다.
+        self._debug_counts: Dict[str, Iterator[int]] = {}
+        self._fp = None
+        self._size = 0
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 생산자 (매매 경로) ----
+
+    def _sampled(self, kind: str) -> bool:
+        counter = self._debug_counts.get(kind)
+        if counter is None:
+            counter = self._debug_counts.setdefault(kind, itertools.count())
+        n = next(counter)
+        # n*rate의 정수 부분이 바뀌는 순간만 남기면 1/rate건마다 정확히 한 건이 남습니다.
+        return int((n + 1) * self.debug_sample) > int(n * self.debug_sample)
+
+    def emit(self, kind: str, market: Optional[str] = None, debug: bool = False, **fields: Any) -> None:
+        """이벤트를 큐에 넣습니다. 포맷팅/쓰기는 하지 않습니다."""
+        if debug and not self._sampled(kind):
+            return
+        try:
+            self._queue.put_nowait((time.time(), next(self._seq), kind, market, fields))
+        except queue.Full:
+            EVENTS_DROPPED.inc()
+
+    # ---- 기록 스레드 ----
+
+    def start(self) -> "EventJournal":
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fp = open(self.path, "ab")
+        self._size = self._fp.tell()
+        self._thread = threading.Thread(target=self._run, name="event-journal", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval_sec)]
+            except queue.Empty:
+                continue
+            # 쌓인 이벤트를 한 번에 가져와 쓰기 호출 수를 줄입니다.
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # close() 뒤에 들어온 이벤트가 있으면 종료 표시가 배치 중간에 올 수 있습니다.
+            if any(item is _STOP for item in items):
+                items = [item for item in items if item is not _STOP]
+                stopping = True
+            try:
+                self._write(items)
+            except Exception as e:
+                log.error(f"이벤트 저널 쓰기 실패 ({len(items)}건): {e}")
+
+    def _write(self, items: List[tuple]):
+        if not items:
+            return
+        chunks = []
+        for ts, seq, kind, market, fields in items:
+            record = {"ts": round(ts, 6), "seq": seq, "kind": kind}
+            if market is not None:
+                record["market"] = market
+            record.update(fields)
+            chunks.append(_dumps(record))
+            EVENTS_WRITTEN.labels(kind).inc()
+        data = b"".join(chunks)
+        if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._fp.write(data)
+        self._fp.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        """events.jsonl -> events.jsonl.1 -> ... -> events.jsonl.<backups> (가장 오래된 파일은 지웁니다)"""
+        self._fp.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._fp = open(self.path, "ab")
+        self._size = 0
+
+    def close(self, timeout: float = 5.0):
+        """남은 이벤트를 모두 쓰고 기록 스레드를 멈춥니다."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+# ---- 전역 저널 (설정되지 않으면 emit은 아무 일도 하지 않습니다) ----
+
+_journal: Optional[EventJournal] = None
+
+
+def set_journal(journal: Optional[EventJournal]) -> None:
+    global _journal
+    _journal = journal
+
+
+def emit(kind: str, market: Optional[str] = None, debug: bool = False, **fields: Any) -> None:
+    journal = _journal
+    if journal is not None:
+        journal.emit(kind, market, debug, **fields)
+
+
+def start_log_listener(level: int = logging.INFO, fmt: str = "%(asctime)s %(levelname)s [%(threadName)s] %(message)s") -> logging.handlers.QueueListener:
+    """
+    루트 로거의 출력을 QueueHandler -> 백그라운드 QueueListener(stderr)로 돌려 콘솔 쓰기가 호출 스레드를 막지 않게 합니다.
+    반환한 listener는 종료 시 stop()을 호출해 남은 로그를 내보내야 합니다.
+    """
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(fmt))
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+    listener.start()
+    return listener
+
+
+# ---- 읽기 / 재현 ----
+
+def journal_files(path: str) -> List[str]:
+    """오래된 순서의 저널 파일 목록 (events.jsonl.N ... events.jsonl.1, events.jsonl)"""
+    rotated = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        rotated.append(f"{path}.{i}")
+        i += 1
+    files = list(reversed(rotated))
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def iter_events(path: str, kinds: Optional[List[str]] = None, market: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """저널의 이벤트를 기록 순서대로 한 건씩 돌려줍니다. 마지막 줄이 잘려 있으면 건너뜁니다."""
+    kind_set = set(kinds) if kinds else None
+    for file_path in journal_files(path):
+        with open(file_path, "rb") as fp:
+            for line in fp:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if kind_set is not None and event.get("kind") not in kind_set:
+                    continue
+                if market is not None and event.get("market") != market:
+                    continue
+                yield event
+
+
+def write_prices_csv(events: Iterator[Dict[str, Any]], out) -> int:
+    """price 이벤트를 백테스트 가격 파일(timestamp,open,high,low,close)로 씁니다. 쓴 줄 수를 반환합니다."""
+    out.write("timestamp,open,high,low,close\n")
+    rows = 0
+    for event in events:
+        price = event.get("price")
+        if event.get("kind") != PRICE or price is None:
+            continue
+        out.write(f"{event['ts']},{price},{price},{price},{price}\n")
+        rows += 1
+    return rows
+
+
+def main():
+    p = argparse.ArgumentParser(description="이벤트 저널 조회 / 백테스트 가격 파일 내보내기")
+    p.add_argument("--path", type=str, default="events.jsonl", help="저널 파일 경로 (회전된 .1, .2 ... 파일도 함께 읽음)")
+    p.add_argument("--kind", nargs="*", default=None, help="이벤트 종류 필터 (예: skip order_placed)")
+    p.add_argument("--market", type=str, default="", help="마켓 필터")
+    p.add_argument("--prices", action="store_true", help="price 이벤트를 app.backtest --data 용 CSV로 출력 (--market 필요)")
+    args = p.parse_args()
+    market = args.market or None
+    if args.prices:
+        if market is None:
+            raise SystemExit("--prices에는 --market이 필요합니다.")
+        write_prices_csv(iter_events(args.path, [PRICE], market), sys.stdout)
+        return
+    for event in iter_events(args.path, args.kind, market):
+        print(json.dumps(event, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,379 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
+import bisect
+import threading
 import time
 import os
 
+from .trade_record import STATE_WAITING, TradeRecord
+from .shard import claim_lease
+from .metrics import CACHE_LOOKUPS, CACHE_QUERIES, CACHE_SCANNED, FIRESTORE_WRITE_ERRORS, FIRESTORE_WRITE_SECONDS, timed
+
+# 조회마다 라벨을 찾지 않도록 자주 쓰는 지표를 미리 만들어 둡니다.
+_Q_WAITING = CACHE_QUERIES.labels("get_waiting_trades_by_market")
+_S_WAITING = CACHE_SCANNED.labels("get_waiting_trades_by_market")
+_Q_LOSS = CACHE_QUERIES.labels("get_waiting_loss_trades_by_market")
+_S_LOSS = CACHE_SCANNED.labels("get_waiting_loss_trades_by_market")
+_Q_MIN = CACHE_QUERIES.labels("get_min_price_waiting_trade")
+_Q_MAX = CACHE_QUERIES.labels("get_max_price_waiting_trade")
+_Q_COUNT = CACHE_QUERIES.labels("get_waiting_trades_count_by_market")
+_Q_COUNT_ALL = CACHE_QUERIES.labels("get_waiting_trade_count_all_market")
+_Q_SELL = CACHE_QUERIES.labels("get_trade_by_sell_uuid")
+_HIT = CACHE_LOOKUPS.labels("hit")
+_MISS = CACHE_LOOKUPS.labels("miss")
+
 class FirestoreCache:
-    """Firestore 읽기 요청을 줄이기 위한 로컬 인메모리 캐시"""
-    def __init__(self, db_instance):
+    """Firestore 읽기 요청을 줄이기 위한 로컬 인메모리 캐시
+
+    upsert_trade 시점에 market -> state -> sell_price 오름차순 인덱스와 상태별 카운터를
+    함께 갱신하므로, 조회 메서드는 전체 캐시를 순회하지 않습니다.
+    거래는 dict 대신 TradeRecord(__slots__)로 보관하며, 조회 결과도 TradeRecord입니다 (dict처럼 사용 가능).
+    저장소/저널/스냅샷에는 to_dict()로 변환한 값만 넘깁니다.
+    'waiting'이 아닌(done/cancel) 거래는 리스너 호출 후 캐시에서 내보내므로 캐시 크기는 미체결 주문 수를 따릅니다.
+    archive가 설정되면 내보낸 거래를 로컬 압축 보관소(TradeArchive)에 남깁니다.
+    여러 마켓 워커가 동시에 접근할 수 있으므로 캐시/인덱스 변경과 조회는 잠금 안에서 수행합니다.
+    """
+    def __init__(self, db_instance, writer=None, snapshot=None, archive=None):
         self.db = db_instance
+        # 설정되면 Firestore 쓰기를 WriteBehindWriter에 맡깁니다 (write-behind 모드).
+        self.writer = writer
+        # 설정되면 미완료 거래와 동기화 워터마크를 로컬 스냅샷에 보관합니다.
+        self.snapshot = snapshot
+        # 설정되면 캐시에서 내보낸 종료 거래를 마켓/날짜별 압축 파일로 보관합니다.
+        self.archive = archive
         self._cache = {}
+        # market -> state -> [(sell_price, buy_uuid), ...] (sell_price 오름차순)
+        self._index: dict[str, dict[str, list[tuple[float, str]]]] = {}
+        # buy_uuid -> 인덱스에 등록된 (market, state, 정렬 키, sell_uuid)
+        self._index_keys: dict[str, tuple[str, str, tuple[float, str], str | None]] = {}
+        # sell_uuid -> buy_uuid (체결 이벤트로 거래를 찾기 위한 인덱스)
+        self._sell_index: dict[str, str] = {}
+        # state -> 전체 마켓 거래 수
+        self._state_counts: dict[str, int] = {}
+        # 마지막 스냅샷 저장 이후 변경/제거된 buy_uuid
+        self._dirty: set[str] = set()
+        self._removed: set[str] = set()
+        # 이 시점 이후의 변경분만 Firestore에서 가져오면 되는 동기화 기준 (updated_at)
+        self._watermark = 0.0
+        # upsert_trade 상태 변화 리스너: callback(이전 state, 거래)
+        self._listeners = []
+        # 분할 실행 시 다른 워커들이 가진 'waiting' 거래 수 (ShardCoordinator가 갱신)
+        self._remote_waiting = 0
+        self._lock = threading.RLock()
+
+    def add_listener(self, callback):
+        """upsert_trade로 거래가 갱신될 때마다 callback(이전 state 또는 None, 거래)를 호출합니다."""
+        self._listeners.append(callback)
 
     def load_all_pending(self):
         """시작 시 'done'이 아닌 모든 거래를 로드하여 캐시를 채웁니다."""
         print("Firestore에서 모든 미완료 거래를 로드하여 캐시를 초기화합니다...")
+        started_at = time.time()
         pending_trades = self.db.get_all_pending_trades()
-        for trade in pending_trades:
-            buy_uuid = trade.get('buy_uuid')
-            if buy_uuid:
-                self._cache[buy_uuid] = trade
+        with self._lock:
+            if self.snapshot is not None:
+                self.snapshot.reset()
+            self._apply_loaded(pending_trades + self._journal_trades())
+            self._watermark = max(self._watermark, started_at)
         print(f"{len(self._cache)}개의 미완료 거래가 캐시되었습니다.")
+        self.save_snapshot()
+
+    def warm_start(self, overlap_sec: float = 60.0) -> bool:
+        """
+        로컬 스냅샷으로 캐시를 채운 뒤 워터마크 이후 변경된 거래만 Firestore에서 가져옵니다.
+        스냅샷이 없거나 변경분 조회에 실패하면 False를 반환하며, 호출부는 load_all_pending으로 대체해야 합니다.
+        :param overlap_sec: 시계 오차/지연 반영을 고려해 워터마크보다 앞당겨 조회할 시간(초)
+        """
+        if self.snapshot is None:
+            return False
+        trades, watermark = self.snapshot.load()
+        if watermark is None:
+            print("로컬 스냅샷이 없어 전체 재로딩이 필요합니다.")
+            return False
+        started_at = time.time()
+        changed = self.db.get_trades_updated_since(watermark - overlap_sec)
+        if changed is None:
+            print("Firestore 변경분 조회에 실패하여 전체 재로딩이 필요합니다.")
+            return False
+        with self._lock:
+            self._apply_loaded(trades + changed + self._journal_trades())
+            self._watermark = max(self._watermark, watermark, started_at - overlap_sec)
+        print(f"로컬 스냅샷 {len(trades)}건과 Firestore 변경분 {len(changed)}건으로 "
+              f"{len(self._cache)}개의 미완료 거래를 캐시했습니다.")
+        self.save_snapshot()
+        return True
+
+    def load_market(self, market: str):
+        """분할 실행에서 lease를 얻은 마켓의 미완료 거래만 Firestore에서 로드해 캐시에 더합니다."""
+        trades = self.db.get_pending_trades_by_market(market)
+        journal = [t for t in self._journal_trades() if t.get('market') == market]
+        with self._lock:
+            self._apply_loaded(trades + journal)
+            loaded = len(self._sorted_keys(market))
+        print(f"[{market}] {loaded}개의 미완료 거래가 캐시되었습니다.")
+
+    def drop_market(self, market: str):
+        """
+        분할 실행에서 lease를 놓거나 잃은 마켓의 거래를 캐시에서 내립니다 (저장소의 거래는 그대로입니다).
+        write-behind 모드면 다음 워커가 최신 값을 읽도록 대기 중인 쓰기를 먼저 반영합니다.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+        with self._lock:
+            buy_uuids = [buy_uuid for states in self._index.get(market, {}).values() for _, buy_uuid in states]
+            for buy_uuid in buy_uuids:
+                self._remove(buy_uuid)
+        print(f"[{market}] {len(buy_uuids)}개의 거래를 캐시에서 내렸습니다.")
+
+    def _apply_loaded(self, trades: list[dict]):
+        """시작 시 로드한 거래를 순서대로 캐시에 반영합니다. 'waiting'이 아닌 거래는 캐시에서 제외합니다."""
+        for trade in trades:
+            buy_uuid = trade.get('buy_uuid')
+            if not buy_uuid:
+                continue
+            if trade.get('state') != 'waiting':
+                self._remove(buy_uuid)
+            else:
+                self._put(buy_uuid, trade)
+            updated_at = trade.get('updated_at')
+            if isinstance(updated_at, (int, float)):
+                self._watermark = max(self._watermark, float(updated_at))
+
+    def _journal_trades(self) -> list[dict]:
+        """저널에서 복구되어 아직 Firestore에 반영되지 않은 최신 값 (로드 결과 위에 덮어씀)"""
+        if self.writer is None:
+            return []
+        return self.writer.pending_trades()
+
+    def save_snapshot(self):
+        """마지막 저장 이후 변경된 미완료 거래와 워터마크를 로컬 스냅샷에 기록합니다."""
+        if self.snapshot is None:
+            return
+        with self._lock:
+            # 종료된 거래는 캐시에서 내보낼 때 _removed에 들어가므로, 남은 변경분은 모두 미완료 거래입니다.
+            # 저장 중 호출부가 거래를 수정하지 않도록 dict 복사본을 넘깁니다.
+            changed = [self._cache[u].to_dict() for u in self._dirty]
+            removed = list(self._removed)
+            watermark = self._watermark
+            self._dirty.clear()
+            self._removed.clear()
+        try:
+            self.snapshot.save(changed, removed, watermark)
+        except Exception as e:
+            print(f"로컬 스냅샷 저장 오류: {e}")
+            with self._lock:
+                self._dirty.update(t['buy_uuid'] for t in changed if t['buy_uuid'] in self._cache)
+                self._removed.update(removed)
 
     def upsert_trade(self, data: dict):
         """캐시와 Firestore에 모두 데이터를 업데이트/삽입합니다."""
         buy_uuid = data.get('buy_uuid')
         if not buy_uuid:
             return False
+
+        # 변경분 동기화를 위해 마지막 수정 시각을 기록합니다.
+        data['updated_at'] = time.time()
         
-        # 1. 로컬 캐시 업데이트
-        self._cache[buy_uuid] = data
+        # 1. 로컬 캐시 및 인덱스 업데이트
+        with self._lock:
+            prev = self._index_keys.get(buy_uuid)
+            record = self._put(buy_uuid, data)
+            self._watermark = max(self._watermark, record.updated_at)
+            stored = record.to_dict()
+            archive_full = self._evict_if_terminal(buy_uuid, record, stored)
+        if archive_full:
+            self.flush_archive()
+        prev_state = prev[1] if prev else None
+        for callback in self._listeners:
+            callback(prev_state, record)
         
-        # 2. Firestore에 업데이트 (write-through)
-        return self.db.upsert_trade(data)
+        # 2. Firestore에 업데이트 (write-behind 모드면 저널 기록 후 배치 반영, 아니면 write-through)
+        if self.writer is not None:
+            return self.writer.submit(stored)
+        return self.db.upsert_trade(stored)
 
-    def get_waiting_trades_by_market(self, market: str) -> list[dict]:
-        """캐시에서 특정 market의 'waiting' 상태인 모든 거래를 조회합니다."""
-        results = []
-        for trade in self._cache.values():
-            if trade.get('market') == market and trade.get('state') == 'waiting':
-                results.append(trade)
+    def upsert_trades(self, items: list[dict]):
+        """여러 거래를 캐시에 한 번에 반영하고, 저장소에는 배치 한 번으로 씁니다."""
+        items = [data for data in items if data.get('buy_uuid')]
+        if not items:
+            return True
+        now = time.time()
+        changes = []
+        with self._lock:
+            for data in items:
+                data['updated_at'] = now
+                prev = self._index_keys.get(data['buy_uuid'])
+                changes.append((prev[1] if prev else None, self._put(data['buy_uuid'], data)))
+            self._watermark = max(self._watermark, now)
+            stored = [record.to_dict() for _, record in changes]
+            archive_full = False
+            for (_, record), stored_data in zip(changes, stored):
+                archive_full = self._evict_if_terminal(record.buy_uuid, record, stored_data) or archive_full
+        if archive_full:
+            self.flush_archive()
+        for prev_state, record in changes:
+            for callback in self._listeners:
+                callback(prev_state, record)
+
+        if self.writer is not None:
+            return self.writer.submit_many(stored)
+        return self.db.upsert_trades_batch(stored)
+
+    def _put(self, buy_uuid: str, data) -> TradeRecord:
+        """캐시에 거래를 저장하고 인덱스를 갱신합니다. dict는 TradeRecord로 바꿔 저장합니다."""
+        record = data if isinstance(data, TradeRecord) else TradeRecord.from_dict(data)
+        self._unindex(buy_uuid)
+        self._cache[buy_uuid] = record
+        self._index_trade(buy_uuid, record)
+        self._dirty.add(buy_uuid)
+        self._removed.discard(buy_uuid)
+        return record
+
+    def _evict_if_terminal(self, buy_uuid: str, record: TradeRecord, stored: dict) -> bool:
+        """
+        종료된 거래를 캐시/인덱스에서 내보내고 보관소 버퍼에 넘깁니다 (스냅샷에서도 지워집니다).
+        캐시 잠금 안에서 불리므로 파일 쓰기는 하지 않고, 보관소 버퍼가 찼으면 True를 반환합니다.
+        """
+        if record.state_code == STATE_WAITING:
+            return False
+        self._remove(buy_uuid)
+        if self.archive is not None:
+            return self.archive.add(stored)
+        return False
+
+    def flush_archive(self):
+        """보관소 버퍼를 파일에 씁니다. 캐시 잠금 밖에서 호출해야 합니다."""
+        if self.archive is not None:
+            self.archive.flush()
+
+    def _remove(self, buy_uuid: str):
+        """캐시와 인덱스에서 거래를 제거합니다."""
+        self._unindex(buy_uuid)
+        if self._cache.pop(buy_uuid, None) is not None:
+            self._removed.add(buy_uuid)
+        self._dirty.discard(buy_uuid)
+
+    @staticmethod
+    def _sort_key(buy_uuid: str, trade: TradeRecord) -> tuple[float, str]:
+        sell_price = trade.sell_price
+        if not isinstance(sell_price, (int, float)):
+            sell_price = float('inf')
+        return (float(sell_price), buy_uuid)
+
+    def _index_trade(self, buy_uuid: str, trade: TradeRecord):
+        market = trade.market
+        state = trade.state
+        key = self._sort_key(buy_uuid, trade)
+        sell_uuid = trade.get('sell_uuid')
+        bisect.insort(self._index.setdefault(market, {}).setdefault(state, []), key)
+        self._index_keys[buy_uuid] = (market, state, key, sell_uuid)
+        if sell_uuid:
+            self._sell_index[sell_uuid] = buy_uuid
+        self._state_counts[state] = self._state_counts.get(state, 0) + 1
+
+    def _unindex(self, buy_uuid: str):
+        # 호출부가 거래를 직접 수정한 뒤 upsert하므로, 등록 당시의 키로 제거합니다.
+        entry = self._index_keys.pop(buy_uuid, None)
+        if entry is None:
+            return
+        market, state, key, sell_uuid = entry
+        if sell_uuid and self._sell_index.get(sell_uuid) == buy_uuid:
+            del self._sell_index[sell_uuid]
+        keys = self._index[market][state]
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+        self._state_counts[state] -= 1
+
+    def _sorted_keys(self, market: str, state: str = 'waiting') -> list[tuple[float, str]]:
+        return self._index.get(market, {}).get(state, [])
+
+    def get_trade_by_sell_uuid(self, sell_uuid: str) -> TradeRecord | None:
+        """캐시에서 sell_uuid로 거래를 조회합니다."""
+        _Q_SELL.inc()
+        with self._lock:
+            buy_uuid = self._sell_index.get(sell_uuid)
+            trade = self._cache.get(buy_uuid) if buy_uuid else None
+        (_HIT if trade is not None else _MISS).inc()
+        return trade
+
+    def get_waiting_trades_by_market(self, market: str) -> list[TradeRecord]:
+        """캐시에서 특정 market의 'waiting' 상태인 모든 거래를 sell_price 오름차순으로 조회합니다."""
+        with self._lock:
+            results = [self._cache[buy_uuid] for _, buy_uuid in self._sorted_keys(market)]
+        _Q_WAITING.inc()
+        _S_WAITING.inc(len(results))
         return results
     
-    def get_waiting_loss_trades_by_market(self, market: str) -> list[dict]:
-        """캐시에서 특정 market의 'waiting' 상태인 모든 거래를 조회합니다."""
+    def get_waiting_loss_trades_by_market(self, market: str) -> list[TradeRecord]:
+        """캐시에서 특정 market의 'waiting' 상태이면서 매도가가 매수가보다 낮은 거래를 조회합니다."""
         results = []
-        for trade in self._cache.values():
-            if trade.get('market') == market and trade.get('state') == 'waiting' and trade.get('buy_price') > trade.get('sell_price'):
-                results.append(trade)
+        with self._lock:
+            for _, buy_uuid in self._sorted_keys(market):
+                trade = self._cache[buy_uuid]
+                if trade.buy_price > trade.sell_price:
+                    results.append(trade)
+            scanned = len(self._sorted_keys(market))
+        _Q_LOSS.inc()
+        _S_LOSS.inc(scanned)
         return results
 
-    def get_min_price_waiting_trade(self, market: str) -> dict | None:
-        """캐시에서 특정 market의 'waiting' 상태인 거래 중 가장 낮은 매수가를 가진 거래를 조회합니다."""
-        waiting_trades = self.get_waiting_trades_by_market(market)
-        if not waiting_trades:
-            return None
-        
-        # buy_price가 가장 낮은 항목 찾기
-        min_price_trade = min(waiting_trades, key=lambda t: t.get('sell_price', float('inf')))
-        return min_price_trade
+    def get_min_price_waiting_trade(self, market: str) -> TradeRecord | None:
+        """캐시에서 특정 market의 'waiting' 상태인 거래 중 가장 낮은 매도가를 가진 거래를 조회합니다."""
+        _Q_MIN.inc()
+        with self._lock:
+            keys = self._sorted_keys(market)
+            if not keys:
+                return None
+            return self._cache[keys[0][1]]
     
+    def get_all_waiting_trades(self) -> list[TradeRecord]:
+        """캐시에 있는 모든 마켓의 'waiting' 상태 거래를 조회합니다."""
+        with self._lock:
+            return [
+                self._cache[buy_uuid]
+                for states in self._index.values()
+                for _, buy_uuid in states.get('waiting', [])
+            ]
+
     def get_waiting_trade_count_all_market(self) -> int:
-        results = []
-        for trade in self._cache.values():
-            if trade.get('state') == 'waiting':
-                results.append(trade)
-        return len(results)
+        """전체 'waiting' 거래 수. 분할 실행이면 다른 워커들이 올린 대기 수를 더합니다."""
+        _Q_COUNT_ALL.inc()
+        with self._lock:
+            return self._state_counts.get('waiting', 0) + self._remote_waiting
+
+    def get_local_waiting_count(self) -> int:
+        """이 캐시에 있는 'waiting' 거래 수"""
+        with self._lock:
+            return self._state_counts.get('waiting', 0)
+
+    def set_remote_waiting_count(self, count: int):
+        with self._lock:
+            self._remote_waiting = count
 
     def get_waiting_trades_count_by_market(self, market: str) -> int:
         """캐시에서 특정 market의 'waiting' 상태인 거래의 개수를 조회합니다."""
-        waiting_trades = self.get_waiting_trades_by_market(market)
-        return len(waiting_trades)
+        _Q_COUNT.inc()
+        with self._lock:
+            return len(self._sorted_keys(market))
 
-    def get_max_price_waiting_trade(self, market: str) -> dict | None:
+    def get_max_price_waiting_trade(self, market: str) -> TradeRecord | None:
         """캐시에서 특정 market의 'waiting' 상태인 거래 중 가장 높은 매도가를 가진 거래를 조회합니다."""
-        waiting_trades = self.get_waiting_trades_by_market(market)
-        if not waiting_trades:
-            return None
-        
-        # sell_price가 가장 높은 항목 찾기
-        max_price_trade = max(waiting_trades, key=lambda t: t.get('sell_price', 0))
-        return max_price_trade
+        _Q_MAX.inc()
+        with self._lock:
+            keys = self._sorted_keys(market)
+            if not keys:
+                return None
+            return self._cache[keys[-1][1]]
+
+def _firestore_sdk():
+    """firebase_admin/google-cloud-firestore는 import가 무거우므로 FirestoreTradeDB를 만들 때만 불러옵니다."""
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        from google.cloud.firestore_v1.base_query import FieldFilter
+    except ImportError as e:
+        raise RuntimeError("firebase-admin 모듈이 필요합니다. requirements.txt로 설치해 주세요.") from e
+    return firebase_admin, credentials, firestore, FieldFilter
+
 
 class FirestoreTradeDB:
     
@@ -89,6 +384,9 @@ class FirestoreTradeDB:
         :param credential_path: 다운로드한 서비스 계정 JSON 키 파일 경로
         :param collection_name: 사용할 Firestore 컬렉션 이름 (예: 'trades')
         """
+        firebase_admin, credentials, firestore, FieldFilter = _firestore_sdk()
+        self._firestore = firestore
+        self._field_filter = FieldFilter
         try:
             if not firebase_admin._apps:
                 cred = credentials.Certificate(credential_path)
@@ -97,6 +395,9 @@ class FirestoreTradeDB:
             
             self.db = firestore.client()
             self.trades_ref = self.db.collection(collection_name)
+            # 분할 실행용 마켓 lease / 워커 상태 문서
+            self.leases_ref = self.db.collection(f"{collection_name}_leases")
+            self.workers_ref = self.db.collection(f"{collection_name}_workers")
             print(f"Firestore 컬렉션 '{collection_name}'에 연결되었습니다.")
             
         except FileNotFoundError:
@@ -106,6 +407,7 @@ class FirestoreTradeDB:
             print(f"Firebase 초기화 오류: {e}")
             raise
 
+    @timed(FIRESTORE_WRITE_SECONDS, op="upsert_trade")
     def upsert_trade(self, data: dict):
         """
         데이터를 삽입(INSERT) 또는 업데이트(UPDATE)합니다.
@@ -120,13 +422,37 @@ class FirestoreTradeDB:
             self.trades_ref.document(doc_id).set(data, merge=True)
             return True
         except Exception as e:
+            FIRESTORE_WRITE_ERRORS.labels("upsert_trade").inc()
             print(f"Firestore Upsert 오류 ({data.get('buy_uuid')}): {e}")
             return False
 
+    @timed(FIRESTORE_WRITE_SECONDS, op="upsert_trades_batch")
+    def upsert_trades_batch(self, items: list[dict], batch_size: int = 500) -> bool:
+        """
+        여러 거래를 Firestore 배치 쓰기로 삽입/업데이트합니다.
+        Firestore 배치 하나에는 최대 500개의 쓰기만 담을 수 있으므로 나누어 커밋합니다.
+        :param items: 'buy_uuid'가 포함된 거래 딕셔너리 목록
+        """
+        try:
+            for start in range(0, len(items), batch_size):
+                batch = self.db.batch()
+                for data in items[start:start + batch_size]:
+                    doc_id = data.get('buy_uuid')
+                    if not doc_id:
+                        print("오류: 'buy_uuid'가 없는 거래는 배치에서 제외합니다.")
+                        continue
+                    batch.set(self.trades_ref.document(doc_id), data, merge=True)
+                batch.commit()
+            return True
+        except Exception as e:
+            FIRESTORE_WRITE_ERRORS.labels("upsert_trades_batch").inc()
+            print(f"Firestore 배치 Upsert 오류 ({len(items)}건): {e}")
+            return False
+
     def get_all_pending_trades(self) -> list[dict]:
         """'done' 상태가 아닌 모든 거래 내역을 리스트로 반환합니다."""
         try:
-            query = self.trades_ref.where(filter=FieldFilter('state', '!=', 'done'))
+            query = self.trades_ref.where(filter=self._field_filter('state', '!=', 'done'))
             results = query.stream()
             return [doc.to_dict() for doc in results]
         except Exception as e:
@@ -134,6 +460,90 @@ class FirestoreTradeDB:
             print("[알림] 이 쿼리는 Firestore 색인이 필요할 수 있습니다. 오류 메시지의 URL을 확인하세요.")
             return []
 
+    def get_trades_updated_since(self, updated_at: float) -> list[dict] | None:
+        """'updated_at'이 주어진 시각 이후인 모든 거래(완료 포함)를 반환합니다. 실패 시 None."""
+        try:
+            query = self.trades_ref.where(filter=self._field_filter('updated_at', '>', updated_at))
+            return [doc.to_dict() for doc in query.stream()]
+        except Exception as e:
+            print(f"Firestore '변경분 조회' 오류: {e}")
+            return None
+
+    def get_pending_trades_by_market(self, market: str) -> list[dict]:
+        """특정 market의 'waiting' 거래를 반환합니다 (분할 실행에서 맡은 마켓만 캐시에 로드할 때 사용)."""
+        try:
+            query = (
+                self.trades_ref
+                .where(filter=self._field_filter('market', '==', market))
+                .where(filter=self._field_filter('state', '==', 'waiting'))
+            )
+            return [doc.to_dict() for doc in query.stream()]
+        except Exception as e:
+            print(f"Firestore '마켓별 미완료 목록 조회' 오류 ({market}): {e}")
+            return []
+
+    def try_acquire_lease(self, market: str, worker_id: str, ttl_sec: float, now: float) -> bool:
+        """
+        트랜잭션으로 market lease를 얻거나 연장합니다. 다른 워커가 만료 전 lease를 갖고 있으면 False.
+        """
+        ref = self.leases_ref.document(market)
+
+        @self._firestore.transactional
+        def _claim(transaction):
+            snapshot = ref.get(transaction=transaction)
+            lease = claim_lease(snapshot.to_dict() if snapshot.exists else None, market, worker_id, ttl_sec, now)
+            if lease is None:
+                return False
+            transaction.set(ref, lease)
+            return True
+
+        try:
+            return _claim(self.db.transaction())
+        except Exception as e:
+            print(f"Firestore lease 획득 오류 ({market}): {e}")
+            return False
+
+    def release_lease(self, market: str, worker_id: str) -> bool:
+        """자기 lease면 만료 처리해 다른 워커가 바로 가져갈 수 있게 합니다."""
+        ref = self.leases_ref.document(market)
+
+        @self._firestore.transactional
+        def _release(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get('owner') != worker_id:
+                return False
+            transaction.update(ref, {'owner': None, 'expires_at': 0})
+            return True
+
+        try:
+            return _release(self.db.transaction())
+        except Exception as e:
+            print(f"Firestore lease 반납 오류 ({market}): {e}")
+            return False
+
+    def get_leases(self) -> list[dict]:
+        try:
+            return [doc.to_dict() for doc in self.leases_ref.stream()]
+        except Exception as e:
+            print(f"Firestore lease 목록 조회 오류: {e}")
+            return []
+
+    def publish_worker(self, worker_id: str, status: dict) -> bool:
+        """워커 상태(heartbeat 만료 시각, 대기 거래 수, 맡은 마켓)를 기록합니다."""
+        try:
+            self.workers_ref.document(worker_id).set(status)
+            return True
+        except Exception as e:
+            print(f"Firestore 워커 상태 기록 오류 ({worker_id}): {e}")
+            return False
+
+    def get_workers(self) -> list[dict]:
+        try:
+            return [doc.to_dict() for doc in self.workers_ref.stream()]
+        except Exception as e:
+            print(f"Firestore 워커 목록 조회 오류: {e}")
+            return []
+
     def get_waiting_trades_by_market(self, market: str) -> list[dict]:
         """
         [캐시로 대체됨] 특정 market의 'state'가 'waiting'인 모든 거래 내역을 리스트로 반환합니다.
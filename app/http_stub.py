@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+로컬 Upbit REST 대역 서버
+- SimExchange를 Upbit REST 엔드포인트(/v1/ticker, /v1/accounts, /v1/order(s), /v1/orders/open, /v1/orders/cancel_and_new)로 노출합니다.
+- HTTP/1.1 keep-alive를 지원하므로 내장 클라이언트의 커넥션 재사용을 확인할 수 있습니다 (connections 카운터).
+- secret_key를 주면 Authorization JWT 서명과 query_hash를 실제 서버처럼 검사합니다.
+- fail_next(429)로 속도 제한 응답을 주입할 수 있습니다.
+
+예)
+  python -m app.http_stub --port 18080
+  python -m app.main --market KRW-BTC --krw 5000 --upbit-url http://127.0.0.1:18080
+"""
+import argparse
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from .sim_exchange import PriceProcess, SimExchange
+from .upbit_auth import build_query_string, query_hash, verify_token
+
+log = logging.getLogger("trade")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub: "StubUpbitHttpServer"
+
+    def setup(self):
+        super().setup()
+        self.stub._count_connection()
+
+    def log_message(self, format, *args):
+        return
+
+    def _reply(self, status: int, body: Any, remaining: str = ""):
+        raw = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        if remaining:
+            self.send_header("Remaining-Req", remaining)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _handle(self, method: str):
+        parts = urlsplit(self.path)
+        params: Dict[str, Any] = dict(parse_qsl(parts.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            params.update(json.loads(self.rfile.read(length)))
+        status, body, group = self.stub.dispatch(method, parts.path, params, self.headers.get("Authorization", ""))
+        self._reply(status, body, self.stub.remaining_header(group))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def _stringify(order: Dict[str, Any]) -> Dict[str, Any]:
+    """실제 API처럼 숫자 필드를 문자열로 보냅니다."""
+    return {k: (str(v) if isinstance(v, float) else v) for k, v in order.items()}
+
+
+class StubUpbitHttpServer:
+    """SimExchange를 감싼 Upbit REST 대역 서버 (데몬 스레드)"""
+
+    def __init__(
+        self,
+        sim: Optional[SimExchange] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        access_key: str = "",
+        secret_key: str = "",
+    ):
+        self.sim = sim if sim is not None else SimExchange(process=PriceProcess())
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.connections = 0
+        self.requests = 0
+        self._failures: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+        handler = type("StubHandler", (_StubHandler,), {"stub": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubUpbitHttpServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="upbit-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, status: int = 429, name: str = "too_many_requests", count: int = 1):
+        """다음 count개의 요청에 오류 응답을 돌려줍니다."""
+        with self._lock:
+            self._failures.extend([(status, name)] * count)
+
+    def _count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    @staticmethod
+    def remaining_header(group: str) -> str:
+        return f"group={group}; min=1800; sec=29" if group else ""
+
+    def _check_auth(self, authorization: str, params: Dict[str, Any]) -> Optional[str]:
+        if not self.secret_key:
+            return None
+        if not authorization.startswith("Bearer "):
+            return "jwt_verification"
+        payload = verify_token(authorization[len("Bearer "):], self.secret_key)
+        if payload is None or payload.get("access_key") != self.access_key:
+            return "jwt_verification"
+        if params and payload.get("query_hash") != query_hash(build_query_string(params)):
+            return "invalid_query_payload"
+        return None
+
+    def dispatch(self, method: str, path: str, params: Dict[str, Any], authorization: str) -> Tuple[int, Any, str]:
+        """(HTTP 상태, 응답 본문, Remaining-Req 그룹)을 반환합니다."""
+        with self._lock:
+            self.requests += 1
+            failure = self._failures.pop(0) if self._failures else None
+            if failure is not None:
+                status, name = failure
+                return status, {"error": {"name": name, "message": "stub"}}, ""
+            if path == "/v1/ticker" and method == "GET":
+                markets = params.get("markets", "").split(",")
+                prices = self.sim.get_current_prices(markets)
+                return 200, [{"market": m, "trade_price": p} for m, p in prices.items()], "ticker"
+
+            error = self._check_auth(authorization, params)
+            if error is not None:
+                return 401, {"error": {"name": error, "message": "인증 실패"}}, ""
+            group = "order" if method in ("POST", "DELETE") else "default"
+            try:
+                result = self._route(method, path, params)
+            except Exception as e:
+                return 400, {"error": {"name": "order_not_found", "message": str(e)}}, group
+            if isinstance(result, dict) and "error" in result:
+                return 400, result, group
+            return 200, result, group
+
+    def _route(self, method: str, path: str, params: Dict[str, Any]) -> Any:
+        sim = self.sim
+        if path == "/v1/accounts":
+            accounts = [{"currency": "KRW", "balance": str(sim.krw), "locked": "0", "unit_currency": "KRW"}]
+            for market, volume in sim.assets.items():
+                accounts.append({"currency": market.split("-", 1)[1], "balance": str(volume), "locked": "0", "unit_currency": "KRW"})
+            return accounts
+        if path == "/v1/order" and method == "GET":
+            order = sim.get_order(params["uuid"])
+            if not order:
+                raise KeyError(f"주문을 찾지 못했습니다: {params['uuid']}")
+            return _stringify(order)
+        if path == "/v1/order" and method == "DELETE":
+            return _stringify(sim.cancel_order(params["uuid"]))
+        if path == "/v1/orders/open":
+            limit = int(params.get("limit", 100))
+            page = int(params.get("page", 1))
+            orders = sim.get_open_orders(params["market"], limit)
+            return [_stringify(o) for o in orders[(page - 1) * limit:page * limit]]
+        if path == "/v1/orders/cancel_and_new" and method == "POST":
+            volume = params.get("new_volume")
+            result = sim.cancel_and_new(
+                params["prev_order_uuid"],
+                None,
+                None if volume == "remain_only" else float(volume),
+                float(params["new_price"]),
+            )
+            return result if "error" in result else _stringify(result)
+        if path == "/v1/orders" and method == "POST":
+            market = params["market"]
+            if params.get("side") == "bid" and params.get("ord_type") == "price":
+                result = sim.buy_market(market, float(params["price"]))
+            elif params.get("side") == "ask" and params.get("ord_type") == "limit":
+                result = sim.sell_limit(market, float(params["volume"]), float(params["price"]))
+            else:
+                return {"error": {"name": "invalid_parameter_error", "message": "지원하지 않는 주문 유형입니다."}}
+            return result if "error" in result else _stringify(result)
+        return {"error": {"name": "not_found", "message": f"{method} {path}"}}
+
+
+def main():
+    p = argparse.ArgumentParser(description="로컬 Upbit REST 대역 서버 (SimExchange)")
+    p.add_argument("--host", type=str, default="127.0.0.1")
+    p.add_argument("--port", type=int, default=18080)
+    p.add_argument("--access-key", type=str, default="", help="지정하면 JWT의 access_key를 검사합니다")
+    p.add_argument("--secret-key", type=str, default="", help="지정하면 JWT 서명과 query_hash를 검사합니다")
+    p.add_argument("--seed", type=int, default=0, help="가격 과정 시드")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    stub = StubUpbitHttpServer(
+        SimExchange(process=PriceProcess(seed=args.seed)),
+        host=args.host,
+        port=args.port,
+        access_key=args.access_key,
+        secret_key=args.secret_key,
+    ).start()
+    log.info(f"Upbit 대역 서버 시작: {stub.url}")
+    try:
+        stub._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
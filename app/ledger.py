@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+로컬 KRW 잔고 장부
+- 매수/매도 체결 금액(buy_amount, sell_amount)으로 잔고를 직접 차감/가산하여
+  매 사이클마다 잔고 API를 호출하지 않도록 합니다.
+- 일정 주기마다, 또는 불일치가 의심될 때 get_krw_balance로 실제 잔고와 맞춥니다.
+- 여러 마켓이 동시에 매수할 때 같은 잔고를 중복 사용하지 않도록 주문 금액을 예약합니다.
+- 거래소 잔고와 맞출 때(reconcile) 이미 거래소 잔고에 반영된 체결을 다시 더하거나 빼지 않도록,
+  맞춘 시점의 미체결 매도 주문 목록과 회차(epoch)를 함께 기록합니다.
+  * 매도: 맞춘 시점에 열려 있었거나 그 뒤에 낸 매도 주문의 체결만 가산합니다.
+    그 전에 이미 체결된 주문의 대금은 조회한 잔고에 들어 있습니다.
+  * 매수: 주문을 낸 뒤에 잔고를 맞췄다면 조회한 잔고에 차감이 들어 있으므로 예약만 해제합니다.
+- 분할 실행에서는 여러 워커가 같은 계좌를 쓰므로 budget_share로 잔고를 나눕니다.
+  잔고를 맞출 때 거래소 잔고에 이 워커의 몫(맡은 마켓 비율)을 곱해 장부로 삼아, 워커들의 장부 합이 계좌 잔고를 넘지 않게 합니다.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Iterable, Optional, Set
+
+from .upbit_client import UpbitClient
+
+log = logging.getLogger("trade")
+
+
+class BalanceLedger:
+    """KRW 잔고를 로컬에서 추적하고 매수 금액 예약을 관리합니다."""
+
+    def __init__(
+        self,
+        client: UpbitClient,
+        reconcile_interval_sec: float = 300.0,
+        drift_tolerance: float = 1.0,
+        markets: Optional[Iterable[str]] = None,
+        budget_share: Optional[Callable[[], float]] = None,
+    ):
+        """
+        :param reconcile_interval_sec: 실제 잔고와 맞추는 주기(초). 0이면 조회할 때마다 맞춥니다.
+        :param drift_tolerance: 이 금액(KRW)을 넘는 차이가 나면 경고를 남깁니다.
+        :param markets: 잔고를 맞출 때 미체결 매도 주문을 함께 조회할 마켓.
+            없으면 맞춘 시점 이전에 체결된 매도 대금이 두 번 가산될 수 있습니다.
+        :param budget_share: 계좌 잔고 중 이 장부가 쓸 비율(0~1)을 돌려주는 함수. 없으면 전부 씁니다.
+        """
+        self.client = client
+        self.reconcile_interval_sec = reconcile_interval_sec
+        self.drift_tolerance = drift_tolerance
+        self.markets = list(markets or [])
+        self.budget_share = budget_share
+        self._balance = 0.0
+        self._reserved = 0.0
+        self._synced_at: Optional[float] = None
+        # 잔고를 맞출 때마다 1씩 증가합니다.
+        self._epoch = 0
+        # 체결 대금을 가산할 매도 주문 (맞춘 시점에 열려 있던 주문 + 그 뒤에 낸 주문). None이면 모두 가산합니다.
+        self._open_sells: Optional[Set[str]] = None
+        self._lock = threading.RLock()
+
+    def reconcile(self) -> float:
+        """거래소 잔고와 미체결 매도 주문을 조회해 장부를 맞추고 잔고를 반환합니다."""
+        with self._lock:
+            actual = self.client.get_krw_balance() * self.share()
+            # 잔고를 먼저 조회합니다. 두 조회 사이에 체결된 매도는 가산하지 않게 되어 장부가 적게 잡히고,
+            # 다음 보정에서 맞춰집니다 (많게 잡혀 잔고보다 큰 매수를 내는 쪽보다 안전합니다).
+            open_sells = self._fetch_open_sells()
+            # 몫으로 나눈 장부는 다른 워커의 매매로도 달라지므로 불일치로 보지 않습니다.
+            if self.budget_share is None and self._synced_at is not None and abs(actual - self._balance) > self.drift_tolerance:
+                log.warning(f"KRW 장부 불일치 보정: 장부={self._balance:.0f}, 거래소={actual:.0f}")
+            self._balance = actual
+            self._open_sells = open_sells
+            self._epoch += 1
+            self._synced_at = time.monotonic()
+            return actual
+
+    def share(self) -> float:
+        """계좌 잔고 중 이 장부가 쓰는 비율"""
+        if self.budget_share is None:
+            return 1.0
+        return min(max(float(self.budget_share()), 0.0), 1.0)
+
+    def _fetch_open_sells(self) -> Optional[Set[str]]:
+        if not self.markets:
+            return None
+        uuids: Set[str] = set()
+        for market in self.markets:
+            try:
+                orders = self.client.get_open_orders(market)
+            except Exception as e:
+                log.warning(f"[{market}] 잔고 보정용 미체결 주문 조회 실패, 매도 대금을 모두 가산합니다: {e}")
+                return None
+            uuids.update(o.get('uuid') for o in orders if o.get('side', 'ask') == 'ask')
+        return uuids
+
+    def invalidate(self):
+        """장부를 신뢰할 수 없을 때 호출하면 다음 조회에서 거래소 잔고와 맞춥니다."""
+        with self._lock:
+            self._synced_at = None
+
+    def available(self) -> float:
+        """예약 금액을 제외한 사용 가능 KRW. 맞춘 지 오래되었으면 먼저 거래소 잔고와 맞춥니다."""
+        with self._lock:
+            if self._synced_at is None or time.monotonic() - self._synced_at >= self.reconcile_interval_sec:
+                self.reconcile()
+            return self._balance - self._reserved
+
+    def reserve(self, amount: float) -> bool:
+        """매수 주문 금액을 예약합니다. 사용 가능 금액이 부족하면 False."""
+        with self._lock:
+            if self._balance - self._reserved < amount:
+                return False
+            self._reserved += amount
+            return True
+
+    def release(self, amount: float):
+        """주문이 실패하여 예약을 취소합니다."""
+        with self._lock:
+            self._reserved = max(self._reserved - amount, 0.0)
+
+    def mark_ordered(self) -> int:
+        """
+        매수 주문 응답을 받은 직후 호출해 현재 회차를 받습니다. settle_buy에 넘기면,
+        그 뒤에 잔고를 맞춘 경우 조회한 잔고에 이미 차감이 반영된 것으로 보고 다시 빼지 않습니다.
+        진행 중인 보정이 끝날 때까지 기다리므로 주문 전에 시작된 보정은 이전 회차로 남습니다.
+        """
+        with self._lock:
+            return self._epoch
+
+    def settle_buy(self, reserved: float, buy_amount: float, ordered_epoch: Optional[int] = None):
+        """예약을 해제하고 실제 체결 금액(수수료 포함)을 차감합니다."""
+        with self._lock:
+            self._reserved = max(self._reserved - reserved, 0.0)
+            if ordered_epoch is not None and ordered_epoch != self._epoch:
+                return
+            self._balance -= buy_amount
+
+    def credit(self, amount: float):
+        """매도 체결 금액(수수료 차감 후)을 가산합니다."""
+        with self._lock:
+            self._balance += amount
+
+    def on_trade_update(self, prev_state: Optional[str], trade: dict):
+        """
+        캐시 상태 변화 리스너: 대기중이던 매도가 종료되면 체결 금액을 가산합니다.
+        대기 중인 매도 주문(새 주문, 재주문)은 기억해 두었다가 체결되면 가산합니다.
+        """
+        state = trade.get('state')
+        sell_uuid = trade.get('sell_uuid')
+        if state == 'waiting':
+            if sell_uuid:
+                with self._lock:
+                    if self._open_sells is not None:
+                        self._open_sells.add(sell_uuid)
+            return
+        if prev_state != 'waiting' or state not in {'done', 'cancel'}:
+            return
+        sell_amount = trade.get('sell_amount') or 0.0
+        with self._lock:
+            if self._open_sells is not None:
+                if sell_uuid not in self._open_sells:
+                    # 잔고를 맞추기 전에 거래소에서 이미 체결된 주문이므로 대금이 잔고에 들어 있습니다.
+                    return
+                self._open_sells.discard(sell_uuid)
+            if sell_amount > 0:
+                self._balance += sell_amount
@@ -3,7 +3,11 @@
 import argparse
 from .config import Settings
 from .trade import run_loop
-from .firestore_trade_db import FirestoreTradeDB, FirestoreCache
+from .firestore_trade_db import FirestoreCache
+from .trade_store import STORE_BACKENDS, open_trade_store
+from .write_behind import TradeJournal, WriteBehindWriter
+from .snapshot import TradeSnapshot
+from .archive import TradeArchive
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -13,6 +17,13 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument("--tp", type=float, required=True, help="매도조건: +X%% 익절 (예: 1.0 => +1%%)")
     p.add_argument("--interval", type=int, default=60, help="동작 주기(초)")
     p.add_argument("--firestore-credential", type=str, default="serviceAccountKey.json", help="Firestore 서비스 계정 키 파일 경로")
+    p.add_argument(
+        "--store",
+        choices=STORE_BACKENDS,
+        default="",
+        help="거래 저장소. 지정하지 않으면 실거래는 firestore, --dry-run은 memory",
+    )
+    p.add_argument("--store-path", type=str, default="trade_store.db", help="--store sqlite 파일 경로")
     p.add_argument("--dry-run", action="store_true", help="실거래 대신 모의 주문만 수행")
     p.add_argument("--min-krw-balance", type=float, default=5000.0, help="최소 주문 금액 (기본 5000 KRW)")
     p.add_argument(
@@ -33,19 +44,189 @@ def build_parser() -> argparse.ArgumentParser:
         default=10,
         help="매도 최대 대기 갯수"
     )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="마켓 병렬 실행 워커 수. 2 이상이면 마켓별 사이클을 동시에 실행합니다.",
+    )
+    p.add_argument(
+        "--market-delay",
+        type=float,
+        default=5.0,
+        help="순차 실행(--workers 1) 시 마켓 사이 대기 시간(초)",
+    )
+    p.add_argument(
+        "--ticker-ttl",
+        type=float,
+        default=10.0,
+        help="전체 마켓 현재가 스냅샷의 유효 시간(초). 만료되면 한 번의 요청으로 다시 조회합니다.",
+    )
+    p.add_argument(
+        "--write-behind",
+        action="store_true",
+        help="Firestore 쓰기를 로컬 저널(fsync)에 먼저 기록하고 백그라운드에서 배치로 반영",
+    )
+    p.add_argument("--journal-path", type=str, default="trade_journal.jsonl", help="write-behind 저널 파일 경로")
+    p.add_argument("--flush-size", type=int, default=100, help="대기 건수가 이 값 이상이면 즉시 배치 반영")
+    p.add_argument("--flush-interval", type=float, default=1.0, help="write-behind 배치 반영 주기(초)")
+    p.add_argument(
+        "--snapshot-path",
+        type=str,
+        default="trade_snapshot.db",
+        help="캐시 로컬 스냅샷(SQLite) 경로. 시작 시 스냅샷과 변경분만 로드합니다. 빈 값이면 사용 안 함",
+    )
+    p.add_argument("--full-reload", action="store_true", help="시작 시 스냅샷을 무시하고 Firestore에서 전체 재로딩")
+    p.add_argument(
+        "--websocket",
+        action="store_true",
+        help="WebSocket ticker/myOrder 스트림으로 매수 체결을 즉시 확인하고 매도 체결을 바로 반영",
+    )
+    p.add_argument("--ws-url", type=str, default="wss://api.upbit.com/websocket/v1", help="공개(ticker) WebSocket 주소")
+    p.add_argument(
+        "--ws-private-url",
+        type=str,
+        default="wss://api.upbit.com/websocket/v1/private",
+        help="개인(myOrder) WebSocket 주소. 오프라인 테스트 시 app.ws_stub 서버 주소를 지정",
+    )
+    p.add_argument(
+        "--balance-reconcile",
+        type=float,
+        default=300.0,
+        help="로컬 KRW 장부를 get_balances로 실제 잔고와 맞추는 주기(초). 0이면 매번 조회",
+    )
+    p.add_argument(
+        "--tier-table",
+        type=str,
+        default="",
+        help="자동 거래 금액 모드(--krw 0)의 구간 테이블 JSON 파일. 없으면 기본 테이블 사용",
+    )
+    p.add_argument("--sim-seed", type=int, default=0, help="드라이런 모의 거래소 가격 과정 시드 (같은 시드면 같은 가격열)")
+    p.add_argument("--sim-start-price", type=float, default=100_000.0, help="드라이런 시작 가격")
+    p.add_argument("--sim-volatility", type=float, default=0.001, help="드라이런 가격 조회 한 번당 변동성 (0.001 == 0.1%%)")
+    p.add_argument(
+        "--sim-liquidity",
+        type=float,
+        default=1_000_000.0,
+        help="드라이런 가격 조회 한 번당 평균 체결 가능 거래대금(KRW). 매도 주문이 이 범위에서 부분 체결됩니다. 0이면 전량 체결",
+    )
+    p.add_argument("--sim-step", type=float, default=1.0, help="드라이런 가격 한 단계가 나타내는 시간(초)")
+    p.add_argument("--sim-krw", type=float, default=1_000_000.0, help="드라이런 시작 KRW 잔고")
+    p.add_argument("--sim-fee", type=float, default=0.0005, help="드라이런 거래 수수료율")
+    p.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="지정하면 127.0.0.1:<포트>/metrics 에서 Prometheus 형식 지표를 제공합니다 (0이면 사용 안 함)",
+    )
+    p.add_argument(
+        "--http-backend",
+        choices=["native", "pyupbit"],
+        default="native",
+        help="REST 호출 방식. native는 keep-alive 커넥션을 재사용하는 내장 클라이언트, pyupbit는 기존 라이브러리 호출",
+    )
+    p.add_argument("--upbit-url", type=str, default="https://api.upbit.com", help="Upbit REST API 주소 (로컬 대역 서버: http://127.0.0.1:<포트>)")
+    p.add_argument(
+        "--no-event-trigger",
+        action="store_true",
+        help="가격이 판단 경계를 넘었는지와 관계없이 매 주기 모든 마켓의 사이클을 실행",
+    )
+    p.add_argument(
+        "--heartbeat",
+        type=float,
+        default=300.0,
+        help="경계를 넘지 않은 마켓도 이 간격(초)마다 한 번은 사이클을 실행합니다",
+    )
+    p.add_argument(
+        "--archive-dir",
+        type=str,
+        default="trade_archive",
+        help="체결/취소로 캐시에서 내보낸 거래를 마켓/날짜별 압축 JSONL로 보관할 디렉터리. 빈 값이면 보관 안 함",
+    )
+    p.add_argument("--archive-compression", choices=["gzip", "zstd"], default="gzip", help="보관 파일 압축 방식 (zstd는 zstandard 모듈 필요)")
+    p.add_argument(
+        "--pnl-checkpoint",
+        type=str,
+        default="pnl_checkpoint.json",
+        help="실현 손익/체결률 누계 체크포인트 파일. 시작 시 이 파일과 보관소로 누계를 복원합니다. 빈 값이면 저장 안 함",
+    )
+    p.add_argument("--pnl-checkpoint-interval", type=float, default=60.0, help="손익 체크포인트 저장 주기(초)")
+    p.add_argument(
+        "--shard",
+        action="store_true",
+        help="여러 워커 프로세스가 거래 저장소의 lease로 --market 목록을 나눠 맡습니다. 모든 워커에 같은 --market을 지정하세요",
+    )
+    p.add_argument("--worker-id", type=str, default="", help="분할 실행 워커 ID (기본: 호스트명-PID)")
+    p.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=30.0,
+        help="마켓 lease 만료 시간(초). 워커가 멈추면 이 시간 뒤 다른 워커가 마켓을 가져갑니다",
+    )
+    p.add_argument(
+        "--event-journal",
+        type=str,
+        default="events.jsonl",
+        help="주문/체결/주문 변경/매수 스킵 판단을 기록할 구조화 이벤트 저널(JSONL). 빈 값이면 기록 안 함",
+    )
+    p.add_argument("--event-journal-max-mb", type=float, default=64.0, help="이벤트 저널 회전 크기(MB)")
+    p.add_argument("--event-journal-backups", type=int, default=5, help="보관할 회전 저널 파일 수")
+    p.add_argument(
+        "--event-debug-sample",
+        type=float,
+        default=0.01,
+        help="디버그 이벤트(주문 상태 확인 등) 표본 비율. 1이면 모두 기록, 0이면 기록 안 함",
+    )
+    p.add_argument(
+        "--market-data",
+        type=str,
+        default="",
+        help="사이클마다 조회한 현재가를 분봉/틱 링 버퍼로 기록할 공유 시세 파일 (app.market_data). "
+        "이미 다른 프로세스가 기록 중이면 건너뜁니다. 빈 값이면 기록 안 함",
+    )
     return p
 
 
 def main():
     args = build_parser().parse_args()
     cfg = Settings.from_env_and_args(args)
-    db = FirestoreTradeDB(credential_path=cfg.firestore_credential_path)
+    db = open_trade_store(cfg.trade_store, credential_path=cfg.firestore_credential_path, path=cfg.trade_store_path)
+
+    writer = None
+    if cfg.write_behind:
+        writer = WriteBehindWriter(
+            db,
+            TradeJournal(cfg.journal_path),
+            flush_size=cfg.flush_size,
+            flush_interval_sec=cfg.flush_interval_sec,
+        )
+        writer.start()
     
-    # 캐시 초기화
-    cache = FirestoreCache(db)
-    cache.load_all_pending()
+    # 분할 실행에서는 맡을 마켓이 실행마다 달라지므로 스냅샷 대신 lease를 얻은 마켓만 그때 로드합니다.
+    # 메모리 저장소는 재시작하면 비어 있으므로 스냅샷을 쓰지 않습니다.
+    use_snapshot = cfg.snapshot_path and not cfg.shard and cfg.trade_store != "memory"
+    snapshot = TradeSnapshot(cfg.snapshot_path) if use_snapshot else None
+    archive = (
+        TradeArchive(cfg.archive_dir, compression=cfg.archive_compression, timezone=cfg.timezone)
+        if cfg.archive_dir else None
+    )
+
+    # 캐시 초기화: 로컬 스냅샷 + 변경분 동기화, 불가능하면 전체 재로딩
+    cache = FirestoreCache(db, writer=writer, snapshot=snapshot, archive=archive)
+    if not cfg.shard and (cfg.full_reload or not cache.warm_start()):
+        cache.load_all_pending()
 
-    run_loop(cfg, cache)
+    try:
+        run_loop(cfg, cache)
+    finally:
+        if writer is not None:
+            # 종료 전에 남은 거래를 Firestore에 반영합니다.
+            writer.close()
+        if snapshot is not None:
+            cache.save_snapshot()
+            snapshot.close()
+        if archive is not None:
+            archive.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+공유 메모리 맵 시세 저장소 (마켓별 고정 크기 링 버퍼)
+- 파일 하나를 mmap으로 열어 마켓마다 분봉 OHLCV 링(기본 7일)과 체결가 틱 링(기본 3600건)을 둡니다.
+- 쓰기는 수집기 하나만 합니다 (MarketDataWriter, <path>.lock 파일 잠금으로 보장).
+  읽기는 여러 프로세스가 같은 파일을 읽기 전용으로 열어 numpy 배열 뷰로 복사 없이 봅니다 (MarketDataReader).
+- 틱을 넣으면 같은 분의 봉은 제자리에서 high/low/close/volume을 갱신하고, 분이 바뀌면 새 봉을 추가합니다.
+  진행 중인 마지막 봉도 읽는 쪽에 보입니다.
+- 거래량은 ticker의 누적 거래량(acc_trade_volume, 매일 0시(KST)에 초기화)을 직전 값과의 차이로 바꿔 넣습니다.
+  수집기(collect)는 누적 거래량을 함께 받아 기록하지만, 매매 루프(--market-data)는 현재가만 알므로 그 봉의 volume은 0입니다.
+- 쓰기는 표준 라이브러리만 쓰고, 읽기(MarketDataReader)는 numpy 배열을 돌려줍니다.
+- 마켓별 seqlock 카운터(쓰는 동안 홀수)로 읽는 쪽이 쓰기 도중의 값을 감지하고 다시 읽습니다.
+  ring()이 돌려주는 뷰는 살아 있는 메모리이므로 일관된 값이 필요하면 bars()/ticks() 사본을 쓰세요.
+
+파일 구조 (리틀 엔디언)
+  헤더 64B: magic, version, max_markets, bar_capacity, tick_capacity
+  마켓 이름표: max_markets x 32B
+  마켓 슬롯(64B 정렬): 제어 블록 64B(bar_seq, bar_count, tick_seq, tick_count) + 봉 bar_capacity x 48B + 틱 tick_capacity x 24B
+  봉 = (ts, open, high, low, close, volume) float64, 틱 = (ts, price, volume) float64
+
+예)
+  python -m app.market_data collect --path market_data.bin --market KRW-BTC KRW-ETH --interval 1
+  python -m app.market_data show --path market_data.bin --market KRW-BTC --bars 5
+  python -m app.market_data export --path market_data.bin --market KRW-BTC > KRW-BTC_1m.csv
+"""
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None
+
+try:
+    import fcntl  # type: ignore
+except Exception:
+    fcntl = None
+
+import logging
+
+log = logging.getLogger("trade")
+
+MAGIC = b"CBOHLCV1"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIII")  # magic, version, max_markets, bar_capacity, tick_capacity
+_HEADER_SIZE = 64
+_NAME_SIZE = 32
+_CONTROL = struct.Struct("<QQQQ")  # bar_seq, bar_count, tick_seq, tick_count
+_CONTROL_SIZE = 64
+_BAR = struct.Struct("<6d")
+_TICK = struct.Struct("<3d")
+BAR_FIELDS = ("ts", "open", "high", "low", "close", "volume")
+TICK_FIELDS = ("ts", "price", "volume")
+
+Bar = Tuple[float, float, float, float, float, float]
+
+
+def _align(n: int, to: int = 64) -> int:
+    return (n + to - 1) // to * to
+
+
+class _Layout:
+    """헤더 값으로 각 영역의 오프셋을 계산합니다."""
+
+    def __init__(self, max_markets: int, bar_capacity: int, tick_capacity: int):
+        self.max_markets = max_markets
+        self.bar_capacity = bar_capacity
+        self.tick_capacity = tick_capacity
+        self.names_offset = _HEADER_SIZE
+        self.slots_offset = _align(_HEADER_SIZE + max_markets * _NAME_SIZE)
+        self.slot_size = _align(_CONTROL_SIZE + bar_capacity * _BAR.size + tick_capacity * _TICK.size)
+        self.size = self.slots_offset + max_markets * self.slot_size
+
+    def slot(self, index: int) -> int:
+        return self.slots_offset + index * self.slot_size
+
+    def bars(self, index: int) -> int:
+        return self.slot(index) + _CONTROL_SIZE
+
+    def ticks(self, index: int) -> int:
+        return self.bars(index) + self.bar_capacity * _BAR.size
+
+
+def _read_header(mm) -> _Layout:
+    magic, version, max_markets, bar_capacity, tick_capacity = _HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("시세 저장소 파일 형식이 아닙니다.")
+    return _Layout(max_markets, bar_capacity, tick_capacity)
+
+
+def _read_names(mm, layout: _Layout) -> Dict[str, int]:
+    names = {}
+    for i in range(layout.max_markets):
+        raw = bytes(mm[layout.names_offset + i * _NAME_SIZE:layout.names_offset + (i + 1) * _NAME_SIZE]).rstrip(b"\0")
+        if not raw:
+            break
+        names[raw.decode("utf-8")] = i
+    return names
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy 모듈이 필요합니다. requirements.txt로 설치해 주세요.")
+
+
+def realized_volatility(closes, annualize: float = 1.0) -> Optional[float]:
+    """종가 열의 로그 수익률 표준편차(%)입니다. 값이 2개 미만이면 None."""
+    _require_numpy()
+    values = np.asarray(closes, dtype=float)
+    values = values[values > 0]
+    if values.size < 3:
+        return None
+    return float(np.std(np.diff(np.log(values)), ddof=1) * 100.0 * math.sqrt(annualize))
+
+
+def volume_delta(previous: Optional[float], current: float) -> float:
+    """
+    누적 거래량 두 값 사이의 거래량. 첫 값(previous 없음)은 기준만 잡고 0,
+    누적 값이 줄었으면 그 사이 일일 초기화가 있었던 것이므로 current 전체를 씁니다.
+    """
+    if previous is None:
+        return 0.0
+    if current < previous:
+        return current
+    return current - previous
+
+
+class MarketDataWriter:
+    """시세 파일에 틱/분봉을 쓰는 수집기 쪽 객체 (프로세스 하나만 열 수 있습니다)"""
+
+    def __init__(self, path: str, bar_capacity: int = 1440 * 7, tick_capacity: int = 3600, max_markets: int = 64):
+        self.path = path
+        self._lock_fp = open(path + ".lock", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_fp.close()
+                raise RuntimeError(f"다른 수집기가 이미 시세 파일에 쓰고 있습니다: {path}")
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._fp = open(path, "r+b" if exists else "w+b")
+        if exists:
+            self._mm = mmap.mmap(self._fp.fileno(), 0)
+            self.layout = _read_header(self._mm)
+            if (self.layout.bar_capacity, self.layout.tick_capacity) != (bar_capacity, tick_capacity):
+                log.warning(
+                    f"기존 시세 파일의 용량(bars={self.layout.bar_capacity}, ticks={self.layout.tick_capacity})을 그대로 사용합니다."
+                )
+        else:
+            self.layout = _Layout(max_markets, bar_capacity, tick_capacity)
+            # truncate로 만든 파일은 쓰지 않은 영역이 디스크를 차지하지 않습니다 (sparse).
+            self._fp.truncate(self.layout.size)
+            self._mm = mmap.mmap(self._fp.fileno(), self.layout.size)
+            _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, max_markets, bar_capacity, tick_capacity)
+        self._index = _read_names(self._mm, self.layout)
+        # market -> 마지막으로 받은 누적 거래량 (acc_trade_volume)
+        self._acc_volume: Dict[str, float] = {}
+
+    def _slot(self, market: str) -> int:
+        index = self._index.get(market)
+        if index is not None:
+            return index
+        index = len(self._index)
+        if index >= self.layout.max_markets:
+            raise ValueError(f"시세 파일의 마켓 수 상한({self.layout.max_markets})을 넘었습니다: {market}")
+        raw = market.encode("utf-8")
+        if len(raw) >= _NAME_SIZE:
+            raise ValueError(f"마켓 이름이 너무 깁니다: {market}")
+        offset = self.layout.names_offset + index * _NAME_SIZE
+        self._mm[offset:offset + len(raw)] = raw
+        self._index[market] = index
+        return index
+
+    def add_tick(self, market: str, ts: float, price: float, volume: float = 0.0):
+        """체결가 하나를 틱 링에 넣고 해당 분의 봉을 갱신합니다."""
+        index = self._slot(market)
+        layout = self.layout
+        slot = layout.slot(index)
+        bar_seq, bar_count, tick_seq, tick_count = _CONTROL.unpack_from(self._mm, slot)
+
+        # 틱 링
+        _CONTROL.pack_into(self._mm, slot, bar_seq, bar_count, tick_seq + 1, tick_count)
+        _TICK.pack_into(self._mm, layout.ticks(index) + (tick_count % layout.tick_capacity) * _TICK.size, ts, price, volume)
+        tick_seq, tick_count = tick_seq + 2, tick_count + 1
+        _CONTROL.pack_into(self._mm, slot, bar_seq, bar_count, tick_seq, tick_count)
+
+        # 분봉 링: 같은 분이면 마지막 봉 갱신, 아니면 새 봉
+        minute = ts - ts % 60
+        _CONTROL.pack_into(self._mm, slot, bar_seq + 1, bar_count, tick_seq, tick_count)
+        last = None
+        if bar_count:
+            last_offset = layout.bars(index) + ((bar_count - 1) % layout.bar_capacity) * _BAR.size
+            last = _BAR.unpack_from(self._mm, last_offset)
+        if last is not None and last[0] == minute:
+            _BAR.pack_into(
+                self._mm, last_offset,
+                minute, last[1], max(last[2], price), min(last[3], price), price, last[5] + volume,
+            )
+        elif last is None or minute > last[0]:
+            offset = layout.bars(index) + (bar_count % layout.bar_capacity) * _BAR.size
+            _BAR.pack_into(self._mm, offset, minute, price, price, price, price, volume)
+            bar_count += 1
+        # 이전 분의 늦은 틱은 틱 링에만 남기고 봉은 바꾸지 않습니다.
+        _CONTROL.pack_into(self._mm, slot, bar_seq + 2, bar_count, tick_seq, tick_count)
+
+    def add_ticks(self, prices: Dict[str, float], ts: Optional[float] = None, acc_volumes: Optional[Dict[str, float]] = None):
+        """
+        가격 스냅샷(마켓 -> 현재가)을 같은 시각의 틱으로 넣습니다.
+        :param acc_volumes: 마켓 -> 누적 거래량(acc_trade_volume). 주면 직전 값과의 차이를 틱 거래량으로 씁니다.
+        """
+        ts = time.time() if ts is None else ts
+        for market, price in prices.items():
+            if price is None or price != price:
+                continue
+            volume = 0.0
+            acc = (acc_volumes or {}).get(market)
+            if acc is not None:
+                volume = volume_delta(self._acc_volume.get(market), float(acc))
+                self._acc_volume[market] = float(acc)
+            self.add_tick(market, ts, float(price), volume)
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.flush()
+        self._mm.close()
+        self._fp.close()
+        self._lock_fp.close()
+
+
+class MarketDataReader:
+    """시세 파일을 읽기 전용으로 열어 링 버퍼를 numpy 뷰 또는 순서가 맞춰진 사본으로 돌려줍니다."""
+
+    def __init__(self, path: str):
+        _require_numpy()
+        self.path = path
+        self._fp = open(path, "rb")
+        self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.layout = _read_header(self._mm)
+        self._index = _read_names(self._mm, self.layout)
+
+    def markets(self) -> List[str]:
+        self._index = _read_names(self._mm, self.layout)
+        return list(self._index)
+
+    def _slot(self, market: str) -> int:
+        index = self._index.get(market)
+        if index is None:
+            # 수집기가 나중에 추가한 마켓일 수 있으므로 이름표를 다시 읽습니다.
+            self._index = _read_names(self._mm, self.layout)
+            index = self._index.get(market)
+            if index is None:
+                raise KeyError(f"시세 파일에 없는 마켓입니다: {market}")
+        return index
+
+    def counts(self, market: str) -> Tuple[int, int]:
+        """(지금까지 쓴 봉 수, 틱 수). 링 용량보다 크면 오래된 값은 덮어쓰였습니다."""
+        _, bar_count, _, tick_count = _CONTROL.unpack_from(self._mm, self.layout.slot(self._slot(market)))
+        return bar_count, tick_count
+
+    def ring(self, market: str, kind: str = "bars"):
+        """
+        링 전체를 복사 없이 (용량, 필드 수) numpy 배열 뷰로 돌려줍니다. 함께 돌려주는 count로 위치를 계산합니다:
+        가장 최근 값은 (count - 1) % 용량 행입니다.
+        """
+        index = self._slot(market)
+        layout = self.layout
+        bar_count, tick_count = self.counts(market)
+        if kind == "bars":
+            view = np.frombuffer(self._mm, dtype="<f8", count=layout.bar_capacity * 6, offset=layout.bars(index))
+            return view.reshape(layout.bar_capacity, 6), bar_count
+        view = np.frombuffer(self._mm, dtype="<f8", count=layout.tick_capacity * 3, offset=layout.ticks(index))
+        return view.reshape(layout.tick_capacity, 3), tick_count
+
+    def _ordered(self, market: str, kind: str, n: Optional[int], retries: int = 5):
+        """최근 n개를 오래된 순으로 복사합니다. 쓰기 도중이면 다시 읽습니다 (seqlock)."""
+        index = self._slot(market)
+        slot = self.layout.slot(index)
+        capacity = self.layout.bar_capacity if kind == "bars" else self.layout.tick_capacity
+        for _ in range(retries):
+            bar_seq, bar_count, tick_seq, tick_count = _CONTROL.unpack_from(self._mm, slot)
+            seq, count = (bar_seq, bar_count) if kind == "bars" else (tick_seq, tick_count)
+            if seq % 2:
+                time.sleep(0)
+                continue
+            available = min(count, capacity)
+            take = available if n is None else min(n, available)
+            start = count - take
+            ring, _ = self.ring(market, kind)
+            positions = np.arange(start, count) % capacity
+            data = ring[positions]  # 고급 인덱싱은 사본을 만듭니다.
+            after = _CONTROL.unpack_from(self._mm, slot)
+            if (after[0:2] if kind == "bars" else after[2:4]) == (seq, count):
+                return data
+        raise RuntimeError(f"[{market}] 시세를 일관되게 읽지 못했습니다 (수집기가 너무 자주 씁니다).")
+
+    def bars(self, market: str, n: Optional[int] = None):
+        """최근 n개 분봉 (ts, open, high, low, close, volume) (n, 6) 배열"""
+        return self._ordered(market, "bars", n)
+
+    def ticks(self, market: str, n: Optional[int] = None):
+        """최근 n개 틱 (ts, price, volume) (n, 3) 배열"""
+        return self._ordered(market, "ticks", n)
+
+    def volatility(self, market: str, minutes: int = 60) -> Optional[float]:
+        """최근 minutes개 분봉 종가의 분당 로그 수익률 표준편차(%)"""
+        bars = self.bars(market, minutes + 1)
+        return realized_volatility(bars[:, 4])
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            # ring()이 돌려준 뷰가 남아 있으면 매핑은 그 뷰가 사라질 때 해제됩니다.
+            pass
+        self._fp.close()
+
+
+def collect(path: str, markets: List[str], interval_sec: float, http_backend: str = "native"):
+    """Upbit 현재가와 누적 거래량을 interval_sec마다 한 번의 요청으로 가져와 시세 파일에 넣습니다."""
+    from .upbit_client import UpbitClient
+
+    client = UpbitClient("", "", http_backend=http_backend)
+    writer = MarketDataWriter(path)
+    log.info(f"시세 수집 시작: {','.join(markets)} -> {path}")
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                prices, acc_volumes = client.get_current_prices_and_volumes(markets)
+                writer.add_ticks(prices, acc_volumes=acc_volumes)
+            except Exception as e:
+                log.error(f"현재가 수집 실패: {e}")
+            time.sleep(max(0.0, interval_sec - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        log.info("시세 수집을 종료합니다.")
+    finally:
+        writer.close()
+        client.close()
+
+
+def _write_csv(rows: Iterable[Bar], out) -> int:
+    out.write("timestamp,open,high,low,close,volume\n")
+    written = 0
+    for ts, o, h, l, c, v in rows:
+        out.write(f"{int(ts)},{o},{h},{l},{c},{v}\n")
+        written += 1
+    return written
+
+
+def main():
+    p = argparse.ArgumentParser(description="공유 메모리 맵 시세 저장소")
+    sub = p.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("collect", help="Upbit 현재가를 수집해 시세 파일에 기록")
+    c.add_argument("--path", type=str, default="market_data.bin")
+    c.add_argument("--market", nargs="+", required=True)
+    c.add_argument("--interval", type=float, default=1.0, help="현재가 조회 주기(초)")
+    c.add_argument("--http-backend", choices=["native", "pyupbit"], default="native")
+    s = sub.add_parser("show", help="최근 분봉/변동성 출력")
+    s.add_argument("--path", type=str, default="market_data.bin")
+    s.add_argument("--market", type=str, required=True)
+    s.add_argument("--bars", type=int, default=10)
+    e = sub.add_parser("export", help="분봉을 app.backtest --data 용 CSV로 출력")
+    e.add_argument("--path", type=str, default="market_data.bin")
+    e.add_argument("--market", type=str, required=True)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "collect":
+        collect(args.path, args.market, args.interval, args.http_backend)
+        return
+    reader = MarketDataReader(args.path)
+    try:
+        bars = reader.bars(args.market, None if args.command == "export" else args.bars)
+        rows = bars.tolist()
+        if args.command == "export":
+            _write_csv(rows, sys.stdout)
+            return
+        bar_count, tick_count = reader.counts(args.market)
+        print(f"{args.market}: 분봉 {bar_count}개, 틱 {tick_count}개 기록, 60분 변동성 {reader.volatility(args.market)}")
+        _write_csv(rows, sys.stdout)
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
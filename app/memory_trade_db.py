@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+인메모리 거래 저장소
+- FirestoreTradeDB와 같은 메서드를 제공하며, 백테스트나 드라이런(--store memory)처럼 Firestore 없이 FirestoreCache를 쓸 때 사용합니다.
+"""
+import threading
+
+from .shard import claim_lease
+
+
+class MemoryTradeDB:
+    """프로세스 메모리에만 거래를 보관하는 저장소"""
+
+    def __init__(self):
+        self._trades: dict[str, dict] = {}
+        self._leases: dict[str, dict] = {}
+        self._workers: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def upsert_trade(self, data: dict):
+        doc_id = data.get('buy_uuid')
+        if not doc_id:
+            print("오류: 'buy_uuid'가 데이터에 포함되어야 합니다.")
+            return False
+        with self._lock:
+            # merge=True와 같이 기존 필드 위에 덮어씁니다.
+            self._trades.setdefault(doc_id, {}).update(data)
+        return True
+
+    def upsert_trades_batch(self, items: list[dict]) -> bool:
+        for data in items:
+            self.upsert_trade(data)
+        return True
+
+    def get_all_pending_trades(self) -> list[dict]:
+        with self._lock:
+            return [dict(t) for t in self._trades.values() if t.get('state') != 'done']
+
+    def get_trades_updated_since(self, updated_at: float) -> list[dict] | None:
+        with self._lock:
+            return [dict(t) for t in self._trades.values() if (t.get('updated_at') or 0) > updated_at]
+
+    def get_pending_trades_by_market(self, market: str) -> list[dict]:
+        with self._lock:
+            return [dict(t) for t in self._trades.values() if t.get('market') == market and t.get('state') == 'waiting']
+
+    def try_acquire_lease(self, market: str, worker_id: str, ttl_sec: float, now: float) -> bool:
+        with self._lock:
+            lease = claim_lease(self._leases.get(market), market, worker_id, ttl_sec, now)
+            if lease is None:
+                return False
+            self._leases[market] = lease
+            return True
+
+    def release_lease(self, market: str, worker_id: str) -> bool:
+        with self._lock:
+            lease = self._leases.get(market)
+            if not lease or lease.get('owner') != worker_id:
+                return False
+            lease.update(owner=None, expires_at=0)
+            return True
+
+    def get_leases(self) -> list[dict]:
+        with self._lock:
+            return [dict(lease) for lease in self._leases.values()]
+
+    def publish_worker(self, worker_id: str, status: dict) -> bool:
+        with self._lock:
+            self._workers[worker_id] = dict(status)
+        return True
+
+    def get_workers(self) -> list[dict]:
+        with self._lock:
+            return [dict(w) for w in self._workers.values()]
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+운영 지표 (Prometheus 텍스트 형식)
+- 카운터/히스토그램을 프로세스 메모리에 누적하고, --metrics-port를 주면 로컬 HTTP로 /metrics를 제공합니다.
+- 외부 라이브러리 없이 동작하며, 기록 비용은 잠금 한 번과 bisect 한 번 정도입니다.
+- 라벨 조합별 자식 지표는 자주 쓰는 곳에서 미리 만들어 두고(labels) 재사용합니다.
+- 백테스트/스윕처럼 같은 코드를 수십만 번 반복할 때는 set_enabled(False)로 카운터/히스토그램 기록을 끕니다.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+log = logging.getLogger("trade")
+
+# 초 단위 기본 구간: API 왕복(수십 ms)부터 체결 대기(수십 초)까지
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# False이면 카운터/히스토그램/단계 타이머가 아무것도 기록하지 않습니다 (게이지는 그대로 동작).
+_enabled = True
+
+
+def set_enabled(enabled: bool) -> bool:
+    """카운터/히스토그램 기록을 켜거나 끄고 이전 값을 반환합니다."""
+    global _enabled
+    previous = _enabled
+    _enabled = bool(enabled)
+    return previous
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if not _enabled:
+            return
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum", "_count", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # 구간별 개수 (누적 아님), 마지막 칸은 +Inf
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> "_Timer":
+        """with 블록의 실행 시간을 기록합니다."""
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[list, float, int]:
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 라벨 수가 맞지 않습니다: {self.labelnames} <- {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """현재 값을 덮어쓰는 지표 (감소 가능)"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, child in sorted(self._children.items()):
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """이름별 지표 모음. 같은 이름으로 다시 등록하면 기존 지표를 반환합니다."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPBIT_CALL_SECONDS = REGISTRY.histogram(
+    "coinbox_upbit_call_seconds",
+    "UpbitClient 메서드 호출 시간 (_count는 메서드별 호출 수)",
+    ("method",),
+)
+UPBIT_CALL_ERRORS = REGISTRY.counter("coinbox_upbit_call_errors_total", "UpbitClient 메서드 예외 수", ("method",))
+FIRESTORE_WRITE_SECONDS = REGISTRY.histogram(
+    "coinbox_firestore_write_seconds", "Firestore 쓰기 호출 시간", ("op",)
+)
+FIRESTORE_WRITE_ERRORS = REGISTRY.counter("coinbox_firestore_write_errors_total", "Firestore 쓰기 실패 수", ("op",))
+BUY_FILL_WAIT_SECONDS = REGISTRY.histogram("coinbox_buy_fill_wait_seconds", "매수 체결 대기 시간")
+CYCLE_PHASE_SECONDS = REGISTRY.histogram("coinbox_cycle_phase_seconds", "run_once 단계별 소요 시간", ("phase",))
+CYCLE_SECONDS = REGISTRY.histogram("coinbox_cycle_seconds", "마켓별 run_once 전체 소요 시간", ("market",))
+LOOP_SLEEP_SECONDS = REGISTRY.counter("coinbox_loop_sleep_seconds_total", "run_loop 대기(sleep) 누적 시간", ("reason",))
+CACHE_QUERIES = REGISTRY.counter("coinbox_cache_queries_total", "FirestoreCache 조회 수", ("query",))
+CACHE_SCANNED = REGISTRY.counter("coinbox_cache_scanned_total", "FirestoreCache 조회가 훑은 거래 수", ("query",))
+CACHE_LOOKUPS = REGISTRY.counter("coinbox_cache_lookups_total", "sell_uuid 조회 적중/실패 수", ("result",))
+
+
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels) -> Callable:
+    """함수 호출 시간을 기록하고, 예외가 나면 errors 카운터를 올리는 데코레이터"""
+    child = histogram.labels(**labels)
+    error_child = errors.labels(**labels) if errors is not None else None
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if error_child is not None:
+                    error_child.inc()
+                raise
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class PhaseTimer:
+    """mark(phase)를 부를 때마다 직전 mark 이후 경과 시간을 해당 단계로 기록합니다."""
+
+    __slots__ = ("_histogram", "_last")
+
+    def __init__(self, histogram: Histogram = CYCLE_PHASE_SECONDS):
+        self._histogram = histogram
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        if not _enabled:
+            return
+        now = time.perf_counter()
+        self._histogram.labels(phase).observe(now - self._last)
+        self._last = now
+
+
+def sleep(seconds: float, reason: str):
+    """대기 시간을 지표에 남기고 잠듭니다."""
+    if seconds > 0:
+        LOOP_SLEEP_SECONDS.labels(reason).inc(seconds)
+        time.sleep(seconds)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in {"/metrics", "/"}:
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 수집기 요청마다 접근 로그를 남기지 않습니다.
+        return
+
+
+class MetricsServer:
+    """/metrics를 제공하는 로컬 HTTP 서버 (데몬 스레드)"""
+
+    def __init__(self, port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        log.info(f"지표 엔드포인트 시작: http://{self._server.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+실현 손익 / 노출 집계
+- FirestoreCache 상태 변화 리스너로 거래가 열리고(waiting) 닫힐(done/cancel) 때마다 마켓별 누계를 O(1)로 갱신합니다.
+  * 실현 손익: done 거래의 sell_amount - buy_amount 합
+  * 보유 시간 분포: done 거래의 sell_complete_time - buy_create_time 구간별 개수
+  * 미체결 노출: waiting 거래의 buy_amount 합 (매수 원가 기준)
+  * 체결률: done / (done + cancel)
+- 닫힌 거래 누계는 주기적으로 JSON 체크포인트에 저장하고, 시작 시 체크포인트 + 보관소(TradeArchive)의 이후 거래로 복원합니다.
+  미체결 노출은 캐시의 waiting 거래로 다시 계산하므로 체크포인트에 넣지 않습니다.
+- 값은 /metrics 게이지(coinbox_realized_pnl_krw 등)로도 내보냅니다.
+
+예)
+  python -m app.pnl --checkpoint pnl_checkpoint.json
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from .metrics import REGISTRY
+
+log = logging.getLogger("trade")
+
+# 보유 시간 구간 상한(초): 1분 ~ 30일
+HOLDING_BUCKETS = (60, 300, 900, 3600, 4 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400, 30 * 86400)
+
+REALIZED_PNL = REGISTRY.gauge("coinbox_realized_pnl_krw", "실현 손익 누계 (done 거래의 sell_amount - buy_amount)", ("market",))
+OPEN_EXPOSURE = REGISTRY.gauge("coinbox_open_exposure_krw", "미체결 매도 거래의 매수 원가 합", ("market",))
+OPEN_TRADES = REGISTRY.gauge("coinbox_open_trades", "미체결(waiting) 거래 수", ("market",))
+FILL_RATE = REGISTRY.gauge("coinbox_fill_rate", "종료 거래 중 done 비율", ("market",))
+
+_CLOSED_FIELDS = ("realized_pnl", "closed_buy_amount", "sell_amount", "done", "cancelled", "holding_counts", "holding_sum")
+
+
+class MarketStats:
+    """한 마켓의 누계"""
+
+    __slots__ = _CLOSED_FIELDS + ("open_count", "open_cost")
+
+    def __init__(self):
+        self.realized_pnl = 0.0
+        self.closed_buy_amount = 0.0  # done 거래의 매수 원가 합
+        self.sell_amount = 0.0
+        self.done = 0
+        self.cancelled = 0
+        self.holding_counts = [0] * (len(HOLDING_BUCKETS) + 1)
+        self.holding_sum = 0.0
+        self.open_count = 0
+        self.open_cost = 0.0
+
+    @property
+    def fill_rate(self) -> Optional[float]:
+        closed = self.done + self.cancelled
+        return self.done / closed if closed else None
+
+    def holding_quantile(self, q: float) -> Optional[float]:
+        """보유 시간 분위수의 근삿값 (해당 구간의 상한, 초). 마지막 구간이면 inf."""
+        total = sum(self.holding_counts)
+        if not total:
+            return None
+        target = q * total
+        running = 0
+        for bound, count in zip(HOLDING_BUCKETS + (float("inf"),), self.holding_counts):
+            running += count
+            if running >= target:
+                return float(bound)
+        return float("inf")
+
+    def closed_state(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in _CLOSED_FIELDS}
+
+    def load_closed_state(self, data: Dict[str, Any]):
+        for name in _CLOSED_FIELDS:
+            if name in data:
+                setattr(self, name, data[name])
+        if len(self.holding_counts) != len(HOLDING_BUCKETS) + 1:
+            # 구간 정의가 바뀐 체크포인트는 분포만 버립니다.
+            self.holding_counts = [0] * (len(HOLDING_BUCKETS) + 1)
+            self.holding_sum = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        holding_count = sum(self.holding_counts)
+        return {
+            "realized_pnl": round(self.realized_pnl, 2),
+            "done": self.done,
+            "cancelled": self.cancelled,
+            "fill_rate": self.fill_rate,
+            "open_count": self.open_count,
+            "open_exposure": round(self.open_cost, 2),
+            "avg_holding_sec": self.holding_sum / holding_count if holding_count else None,
+            "p50_holding_sec": self.holding_quantile(0.5),
+            "p90_holding_sec": self.holding_quantile(0.9),
+        }
+
+
+class PnLAggregator:
+    """거래 상태 변화로 손익/노출 누계를 갱신하고 체크포인트를 남깁니다."""
+
+    def __init__(self, checkpoint_path: str = "", checkpoint_interval_sec: float = 60.0):
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval_sec = checkpoint_interval_sec
+        self._markets: Dict[str, MarketStats] = {}
+        # 반영한 종료 거래의 최대 updated_at (보관소 재생 시 중복 방지)
+        self._watermark = 0.0
+        self._checkpointed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _stats(self, market: str) -> MarketStats:
+        stats = self._markets.get(market)
+        if stats is None:
+            stats = self._markets[market] = MarketStats()
+        return stats
+
+    def _publish(self, market: str, stats: MarketStats):
+        REALIZED_PNL.labels(market).set(stats.realized_pnl)
+        OPEN_EXPOSURE.labels(market).set(stats.open_cost)
+        OPEN_TRADES.labels(market).set(stats.open_count)
+        if stats.fill_rate is not None:
+            FILL_RATE.labels(market).set(stats.fill_rate)
+
+    # ---- 이벤트 ----
+
+    def _open(self, stats: MarketStats, trade) -> None:
+        stats.open_count += 1
+        stats.open_cost += trade.get('buy_amount') or 0.0
+
+    def _close(self, stats: MarketStats, trade, state: str, was_open: bool) -> None:
+        buy_amount = trade.get('buy_amount') or 0.0
+        if was_open:
+            stats.open_count -= 1
+            stats.open_cost -= buy_amount
+        if state == 'done':
+            sell_amount = trade.get('sell_amount') or 0.0
+            stats.done += 1
+            stats.sell_amount += sell_amount
+            stats.closed_buy_amount += buy_amount
+            stats.realized_pnl += sell_amount - buy_amount
+            opened, closed = trade.get('buy_create_time'), trade.get('sell_complete_time')
+            if opened and closed and closed >= opened:
+                held = float(closed - opened)
+                stats.holding_counts[bisect.bisect_left(HOLDING_BUCKETS, held)] += 1
+                stats.holding_sum += held
+        else:
+            stats.cancelled += 1
+        updated_at = trade.get('updated_at')
+        if isinstance(updated_at, (int, float)):
+            self._watermark = max(self._watermark, float(updated_at))
+
+    def on_trade_update(self, prev_state: Optional[str], trade):
+        """캐시 상태 변화 리스너"""
+        state = trade.get('state')
+        if prev_state == state:
+            # 같은 상태 안의 변경(매도가 재설정 등)은 누계에 영향이 없습니다.
+            return
+        market = trade.get('market') or "unknown"
+        with self._lock:
+            stats = self._stats(market)
+            if state == 'waiting' and prev_state is None:
+                self._open(stats, trade)
+            elif prev_state == 'waiting' and state in {'done', 'cancel'}:
+                self._close(stats, trade, state, was_open=True)
+            else:
+                return
+            self._publish(market, stats)
+
+    def seed_open(self, trades: Iterable):
+        """시작 시 캐시에 있는 waiting 거래로 미체결 노출을 다시 계산합니다."""
+        with self._lock:
+            for stats in self._markets.values():
+                stats.open_count = 0
+                stats.open_cost = 0.0
+            for trade in trades:
+                if trade.get('state') == 'waiting':
+                    self._open(self._stats(trade.get('market') or "unknown"), trade)
+            for market, stats in self._markets.items():
+                self._publish(market, stats)
+
+    def replay_closed(self, trades: Iterable) -> int:
+        """체크포인트 이후에 종료된 거래(보관소 등)를 누계에 반영합니다. 반영한 건수를 반환합니다."""
+        applied = 0
+        with self._lock:
+            watermark = self._watermark
+            for trade in trades:
+                state = trade.get('state')
+                updated_at = trade.get('updated_at') or 0.0
+                if state not in {'done', 'cancel'} or updated_at <= watermark:
+                    continue
+                self._close(self._stats(trade.get('market') or "unknown"), trade, state, was_open=False)
+                applied += 1
+            for market, stats in self._markets.items():
+                self._publish(market, stats)
+        return applied
+
+    # ---- 조회 ----
+
+    @property
+    def watermark(self) -> float:
+        return self._watermark
+
+    def market(self, market: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats(market).summary()
+
+    def open_exposure(self, market: Optional[str] = None) -> float:
+        """미체결 노출(매수 원가). market이 없으면 전체 합."""
+        with self._lock:
+            if market is not None:
+                stats = self._markets.get(market)
+                return stats.open_cost if stats else 0.0
+            return sum(s.open_cost for s in self._markets.values())
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            total = MarketStats()
+            for stats in self._markets.values():
+                total.realized_pnl += stats.realized_pnl
+                total.done += stats.done
+                total.cancelled += stats.cancelled
+                total.open_count += stats.open_count
+                total.open_cost += stats.open_cost
+                total.holding_sum += stats.holding_sum
+                total.holding_counts = [a + b for a, b in zip(total.holding_counts, stats.holding_counts)]
+            return {
+                "total": total.summary(),
+                "markets": {m: s.summary() for m, s in sorted(self._markets.items())},
+                "watermark": self._watermark,
+            }
+
+    # ---- 체크포인트 ----
+
+    def checkpoint(self):
+        """닫힌 거래 누계를 원자적으로(임시 파일 후 교체) 저장합니다."""
+        if not self.checkpoint_path:
+            return
+        with self._lock:
+            data = {
+                "version": 1,
+                "saved_at": time.time(),
+                "watermark": self._watermark,
+                "markets": {m: s.closed_state() for m, s in self._markets.items()},
+            }
+        tmp_path = self.checkpoint_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(data, fp, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.checkpoint_path)
+        except Exception as e:
+            log.error(f"손익 체크포인트 저장 실패: {e}")
+        self._checkpointed_at = time.monotonic()
+
+    def checkpoint_if_due(self):
+        if time.monotonic() - self._checkpointed_at >= self.checkpoint_interval_sec:
+            self.checkpoint()
+
+    def restore(self) -> bool:
+        """체크포인트에서 닫힌 거래 누계를 읽습니다. 파일이 없으면 False."""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return False
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as fp:
+                data = json.load(fp)
+        except Exception as e:
+            log.error(f"손익 체크포인트를 읽지 못해 0부터 집계합니다: {e}")
+            return False
+        with self._lock:
+            self._markets = {}
+            for market, closed in (data.get("markets") or {}).items():
+                self._stats(market).load_closed_state(closed)
+            self._watermark = float(data.get("watermark") or 0.0)
+        return True
+
+
+def main():
+    p = argparse.ArgumentParser(description="손익 체크포인트 요약 출력")
+    p.add_argument("--checkpoint", type=str, default="pnl_checkpoint.json", help="체크포인트 파일")
+    p.add_argument("--archive-dir", type=str, default="", help="지정하면 체크포인트 이후 보관된 거래까지 반영")
+    args = p.parse_args()
+    aggregator = PnLAggregator(args.checkpoint)
+    if not aggregator.restore():
+        print(f"체크포인트가 없습니다: {args.checkpoint}")
+    if args.archive_dir:
+        from .archive import TradeArchive
+        aggregator.replay_closed(TradeArchive(args.archive_dir).iter_trades())
+    print(json.dumps(aggregator.summary(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Upbit 요청 속도 제한 스케줄러
+- 엔드포인트 그룹(주문 / 주문 외 거래소 / 시세)마다 토큰 버킷을 두고, 응답의 Remaining-Req(sec) 값으로 버킷을 보정합니다.
+- 같은 그룹에서 기다리는 요청은 우선순위(취소 > 매도 > 매수 > 조회) 순으로 보냅니다.
+- 429(too_many_requests)를 받으면 그룹 전체를 지수 백오프로 잠시 멈춘 뒤 다시 시도합니다.
+- 같은 키(예: 같은 uuid의 주문 조회)로 진행 중인 조회가 있으면 새로 보내지 않고 그 결과를 함께 씁니다.
+"""
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import REGISTRY
+
+log = logging.getLogger("trade")
+
+# 그룹 이름 -> (초당 요청 수, 최대 버스트). 업비트 기본 한도: 주문 8회/초, 주문 외 30회/초, 시세 10회/초
+DEFAULT_GROUP_LIMITS: Dict[str, Tuple[float, float]] = {
+    "order": (8.0, 8.0),
+    "exchange": (30.0, 30.0),
+    "quotation": (10.0, 10.0),
+}
+
+# 숫자가 작을수록 먼저 보냅니다.
+PRIORITY_CANCEL = 0
+PRIORITY_SELL = 1
+PRIORITY_BUY = 2
+PRIORITY_QUERY = 3
+
+RATE_LIMITED = REGISTRY.counter("coinbox_upbit_rate_limited_total", "429 응답으로 재시도한 수", ("group",))
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "coinbox_upbit_queue_wait_seconds", "속도 제한으로 요청이 대기한 시간", ("group",)
+)
+COALESCED = REGISTRY.counter("coinbox_upbit_coalesced_total", "진행 중인 같은 조회에 합쳐진 요청 수", ("group",))
+
+_REMAINING_SEC = re.compile(r"sec=(\d+)")
+
+
+class RateLimitError(RuntimeError):
+    """재시도 후에도 속도 제한이 풀리지 않은 경우"""
+
+
+def parse_remaining_sec(remaining: Any) -> Optional[int]:
+    """Remaining-Req 헤더(문자열) 또는 pyupbit가 파싱한 dict에서 이번 초에 남은 요청 수를 꺼냅니다."""
+    if not remaining:
+        return None
+    if isinstance(remaining, dict):
+        sec = remaining.get("sec")
+        return int(sec) if sec is not None else None
+    matched = _REMAINING_SEC.search(str(remaining))
+    return int(matched.group(1)) if matched else None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """429 응답으로 발생한 예외인지 판별합니다 (pyupbit TooManyRequests, status_code=429 등)."""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    name = type(error).__name__
+    return name == "TooManyRequests" or "too_many_requests" in str(error)
+
+
+class _Group:
+    """한 엔드포인트 그룹의 토큰 버킷과 우선순위 대기열"""
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+        self.waiters: list[Tuple[int, int]] = []
+        self.wait_metric = QUEUE_WAIT_SECONDS.labels(name)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority: int, seq: int):
+        ticket = (priority, seq)
+        started = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.waiters[0] == ticket:
+                        delay = max(self.blocked_until - now, (1.0 - self.tokens) / self.rate if self.tokens < 1.0 else 0.0)
+                        if delay <= 0:
+                            heapq.heappop(self.waiters)
+                            self.tokens -= 1.0
+                            # 다음 순서의 대기자가 바로 조건을 다시 확인하도록 깨웁니다.
+                            self.cond.notify_all()
+                            break
+                        self.cond.wait(delay)
+                    else:
+                        self.cond.wait()
+            except BaseException:
+                if ticket in self.waiters:
+                    self.waiters.remove(ticket)
+                    heapq.heapify(self.waiters)
+                    self.cond.notify_all()
+                raise
+        self.wait_metric.observe(time.monotonic() - started)
+
+    def observe_remaining(self, remaining_sec: int):
+        """서버가 알려 준 남은 요청 수보다 버킷이 많으면 줄입니다 (다른 프로세스/키와 한도를 공유하는 경우)."""
+        with self.cond:
+            self._refill(time.monotonic())
+            if remaining_sec < self.tokens:
+                self.tokens = float(remaining_sec)
+
+    def block(self, seconds: float):
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.cond.notify_all()
+
+
+class RequestScheduler:
+    """그룹별 토큰 버킷 + 우선순위 + 429 백오프 + 중복 조회 합치기"""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        max_retries: int = 5,
+        backoff_base_sec: float = 0.25,
+        backoff_max_sec: float = 8.0,
+    ):
+        self._groups = {name: _Group(name, rate, burst) for name, (rate, burst) in (limits or DEFAULT_GROUP_LIMITS).items()}
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self._seq = itertools.count()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    def call(
+        self,
+        group: str,
+        priority: int,
+        fn: Callable[[], Tuple[Any, Any]],
+        key: Optional[Hashable] = None,
+    ) -> Any:
+        """
+        속도 제한에 맞춰 fn을 실행하고 결과를 반환합니다.
+        :param fn: (결과, Remaining-Req 헤더 또는 파싱된 dict/None)을 반환하는 함수
+        :param key: 지정하면 같은 키로 진행 중인 호출의 결과를 함께 사용합니다 (조회 전용)
+        """
+        if key is None:
+            return self._call(group, priority, fn)
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            COALESCED.labels(group).inc()
+            return future.result()
+        try:
+            result = self._call(group, priority, fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _call(self, group_name: str, priority: int, fn: Callable[[], Tuple[Any, Any]]) -> Any:
+        group = self._groups[group_name]
+        attempt = 0
+        while True:
+            group.acquire(priority, next(self._seq))
+            try:
+                result, remaining = fn()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_retries:
+                    if is_rate_limited(e):
+                        raise RateLimitError(f"{group_name} 그룹 요청이 {attempt + 1}회 연속 속도 제한에 걸렸습니다.") from e
+                    raise
+                delay = min(self.backoff_base_sec * (2 ** attempt), self.backoff_max_sec)
+                attempt += 1
+                RATE_LIMITED.labels(group_name).inc()
+                log.warning(f"Upbit 속도 제한(429) - {group_name} 그룹을 {delay:.2f}초 멈춘 뒤 재시도합니다 ({attempt}/{self.max_retries}).")
+                group.block(delay)
+                continue
+            remaining_sec = parse_remaining_sec(remaining)
+            if remaining_sec is not None:
+                group.observe_remaining(remaining_sec)
+            return result
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+마켓 분할 실행 (여러 워커 프로세스)
+- 워커마다 거래 저장소의 lease 문서로 마켓을 나눠 가집니다. lease는 만료 시각(expires_at)을 가지며
+  소유 워커가 heartbeat마다 연장합니다. 워커가 죽어 연장이 끊기면 만료 후 다른 워커가 가져갑니다.
+- 살아 있는 워커 수로 목표 개수(ceil(마켓 수 / 워커 수))를 정하고, 목표보다 많이 가진 워커는 넘치는 마켓을 놓습니다.
+- 마켓을 얻으면 그 마켓의 미완료 거래만 캐시에 로드하고, 잃으면 캐시에서 내립니다.
+- 자동 거래 금액 모드의 전체 대기 주문 수는 워커 문서에 올린 각 워커의 대기 수를 더해 씁니다.
+- heartbeat가 실패해도 마지막으로 연장에 성공한 시각에서 lease_ttl_sec - lease_margin_sec이 지나면
+  그 마켓은 owned()에서 빠집니다 (만료된 lease로 다른 워커와 함께 매매하지 않도록).
+- 마켓 사이클은 LeaseGuardedCache로 캐시를 감싸 거래를 기록하기 전에 lease가 사이클 시작 때 그대로인지 확인합니다.
+- 만료 판단은 각 호스트의 시계(time.time)를 쓰므로 호스트 간 시계 차이는 lease_ttl_sec보다 충분히 작아야 합니다.
+"""
+import logging
+import math
+import os
+import itertools
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import REGISTRY
+
+log = logging.getLogger("trade")
+
+SHARD_EVENTS = REGISTRY.counter("coinbox_shard_events_total", "마켓 lease 변화 (acquired/renewed/lost/released)", ("event",))
+OWNED_MARKETS = REGISTRY.gauge("coinbox_owned_markets", "이 워커가 lease를 가진 마켓 수")
+
+
+class LeaseLostError(RuntimeError):
+    """사이클 도중 마켓 lease를 잃어 거래 기록을 멈춘 경우"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def claim_lease(lease: Optional[Dict[str, Any]], market: str, worker_id: str, ttl_sec: float, now: float) -> Optional[Dict[str, Any]]:
+    """
+    현재 lease 문서를 보고 worker_id가 가질 수 있으면 새로 쓸 문서를, 아니면 None을 반환합니다.
+    비어 있거나 만료됐거나 이미 자기 것이면 가질 수 있습니다. 소유자가 바뀔 때마다 epoch가 1 늘어납니다.
+    """
+    if lease and lease.get('owner') and lease.get('owner') != worker_id and (lease.get('expires_at') or 0) > now:
+        return None
+    same_owner = bool(lease) and lease.get('owner') == worker_id
+    epoch = int((lease or {}).get('epoch') or 0)
+    return {
+        'market': market,
+        'owner': worker_id,
+        'expires_at': now + ttl_sec,
+        'acquired_at': (lease or {}).get('acquired_at', now) if same_owner else now,
+        'epoch': epoch if same_owner else epoch + 1,
+    }
+
+
+class ShardCoordinator:
+    """
+    lease로 이 워커가 맡을 마켓을 정하고 캐시를 맞춥니다.
+    store는 try_acquire_lease/release_lease/get_leases/publish_worker/get_workers를 제공하는 거래 저장소입니다.
+    """
+
+    def __init__(
+        self,
+        store,
+        cache,
+        worker_id: str,
+        markets: List[str],
+        lease_ttl_sec: float = 30.0,
+        heartbeat_sec: Optional[float] = None,
+    ):
+        self.store = store
+        self.cache = cache
+        self.worker_id = worker_id
+        self.markets = list(markets)
+        self.lease_ttl_sec = lease_ttl_sec
+        self.heartbeat_sec = heartbeat_sec if heartbeat_sec is not None else lease_ttl_sec / 3
+        # 마지막 연장 후 lease_ttl_sec - lease_margin_sec이 지나면 연장 실패로 보고 마켓을 놓은 것으로 취급합니다.
+        self.lease_margin_sec = min(self.heartbeat_sec, lease_ttl_sec / 3)
+        self._owned: set = set()
+        # market -> 마지막으로 lease 획득/연장에 성공한 시각
+        self._renewed: Dict[str, float] = {}
+        # market -> 이 워커가 마켓을 얻을 때마다 새로 받는 번호 (잃었다 다시 얻으면 바뀝니다)
+        self._epochs: Dict[str, int] = {}
+        self._epoch_seq = itertools.count(1)
+        # callback(얻은 마켓 목록, 잃은 마켓 목록)
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, callback: Callable[[List[str], List[str]], None]):
+        self._listeners.append(callback)
+
+    def owned(self, now: Optional[float] = None) -> List[str]:
+        """이 워커가 맡은 마켓 (설정 순서 유지). 연장이 끊겨 만료가 가까운 마켓은 빠집니다."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [m for m in self.markets if self._valid(m, now)]
+
+    def epoch(self, market: str) -> Optional[int]:
+        """마켓을 얻을 때 받은 번호. 맡지 않은 마켓이면 None"""
+        with self._lock:
+            return self._epochs.get(market) if market in self._owned else None
+
+    def holds(self, market: str, epoch: Optional[int], now: Optional[float] = None) -> bool:
+        """epoch를 받은 뒤로 lease를 잃지 않았고 아직 만료가 가깝지 않으면 True"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return epoch is not None and self._epochs.get(market) == epoch and self._valid(market, now)
+
+    def _valid(self, market: str, now: float) -> bool:
+        # self._lock 안에서 호출합니다.
+        if market not in self._owned:
+            return False
+        renewed = self._renewed.get(market)
+        return renewed is not None and now - renewed < self.lease_ttl_sec - self.lease_margin_sec
+
+    def _discard(self, owned: set, market: str):
+        """사이클 루프가 더 이상 이 마켓을 고르지 않도록 캐시를 내리기 전에 목록에서 뺍니다."""
+        owned.discard(market)
+        with self._lock:
+            self._owned.discard(market)
+            self._renewed.pop(market, None)
+            self._epochs.pop(market, None)
+
+    def _target(self, workers: List[Dict[str, Any]], now: float) -> int:
+        live = {w.get('worker_id') for w in workers if (w.get('expires_at') or 0) > now}
+        live.add(self.worker_id)
+        return math.ceil(len(self.markets) / len(live))
+
+    def _publish(self, now: float):
+        self.store.publish_worker(
+            self.worker_id,
+            {
+                'worker_id': self.worker_id,
+                'waiting_count': self.cache.get_local_waiting_count(),
+                'markets': sorted(self._owned),
+                'expires_at': now + self.lease_ttl_sec,
+            },
+        )
+
+    def sync(self, now: Optional[float] = None) -> None:
+        """heartbeat 한 번: 자기 상태를 올리고, lease를 연장/반납/획득한 뒤 캐시와 전체 대기 수를 맞춥니다."""
+        now = time.time() if now is None else now
+        self._publish(now)
+        workers = self.store.get_workers()
+        target = self._target(workers, now)
+
+        acquired: List[str] = []
+        lost: List[str] = []
+        owned = set(self._owned)
+        for market in sorted(owned):
+            if self.store.try_acquire_lease(market, self.worker_id, self.lease_ttl_sec, now):
+                with self._lock:
+                    self._renewed[market] = now
+                SHARD_EVENTS.labels("renewed").inc()
+            else:
+                self._discard(owned, market)
+                lost.append(market)
+                self.cache.drop_market(market)
+                SHARD_EVENTS.labels("lost").inc()
+                log.warning(f"[{market}] 다른 워커가 lease를 가져갔습니다.")
+
+        # 목표보다 많이 가지고 있으면 설정 순서의 뒤쪽 마켓부터 놓아 다른 워커가 가져가게 합니다.
+        for market in [m for m in reversed(self.markets) if m in owned][:max(0, len(owned) - target)]:
+            # 캐시를 먼저 내려 대기 중인 쓰기를 반영한 뒤 반납해야 다음 워커가 최신 거래를 로드합니다.
+            self._discard(owned, market)
+            self.cache.drop_market(market)
+            self.store.release_lease(market, self.worker_id)
+            lost.append(market)
+            SHARD_EVENTS.labels("released").inc()
+            log.info(f"[{market}] 워커 수가 늘어 lease를 반납합니다 (목표 {target}개).")
+
+        if len(owned) < target:
+            leases = {lease.get('market'): lease for lease in self.store.get_leases()}
+            for market in self.markets:
+                if len(owned) >= target:
+                    break
+                if market in owned:
+                    continue
+                lease = leases.get(market)
+                if lease and lease.get('owner') != self.worker_id and (lease.get('expires_at') or 0) > now:
+                    continue
+                if self.store.try_acquire_lease(market, self.worker_id, self.lease_ttl_sec, now):
+                    owned.add(market)
+                    acquired.append(market)
+                    SHARD_EVENTS.labels("acquired").inc()
+                    log.info(f"[{market}] lease를 얻었습니다 ({self.worker_id}).")
+
+        for market in acquired:
+            self.cache.load_market(market)
+        with self._lock:
+            for market in acquired:
+                self._renewed[market] = now
+                self._epochs[market] = next(self._epoch_seq)
+            self._owned = owned
+        OWNED_MARKETS.set(len(owned))
+
+        remote = sum(
+            int(w.get('waiting_count') or 0)
+            for w in workers
+            if w.get('worker_id') != self.worker_id and (w.get('expires_at') or 0) > now
+        )
+        self.cache.set_remote_waiting_count(remote)
+
+        if acquired or lost:
+            for callback in self._listeners:
+                try:
+                    callback(acquired, lost)
+                except Exception as e:
+                    log.exception(f"lease 변화 리스너 오류: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                log.exception(f"lease heartbeat 오류: {e}")
+            self._stop.wait(self.heartbeat_sec)
+
+    def start(self) -> "ShardCoordinator":
+        """첫 heartbeat를 바로 수행한 뒤 백그라운드 스레드에서 주기적으로 반복합니다."""
+        try:
+            self.sync()
+        except Exception as e:
+            log.exception(f"lease 초기화 오류: {e}")
+        self._thread = threading.Thread(target=self._run, name="shard-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, release: bool = True):
+        """heartbeat를 멈추고, release이면 가진 lease를 바로 반납해 다른 워커가 기다리지 않게 합니다."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if not release:
+            return
+        with self._lock:
+            owned, self._owned = self._owned, set()
+            self._renewed.clear()
+            self._epochs.clear()
+        for market in sorted(owned):
+            try:
+                self.store.release_lease(market, self.worker_id)
+                SHARD_EVENTS.labels("released").inc()
+            except Exception as e:
+                log.error(f"[{market}] lease 반납 실패: {e}")
+        try:
+            self.store.publish_worker(self.worker_id, {'worker_id': self.worker_id, 'waiting_count': 0, 'markets': [], 'expires_at': 0})
+        except Exception as e:
+            log.error(f"워커 상태 정리 실패: {e}")
+        OWNED_MARKETS.set(0)
+
+
+class LeaseGuardedCache:
+    """
+    한 마켓 사이클 동안 쓰는 캐시 래퍼. 조회는 그대로 넘기고, 거래를 기록하기 전에
+    사이클 시작 때 받은 lease를 아직 가지고 있는지 확인해 아니면 LeaseLostError를 냅니다.
+    """
+
+    def __init__(self, cache, coordinator: ShardCoordinator, market: str):
+        self._cache = cache
+        self._coordinator = coordinator
+        self._market = market
+        self._epoch = coordinator.epoch(market)
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def _check(self, items: list[dict]):
+        if self._coordinator.holds(self._market, self._epoch):
+            return
+        # 이미 거래소에 낸 주문일 수 있으므로 새 소유 워커나 운영자가 맞출 수 있게 식별자를 남깁니다.
+        uuids = ", ".join(f"{d.get('buy_uuid')}/{d.get('sell_uuid')}" for d in items)
+        raise LeaseLostError(f"[{self._market}] 사이클 도중 lease를 잃어 거래 기록을 멈춥니다 (buy/sell uuid: {uuids}).")
+
+    def upsert_trade(self, data: dict):
+        self._check([data])
+        return self._cache.upsert_trade(data)
+
+    def upsert_trades(self, items: list[dict]):
+        self._check(items)
+        return self._cache.upsert_trades(items)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+인메모리 모의 거래소
+- UpbitClient와 같은 메서드를 제공하므로 run_once 등 매매 로직을 그대로 실행할 수 있습니다.
+- 가격은 외부에서 set_price/feed_candle로 넣어 주거나, 시드가 고정된 PriceProcess가 조회할 때마다 한 단계씩 만듭니다.
+- 지정가 매도는 마켓별 호가(가격, 주문 순서)대로 체결되며, 가격 갱신마다 체결 가능한 거래량이 있으면 부분 체결됩니다.
+- 주문 응답은 실제 API와 같은 모양(state, executed_volume, paid_fee, trades)으로 반환합니다.
+- 모의 실행의 마켓 워커들이 여러 스레드에서 함께 호출하므로 공개 메서드는 하나의 락 안에서 실행합니다.
+"""
+import heapq
+import itertools
+import math
+import random
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .util import round_price_to_tick, round_volume
+
+
+class PriceProcess:
+    """
+    시드 고정 기하 랜덤워크 가격 과정.
+    마켓마다 (seed, market)으로 만든 별도 난수열을 사용하므로 조회 순서와 무관하게 같은 가격열이 나옵니다.
+    """
+
+    def __init__(
+        self,
+        start_price: float = 100_000.0,
+        volatility: float = 0.001,
+        drift: float = 0.0,
+        liquidity_krw: Optional[float] = 1_000_000.0,
+        step_sec: float = 1.0,
+        seed: int = 0,
+    ):
+        """
+        :param volatility: 한 단계 로그 수익률의 표준편차 (0.001 == 0.1%)
+        :param drift: 한 단계 로그 수익률의 평균
+        :param liquidity_krw: 한 단계에 체결 가능한 평균 거래대금. None이면 제한 없이 전량 체결
+        :param step_sec: 한 단계가 나타내는 시간(초). 주문/체결 시각에 사용됩니다.
+        """
+        self.start_price = start_price
+        self.volatility = volatility
+        self.drift = drift
+        self.liquidity_krw = liquidity_krw
+        self.step_sec = step_sec
+        self.seed = seed
+        self._rngs: Dict[str, random.Random] = {}
+        self._prices: Dict[str, float] = {}
+
+    def step(self, market: str) -> Tuple[float, float, Optional[float]]:
+        """다음 (현재가, 단계 고가, 체결 가능 수량)을 만듭니다."""
+        rng = self._rngs.get(market)
+        if rng is None:
+            rng = self._rngs[market] = random.Random(f"{self.seed}:{market}")
+        prev = self._prices.get(market, self.start_price)
+        raw = prev * math.exp(self.drift - self.volatility ** 2 / 2 + self.volatility * rng.gauss(0.0, 1.0))
+        price = round_price_to_tick(raw, method='down', market=market)
+        if price <= 0:
+            price = prev
+        # 가격이 호가단위에 묶여 멈추지 않도록 반올림 전 값을 다음 단계의 기준으로 씁니다.
+        self._prices[market] = raw
+        high = round_price_to_tick(max(raw, prev) * (1.0 + abs(rng.gauss(0.0, self.volatility)) / 2), method='down', market=market)
+        volume = None
+        if self.liquidity_krw is not None:
+            volume = rng.expovariate(1.0) * self.liquidity_krw / price
+        return price, max(high, price), volume
+
+
+class SimExchange:
+    """백테스트/모의 실행용 거래소. 대기 없이 즉시 응답합니다."""
+
+    def __init__(self, krw: float = 1_000_000.0, fee_rate: float = 0.0005, process: Optional[PriceProcess] = None):
+        """
+        :param process: 지정하면 현재가 조회마다 가격 과정을 한 단계 진행합니다.
+            없으면 set_price/feed_candle로 넣은 가격을 그대로 사용합니다.
+        """
+        self.krw = krw
+        self.fee_rate = fee_rate
+        self.process = process
+        self.now = 0.0
+        self.dry_run = False
+        # UpbitClient와 같은 속성. 모의 거래소는 이벤트 스트림이 없습니다.
+        self.events = None
+        self.assets: Dict[str, float] = {}
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self._prices: Dict[str, float] = {}
+        # market -> [(price, seq, uuid)] 매도 호가 힙 (취소/체결된 항목은 꺼낼 때 건너뜀)
+        self._asks: Dict[str, list] = {}
+        self._open_asks: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._seq = itertools.count()
+        # 잔고/호가/현재 시각을 함께 바꾸므로 재진입 가능한 락 하나로 묶습니다 (cancel_and_new -> sell_limit 등).
+        self._lock = threading.RLock()
+
+    # ---- 가격 입력 ----
+
+    def set_price(
+        self,
+        market: str,
+        price: float,
+        high: Optional[float] = None,
+        ts: Optional[float] = None,
+        liquidity: Optional[float] = None,
+    ):
+        """
+        현재가를 갱신하고, high(없으면 price) 이하의 매도 주문을 체결합니다.
+        :param liquidity: 이번 갱신에서 체결 가능한 최대 수량. None이면 제한 없이 전량 체결
+        """
+        with self._lock:
+            if ts is not None:
+                self.now = ts
+            self._prices[market] = price
+            self._match_asks(market, price if high is None else high, liquidity)
+
+    def advance(self, market: str) -> float:
+        """가격 과정을 한 단계 진행하고 새 현재가를 반환합니다."""
+        with self._lock:
+            price, high, liquidity = self.process.step(market)
+            self.set_price(market, price, high=high, ts=self.now + self.process.step_sec, liquidity=liquidity)
+            return price
+
+    def feed_candle(self, market: str, ts: float, open_: float, high: float, low: float, close: float):
+        """캔들 하나를 반영합니다. 캔들 고가까지 도달한 매도 주문은 주문가로 체결됩니다."""
+        self.set_price(market, close, high=high, ts=ts)
+
+    def _match_asks(self, market: str, high: float, liquidity: Optional[float] = None):
+        # 낮은 가격, 먼저 들어온 주문 순으로 체결 가능한 수량을 나눠 줍니다.
+        heap = self._asks.get(market)
+        open_asks = self._open_asks.get(market)
+        while heap and heap[0][0] <= high:
+            price, _, uuid = heap[0]
+            order = open_asks.get(uuid)
+            if order is None:
+                heapq.heappop(heap)
+                continue
+            volume = float(order["remaining_volume"])
+            if liquidity is not None:
+                volume = round_volume(min(volume, liquidity), 8)
+                if volume <= 0:
+                    return
+                liquidity -= volume
+            self._fill_ask(order, price, volume)
+            if order["state"] == "done":
+                heapq.heappop(heap)
+                del open_asks[uuid]
+
+    def _fill_ask(self, order: Dict[str, Any], price: float, volume: float):
+        funds = price * volume
+        fee = funds * self.fee_rate
+        self.krw += funds - fee
+        self._add_trade(order, price, volume, funds, fee)
+        if float(order["remaining_volume"]) <= 0:
+            order["state"] = "done"
+
+    def _add_trade(self, order: Dict[str, Any], price: float, volume: float, funds: float, fee: float):
+        order["trades"].append({
+            "market": order["market"],
+            "uuid": f"trade-{next(self._seq)}",
+            "price": str(price),
+            "volume": str(volume),
+            "funds": str(funds),
+            "side": order["side"],
+            "created_at": self.now,
+        })
+        order["executed_volume"] = str(float(order["executed_volume"]) + volume)
+        order["remaining_volume"] = str(max(round(float(order["remaining_volume"]) - volume, 8), 0.0))
+        order["paid_fee"] = str(float(order["paid_fee"]) + fee)
+        order["trades_count"] = len(order["trades"])
+
+    def _new_order(self, market: str, side: str, ord_type: str, price: Optional[float], volume: Optional[float]) -> Dict[str, Any]:
+        uuid = f"sim-{next(self._seq)}"
+        order = {
+            "uuid": uuid,
+            "side": side,
+            "ord_type": ord_type,
+            "price": None if price is None else str(price),
+            "state": "wait",
+            "market": market,
+            "created_at": self.now,
+            "volume": None if volume is None else str(volume),
+            "remaining_volume": str(volume or 0.0),
+            "executed_volume": "0",
+            "paid_fee": "0",
+            "trades_count": 0,
+            "trades": [],
+        }
+        self.orders[uuid] = order
+        return order
+
+    @staticmethod
+    def _error(name: str, message: str) -> Dict[str, Any]:
+        return {"error": {"name": name, "message": message}}
+
+    # ---- UpbitClient 인터페이스 ----
+
+    def get_current_price(self, market: str) -> float:
+        with self._lock:
+            if self.process is not None:
+                return self.advance(market)
+            price = self._prices.get(market)
+            if price is None:
+                raise RuntimeError(f"현재가 조회 실패: {market}")
+            return price
+
+    def get_current_prices(self, markets: List[str]) -> Dict[str, float]:
+        with self._lock:
+            if self.process is not None:
+                return {m: self.advance(m) for m in markets}
+            return {m: self._prices[m] for m in markets if m in self._prices}
+
+    def get_krw_balance(self) -> float:
+        with self._lock:
+            return self.krw
+
+    def buy_market(self, market: str, krw: float) -> Dict[str, Any]:
+        with self._lock:
+            price = self._prices.get(market)
+            fee = krw * self.fee_rate
+            if price is None or krw <= 0:
+                return self._error("invalid_parameter_error", f"주문 불가: {market}")
+            if self.krw < krw + fee:
+                return self._error("insufficient_funds_bid", "매수가능금액이 부족합니다.")
+            order = self._new_order(market, "bid", "price", krw, None)
+            volume = krw / price
+            self.krw -= krw + fee
+            self.assets[market] = self.assets.get(market, 0.0) + volume
+            order["remaining_volume"] = str(volume)
+            self._add_trade(order, price, volume, krw, fee)
+            # 시장가 매수는 잔여 금액이 없으므로 실제 API처럼 cancel이 아닌 done으로 마칩니다.
+            order["state"] = "done"
+            return dict(order, trades=[])
+
+    def sell_limit(self, market: str, volume: float, price: float) -> Dict[str, Any]:
+        with self._lock:
+            # 거래소처럼 수량을 소수 8자리로 내린 뒤 보유량과 비교합니다.
+            volume = round_volume(volume, 8)
+            held = self.assets.get(market, 0.0)
+            # 부동소수 오차로 보유량을 아주 조금 넘는 경우는 허용합니다.
+            if volume <= 0 or held + 1e-12 < volume:
+                return self._error("insufficient_funds_ask", "매도가능수량이 부족합니다.")
+            self.assets[market] = max(held - volume, 0.0)
+            order = self._new_order(market, "ask", "limit", price, volume)
+            heapq.heappush(self._asks.setdefault(market, []), (price, next(self._seq), order["uuid"]))
+            self._open_asks.setdefault(market, {})[order["uuid"]] = order
+            # 현재가가 이미 주문가 이상이면 즉시 체결됩니다 (테이커 주문이므로 거래량 제한 없음).
+            current = self._prices.get(market)
+            if current is not None and price <= current:
+                self._match_asks(market, current)
+            return dict(order, trades=[])
+
+    def get_order(self, uuid: str) -> Dict[str, Any]:
+        with self._lock:
+            order = self.orders.get(uuid)
+            if order is None:
+                return {}
+            return dict(order, trades=list(order["trades"]))
+
+    def get_open_orders(self, market: str, page_limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(o, trades=[]) for o in self._open_asks.get(market, {}).values()]
+
+    def wait_order_update(self, uuid: str, timeout: float, poll_interval: float = 1.0) -> None:
+        # 모의 거래소의 주문 상태는 가격 입력 시점에만 바뀌므로 기다리지 않습니다.
+        return
+
+    def cancel_order(self, uuid: str) -> Dict[str, Any]:
+        with self._lock:
+            order = self.orders.get(uuid)
+            if order is None or order["state"] != "wait":
+                raise RuntimeError(f"취소할 수 없는 주문입니다: {uuid}")
+            self._open_asks.get(order["market"], {}).pop(uuid, None)
+            if order["side"] == "ask":
+                self.assets[order["market"]] = self.assets.get(order["market"], 0.0) + float(order["remaining_volume"])
+            order["state"] = "cancel"
+            return dict(order, trades=[])
+
+    def cancel_and_new(self, uuid: str, market: Optional[str], volume: Optional[float], price: float) -> Dict[str, Any]:
+        """
+        대기 중인 지정가 매도 주문을 취소하고 같은 마켓에 새 지정가 매도 주문을 냅니다 (취소 후 재주문 API).
+        UpbitClient.cancel_and_new와 같은 인자를 받으므로 백테스트/벤치마크가 클라이언트 자리에 그대로 넘길 수 있습니다.
+        :param market: 기존 주문의 마켓. None이면 확인하지 않습니다 (REST 대역 서버).
+        :param volume: 새 주문 수량. None이면 기존 주문의 남은 수량(remain_only)
+        """
+        with self._lock:
+            order = self.orders.get(uuid)
+            if order is not None and market is not None and order["market"] != market:
+                return self._error("invalid_parameter_error", f"주문의 마켓이 다릅니다: {uuid} ({order['market']} != {market})")
+            cancelled = self.cancel_order(uuid)
+            if volume is None:
+                volume = float(cancelled["remaining_volume"])
+            new_order = self.sell_limit(cancelled["market"], volume, price)
+            if "error" in new_order:
+                return new_order
+            return dict(cancelled, new_order_uuid=new_order["uuid"])
+
+    # ---- 조회 ----
+
+    def asset_value(self) -> float:
+        """보유 자산(미체결 매도 수량 포함)의 현재가 평가액"""
+        with self._lock:
+            total = 0.0
+            for market, volume in self.assets.items():
+                total += volume * self._prices.get(market, 0.0)
+            for market, asks in self._open_asks.items():
+                price = self._prices.get(market, 0.0)
+                for order in asks.values():
+                    total += float(order["remaining_volume"]) * price
+            return total
+
+    def open_order_count(self) -> int:
+        with self._lock:
+            return sum(len(asks) for asks in self._open_asks.values())
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+캐시 로컬 스냅샷 (SQLite)
+- 미완료 거래와 동기화 워터마크(updated_at)를 디스크에 보관하여,
+  재시작 시 Firestore 전체 조회 대신 워터마크 이후 변경분만 가져오도록 합니다.
+"""
+import json
+import sqlite3
+import threading
+from typing import Optional
+
+
+class TradeSnapshot:
+    """미완료 거래와 동기화 워터마크를 저장하는 SQLite 스냅샷"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trades (buy_uuid TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self) -> tuple[list[dict], Optional[float]]:
+        """저장된 거래 목록과 워터마크를 반환합니다. 저장된 적이 없으면 워터마크는 None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+            if row is None:
+                return [], None
+            trades = [json.loads(data) for (data,) in self._conn.execute("SELECT data FROM trades")]
+            return trades, float(row[0])
+
+    def save(self, trades: list[dict], removed: list[str], watermark: float):
+        """변경된 거래를 저장하고 제거된 거래를 지운 뒤 워터마크를 갱신합니다 (단일 트랜잭션)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO trades (buy_uuid, data) VALUES (?, ?)",
+                [(t['buy_uuid'], json.dumps(t, ensure_ascii=False, separators=(",", ":"))) for t in trades],
+            )
+            self._conn.executemany("DELETE FROM trades WHERE buy_uuid = ?", [(u,) for u in removed])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('watermark', ?)", (repr(watermark),)
+            )
+
+    def reset(self):
+        """전체 재로딩 전에 스냅샷을 비웁니다."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM trades")
+            self._conn.execute("DELETE FROM meta")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 거래 저장소
+- FirestoreTradeDB와 같은 메서드를 로컬 SQLite 파일 하나로 제공합니다 (--store sqlite).
+- 클라우드 자격 증명 없이 재시작 후에도 거래가 남으므로 단일 호스트 운용과 테스트에 씁니다.
+- 같은 파일을 여러 프로세스가 열 수 있으므로 쓰기는 BEGIN IMMEDIATE 트랜잭션으로 처리합니다 (같은 호스트의 분할 실행 lease 포함).
+"""
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from .shard import claim_lease
+
+
+def _dumps(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SqliteTradeDB:
+    """로컬 SQLite 파일에 거래를 보관하는 저장소"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # 트랜잭션은 _transaction()에서 직접 시작합니다.
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trades ("
+            "buy_uuid TEXT PRIMARY KEY, market TEXT, state TEXT, updated_at REAL, data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trades_state_market ON trades (state, market)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trades_updated_at ON trades (updated_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leases (market TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        print(f"SQLite 거래 저장소에 연결되었습니다: {path}")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _merge(self, conn: sqlite3.Connection, data: dict):
+        """Firestore의 set(merge=True)처럼 기존 필드 위에 덮어씁니다."""
+        doc_id = data['buy_uuid']
+        row = conn.execute("SELECT data FROM trades WHERE buy_uuid = ?", (doc_id,)).fetchone()
+        merged = json.loads(row[0]) if row else {}
+        merged.update(data)
+        conn.execute(
+            "INSERT OR REPLACE INTO trades (buy_uuid, market, state, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+            (doc_id, merged.get('market'), merged.get('state'), merged.get('updated_at'), _dumps(merged)),
+        )
+
+    def upsert_trade(self, data: dict):
+        if not data.get('buy_uuid'):
+            print("오류: 'buy_uuid'가 데이터에 포함되어야 합니다.")
+            return False
+        try:
+            with self._transaction() as conn:
+                self._merge(conn, data)
+            return True
+        except Exception as e:
+            print(f"SQLite Upsert 오류 ({data.get('buy_uuid')}): {e}")
+            return False
+
+    def upsert_trades_batch(self, items: list[dict]) -> bool:
+        try:
+            with self._transaction() as conn:
+                for data in items:
+                    if not data.get('buy_uuid'):
+                        print("오류: 'buy_uuid'가 없는 거래는 배치에서 제외합니다.")
+                        continue
+                    self._merge(conn, data)
+            return True
+        except Exception as e:
+            print(f"SQLite 배치 Upsert 오류 ({len(items)}건): {e}")
+            return False
+
+    def _select(self, where: str, params: tuple) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT data FROM trades WHERE {where}", params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get_all_pending_trades(self) -> list[dict]:
+        return self._select("state IS NOT 'done'", ())
+
+    def get_trades_updated_since(self, updated_at: float) -> list[dict] | None:
+        try:
+            return self._select("updated_at > ?", (updated_at,))
+        except Exception as e:
+            print(f"SQLite '변경분 조회' 오류: {e}")
+            return None
+
+    def get_pending_trades_by_market(self, market: str) -> list[dict]:
+        return self._select("state = 'waiting' AND market = ?", (market,))
+
+    # ---- 분할 실행 lease ----
+
+    def try_acquire_lease(self, market: str, worker_id: str, ttl_sec: float, now: float) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM leases WHERE market = ?", (market,)).fetchone()
+            lease = claim_lease(json.loads(row[0]) if row else None, market, worker_id, ttl_sec, now)
+            if lease is None:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (market, data) VALUES (?, ?)", (market, _dumps(lease)))
+            return True
+
+    def release_lease(self, market: str, worker_id: str) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM leases WHERE market = ?", (market,)).fetchone()
+            lease: Optional[dict] = json.loads(row[0]) if row else None
+            if not lease or lease.get('owner') != worker_id:
+                return False
+            lease.update(owner=None, expires_at=0)
+            conn.execute("UPDATE leases SET data = ? WHERE market = ?", (_dumps(lease), market))
+            return True
+
+    def get_leases(self) -> list[dict]:
+        with self._lock:
+            return [json.loads(data) for (data,) in self._conn.execute("SELECT data FROM leases")]
+
+    def publish_worker(self, worker_id: str, status: dict) -> bool:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (worker_id, data) VALUES (?, ?)", (worker_id, _dumps(status)))
+        return True
+
+    def get_workers(self) -> list[dict]:
+        with self._lock:
+            return [json.loads(data) for (data,) in self._conn.execute("SELECT data FROM workers")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+자동 거래 금액 모드 tier 테이블 파라미터 스윕
+- 그리드 JSON으로 만든 tier 테이블 조합을 프로세스 풀에서 백테스트합니다.
+- 각 워커는 캔들 파일을 한 번만 읽어 메모리에 두고 여러 조합에 재사용합니다.
+- 결과는 sha256(데이터 파일 + 파라미터) 키로 캐시 디렉터리에 저장되어, 같은 조합은 다시 계산하지 않습니다.
+
+그리드 예)
+{
+  "base": {"interval": 60, "initial_krw": 10000000, "fee": 0.0005},
+  "tiers": [
+    {"max_orders": 10, "skip_buy_within_ratio": [0.1, 0.2, 0.3], "tp_ratio": [1.5, 2.0], "divisor": 100},
+    {"max_orders": 30, "skip_buy_within_ratio": 0.25, "tp_ratio": [1.0, 1.2], "divisor": 70},
+    ...
+  ]
+}
+값이 목록인 항목은 모든 조합을 만들고, "tables"에 테이블 목록을 직접 줄 수도 있습니다.
+
+예) python -m app.sweep --data KRW-BTC_1m.csv --market KRW-BTC --grid grid.json --jobs 8
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, Optional
+
+from .backtest import Candle, read_candles, run_backtest
+from .config import Settings
+from .tiers import TierTable, make_tier_table, tier_table_to_json
+
+log = logging.getLogger("trade")
+
+_BASE_DEFAULTS = {
+    "interval": 60,
+    "initial_krw": 10_000_000.0,
+    "fee": 0.0005,
+    "max_order_count": 10,
+    "skip_buy_within": 0.3,
+}
+
+# 워커 프로세스마다 한 번 읽어 둔 캔들
+_CANDLES: Optional[list[Candle]] = None
+
+
+def dataset_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_key(digest: str, params: Dict[str, Any]) -> str:
+    raw = digest + json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _as_list(value: Any) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def expand_grid(grid: Dict[str, Any]) -> Iterator[TierTable]:
+    """그리드 정의에서 유효한 tier 테이블을 차례로 만듭니다. 검증에 실패한 조합은 건너뜁니다."""
+    for rows in grid.get("tables", []):
+        yield make_tier_table(rows)
+    rows_spec = grid.get("tiers")
+    if not rows_spec:
+        return
+    fields = ("max_orders", "skip_buy_within_ratio", "tp_ratio", "divisor")
+    per_row = [
+        list(itertools.product(*[_as_list(row[f]) for f in fields]))
+        for row in rows_spec
+    ]
+    for rows in itertools.product(*per_row):
+        try:
+            yield make_tier_table(rows)
+        except ValueError:
+            continue
+
+
+def _init_worker(data_path: str):
+    global _CANDLES
+    # 수천 번 반복되는 매매 로그는 출력하지 않습니다 (실패는 결과 요약으로 확인).
+    logging.disable(logging.CRITICAL)
+    _CANDLES = list(read_candles(data_path))
+
+
+def evaluate(params: Dict[str, Any]) -> Dict[str, Any]:
+    """워커에서 실행: 파라미터 하나로 백테스트하고 요약(시계열 제외)을 반환합니다."""
+    cfg = Settings(
+        access_key="",
+        secret_key="",
+        market=[params["market"]],
+        krw=0.0,
+        interval_sec=int(params["interval"]),
+        tp_ratio=0.0,
+        firestore_credential_path="",
+        skip_buy_within_ratio=float(params["skip_buy_within"]),
+        buy_fill_timeout_sec=0.0,
+        max_order_count=int(params["max_order_count"]),
+        tier_table=make_tier_table(params["tier_table"]),
+    )
+    started = time.perf_counter()
+    report = run_backtest(cfg, _CANDLES, initial_krw=float(params["initial_krw"]), fee_rate=float(params["fee"]))
+    report.pop("series", None)
+    report["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+class ResultCache:
+    """키별 JSON 파일로 저장하는 결과 캐시 (메인 프로세스에서만 씁니다)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, ensure_ascii=False)
+        os.replace(tmp, self._path(key))
+
+
+def run_sweep(
+    data_path: str,
+    market: str,
+    grid: Dict[str, Any],
+    jobs: int = 0,
+    cache_dir: str = ".sweep_cache",
+) -> list[Dict[str, Any]]:
+    """그리드 전체를 평가하여 [{"params", "result", "cached"}] 목록을 반환합니다."""
+    base = dict(_BASE_DEFAULTS, **grid.get("base", {}))
+    digest = dataset_digest(data_path)
+    cache = ResultCache(cache_dir)
+
+    entries: list[Dict[str, Any]] = []
+    todo: list[Dict[str, Any]] = []
+    seen = set()
+    for table in expand_grid(grid):
+        params = dict(base, market=market, tier_table=tier_table_to_json(table))
+        key = params_key(digest, params)
+        if key in seen:
+            continue
+        seen.add(key)
+        entry = {"key": key, "params": params, "result": cache.get(key), "cached": True}
+        entries.append(entry)
+        if entry["result"] is None:
+            entry["cached"] = False
+            todo.append(entry)
+
+    log.info(f"스윕 조합 {len(entries)}개 (캐시 적중 {len(entries) - len(todo)}개, 계산 {len(todo)}개)")
+    if todo:
+        started = time.monotonic()
+        with ProcessPoolExecutor(
+            max_workers=jobs or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(data_path,),
+        ) as pool:
+            futures = {pool.submit(evaluate, e["params"]): e for e in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                entry = futures[future]
+                try:
+                    entry["result"] = future.result()
+                except Exception as e:
+                    log.error(f"백테스트 실패 ({entry['key'][:12]}): {e}")
+                    continue
+                cache.put(entry["key"], entry["result"])
+                if done % 50 == 0 or done == len(todo):
+                    elapsed = time.monotonic() - started
+                    log.info(f"진행 {done}/{len(todo)} ({elapsed:.0f}초, 남은 예상 {elapsed / done * (len(todo) - done):.0f}초)")
+    return [e for e in entries if e["result"] is not None]
+
+
+def rank(entries: list[Dict[str, Any]], rank_by: str = "final_equity") -> list[Dict[str, Any]]:
+    return sorted(entries, key=lambda e: e["result"].get(rank_by) or 0.0, reverse=True)
+
+
+def _format_tiers(table: list[dict]) -> str:
+    return " ".join(
+        f"<{t['max_orders']}:{t['skip_buy_within_ratio']:g}/{t['tp_ratio']:g}/{t['divisor']}" for t in table
+    )
+
+
+def format_report(ranked: list[Dict[str, Any]], top: int = 20) -> str:
+    lines = [f"{'순위':>4} {'수익률%':>9} {'실현손익':>12} {'최대자본':>12} {'매수':>6} {'매도':>6}  tier(<max:skip/tp/divisor)"]
+    for i, entry in enumerate(ranked[:top], 1):
+        r = entry["result"]
+        lines.append(
+            f"{i:>4} {r['return_pct']:>9.3f} {r['realized_pnl']:>12.0f} {r['max_capital_in_use']:>12.0f}"
+            f" {r['buys']:>6} {r['sells']:>6}  {_format_tiers(entry['params']['tier_table'])}"
+        )
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="자동 거래 금액 모드 tier 테이블 파라미터 스윕")
+    p.add_argument("--data", required=True, help="분봉/체결 CSV 파일")
+    p.add_argument("--market", required=True, help="예: KRW-BTC")
+    p.add_argument("--grid", required=True, help="그리드 정의 JSON 파일")
+    p.add_argument("--jobs", type=int, default=0, help="프로세스 수 (0이면 CPU 수)")
+    p.add_argument("--cache-dir", type=str, default=".sweep_cache", help="결과 캐시 디렉터리")
+    p.add_argument("--rank-by", type=str, default="final_equity", help="정렬 기준 결과 필드 (예: final_equity, realized_pnl)")
+    p.add_argument("--top", type=int, default=20, help="출력할 상위 조합 수")
+    p.add_argument("--out", type=str, default="", help="전체 순위 결과 JSON 파일 경로")
+    return p
+
+
+def main():
+    args = build_parser().parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    with open(args.grid, encoding="utf-8") as fp:
+        grid = json.load(fp)
+    ranked = rank(run_sweep(args.data, args.market, grid, jobs=args.jobs, cache_dir=args.cache_dir), args.rank_by)
+    print(format_report(ranked, args.top))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump(
+                [{"rank": i, "params": e["params"], "result": e["result"]} for i, e in enumerate(ranked, 1)],
+                fp,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+사이클 단위 현재가 스냅샷
+- 설정된 모든 마켓의 현재가를 한 번의 멀티 마켓 요청으로 가져와 TTL 동안 공유합니다.
+- on_prices가 설정되면 새로 조회하거나 스트림으로 받은 가격을 그때마다 넘깁니다 (공유 시세 파일 기록용).
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .upbit_client import UpbitClient
+
+log = logging.getLogger("trade")
+
+
+class TickerSnapshot:
+    """
+    여러 마켓 워커가 같은 가격 벡터를 보도록 현재가를 캐시합니다.
+    가격의 신선도는 마켓별로 관리합니다. Upbit ticker 스트림은 체결이 있을 때만 오므로,
+    거래가 뜸한 마켓은 다른 마켓이 스트리밍 중이어도 TTL이 지나면 REST로 다시 조회합니다.
+    """
+
+    def __init__(self, client: UpbitClient, markets: list[str], ttl_sec: float = 10.0):
+        self.client = client
+        self.markets = list(markets)
+        self.ttl_sec = ttl_sec
+        self._prices: Dict[str, float] = {}
+        # market -> 마지막으로 가격을 받은 시각 (REST 조회 또는 스트림)
+        self._fetched_at: Dict[str, float] = {}
+        # market -> 마지막 ticker 스트림 수신 시각
+        self._streamed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # 새 가격을 받을 콜백. 락 안에서 호출하므로 콜백끼리는 동시에 실행되지 않습니다.
+        self.on_prices: Optional[Callable[[Dict[str, float]], None]] = None
+
+    def refresh(self, markets: Optional[list[str]] = None) -> Dict[str, float]:
+        """markets(기본: 모든 마켓)의 현재가를 한 번의 요청으로 다시 조회합니다."""
+        with self._lock:
+            self._refresh_locked(self.markets if markets is None else markets)
+            return dict(self._prices)
+
+    def _refresh_locked(self, markets: list[str]):
+        if not markets:
+            return
+        prices = self.client.get_current_prices(markets)
+        now = time.monotonic()
+        self._prices.update(prices)
+        for market in prices:
+            self._fetched_at[market] = now
+        self._notify(prices)
+
+    def _notify(self, prices: Dict[str, float]):
+        if self.on_prices is None:
+            return
+        try:
+            self.on_prices(prices)
+        except Exception as e:
+            log.error(f"현재가 콜백 오류: {e}")
+
+    def update(self, market: str, price: float):
+        """WebSocket ticker 이벤트로 받은 가격을 반영합니다. 해당 마켓의 신선도만 갱신합니다."""
+        with self._lock:
+            now = time.monotonic()
+            self._prices[market] = price
+            self._fetched_at[market] = now
+            self._streamed_at[market] = now
+            self._notify({market: price})
+
+    def is_streaming(self, market: Optional[str] = None) -> bool:
+        """market(기본: 모든 마켓)이 최근 TTL 안에 ticker 이벤트를 받았는지 여부"""
+        now = time.monotonic()
+        markets = self.markets if market is None else [market]
+        return all(now - self._streamed_at.get(m, -float("inf")) <= self.ttl_sec for m in markets)
+
+    def stale_markets(self) -> list[str]:
+        """TTL 안에 가격을 받지 못한 마켓"""
+        now = time.monotonic()
+        return [m for m in self.markets if now - self._fetched_at.get(m, -float("inf")) > self.ttl_sec]
+
+    def prices(self) -> Dict[str, float]:
+        """TTL 안의 마켓은 캐시된 가격을, 만료된 마켓만 모아 한 번에 새로 조회한 가격을 반환합니다."""
+        with self._lock:
+            self._refresh_locked(self.stale_markets())
+            return dict(self._prices)
+
+    def age(self, market: Optional[str] = None) -> Optional[float]:
+        """market(기본: 가장 오래된 마켓)의 마지막 조회 이후 경과 시간(초). 아직 조회하지 않았다면 None."""
+        markets = self.markets if market is None else [market]
+        fetched = [self._fetched_at.get(m) for m in markets]
+        if not fetched or any(t is None for t in fetched):
+            return None
+        return time.monotonic() - min(fetched)
+
+    def get_price(self, market: str) -> float:
+        price = self.prices().get(market)
+        if price is None:
+            # 스냅샷에 없는 마켓은 단건 조회로 대체합니다.
+            log.warning(f"[{market}] 현재가 스냅샷에 없는 마켓이므로 단건 조회합니다.")
+            return self.client.get_current_price(market)
+        return price
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+자동 거래 금액 모드(--krw 0)의 구간(tier) 테이블
+- 전체 대기 주문 수(all_order_count)에 따라 매수 스킵 비율, 익절 비율, 주문 금액 분모를 정합니다.
+- 행은 max_orders 오름차순이며, all_order_count < max_orders 인 첫 행이 적용됩니다.
+- 마지막 행의 max_orders 이상이면 마지막 행의 비율을 쓰고 남은 잔액 전부를 주문합니다.
+"""
+import bisect
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Iterable, Optional
+
+
+@dataclass(frozen=True)
+class Tier:
+    max_orders: int  # 이 값 미만의 대기 주문 수에 적용
+    skip_buy_within_ratio: float  # 최저 매도가 대비 X% 이내면 매수 스킵
+    tp_ratio: float  # 익절 비율 (1.0 == +1%)
+    divisor: int  # 주문 금액 = 잔액 / (divisor - 대기 주문 수)
+
+
+TierTable = tuple[Tier, ...]
+
+DEFAULT_TIER_TABLE: TierTable = (
+    Tier(10, 0.2, 2.0, 100),
+    Tier(30, 0.25, 1.2, 70),
+    Tier(60, 0.5, 1.0, 80),
+    Tier(80, 1.0, 1.5, 90),
+    Tier(100, 1.5, 2.0, 100),
+)
+
+# 고정 금액 모드(--krw > 0)에서 쓰는 매수 스킵 비율과 스킵 구간 계산용 익절 비율 (%)
+FIXED_SKIP_BUY_WITHIN_RATIO = 0.25
+FIXED_TP_RATIO = 1.2
+
+_FIELDS = ("max_orders", "skip_buy_within_ratio", "tp_ratio", "divisor")
+
+
+def make_tier_table(rows: Iterable[Any]) -> TierTable:
+    """
+    dict({"max_orders": .., ...}) 또는 [max_orders, skip, tp, divisor] 목록으로 테이블을 만들고 검증합니다.
+    """
+    table = []
+    for row in rows:
+        if isinstance(row, Tier):
+            tier = row
+        elif isinstance(row, dict):
+            tier = Tier(**{k: row[k] for k in _FIELDS})
+        else:
+            tier = Tier(*row)
+        table.append(Tier(int(tier.max_orders), float(tier.skip_buy_within_ratio), float(tier.tp_ratio), int(tier.divisor)))
+    if not table:
+        raise ValueError("tier 테이블이 비어 있습니다.")
+    prev = 0
+    for tier in table:
+        if tier.max_orders <= prev:
+            raise ValueError(f"tier의 max_orders는 0보다 크고 오름차순이어야 합니다: {tier}")
+        # 구간 안의 모든 주문 수에서 분모(divisor - all_order_count)가 1 이상이어야 합니다.
+        if tier.divisor < tier.max_orders:
+            raise ValueError(f"tier의 divisor는 max_orders 이상이어야 합니다: {tier}")
+        prev = tier.max_orders
+    return tuple(table)
+
+
+def load_tier_table(path: str) -> TierTable:
+    """JSON 파일(행 목록 또는 {"tiers": [...]})에서 테이블을 읽습니다."""
+    with open(path, encoding="utf-8") as fp:
+        data = json.load(fp)
+    if isinstance(data, dict):
+        data = data["tiers"]
+    return make_tier_table(data)
+
+
+def tier_table_to_json(table: TierTable) -> list[dict]:
+    return [asdict(t) for t in table]
+
+
+def select_tier(table: TierTable, all_order_count: int) -> Optional[Tier]:
+    """적용할 구간을 반환합니다. 마지막 구간 이상이면 None (잔액 전부 주문)."""
+    i = bisect.bisect_right([t.max_orders for t in table], all_order_count)
+    return table[i] if i < len(table) else None
+
+
+def tier_ratios(table: TierTable, all_order_count: int) -> tuple[float, float]:
+    """(skip_buy_within_ratio, tp_ratio). 마지막 구간 이상이면 마지막 행의 비율을 사용합니다."""
+    tier = select_tier(table, all_order_count) or table[-1]
+    return tier.skip_buy_within_ratio, tier.tp_ratio
+
+
+def cycle_ratios(table: TierTable, auto_price_mode: bool, all_order_count: int) -> tuple[float, float]:
+    """run_once가 매수 스킵 판단에 쓰는 (skip_buy_within_ratio, tp_ratio)."""
+    if auto_price_mode:
+        return tier_ratios(table, all_order_count)
+    return FIXED_SKIP_BUY_WITHIN_RATIO, FIXED_TP_RATIO
@@ -1,141 +1,162 @@
 
 # -*- coding: utf-8 -*-
 import logging
+import threading
 import time
-from typing import Any, Dict, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 from .config import Settings
 from .upbit_client import UpbitClient
-from .util import round_price_to_tick, round_volume
-from .firestore_trade_db import FirestoreTradeDB, FirestoreCache
+from .util import round_price_to_tick, round_prices_to_tick, round_volume
+from .tiers import cycle_ratios, select_tier
+from .ticker_snapshot import TickerSnapshot
+from .ws_events import OrderEventHub
+from .ledger import BalanceLedger
+from .triggers import MarketTriggers
+from .pnl import PnLAggregator
+from .shard import LeaseGuardedCache, LeaseLostError, ShardCoordinator
+from .market_data import MarketDataWriter
+from .events import FILL, LOWEST_TRADE, ORDER_CHECK, ORDER_PLACED, PRICE, REPRICE, SKIP, EventJournal, emit, set_journal, start_log_listener
+from .sim_exchange import PriceProcess, SimExchange
+from . import metrics
+from .metrics import BUY_FILL_WAIT_SECONDS, CYCLE_SECONDS, MetricsServer, PhaseTimer, timed
+from .firestore_trade_db import FirestoreCache
 
 log = logging.getLogger("trade")
 
+# 매도 체결 반영이 주문 확인 사이클과 체결 이벤트에서 중복되지 않도록 하는 잠금
+_settle_lock = threading.Lock()
 
-def run_once(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: str, last_buy_price: Optional[float] = None) -> Optional[float]:
+
+def run_once(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: str, last_buy_price: Optional[float] = None, ticker: Optional[TickerSnapshot] = None, ledger: Optional[BalanceLedger] = None) -> Optional[float]:
+    # 단계별 소요 시간을 지표로 남긴다 (coinbox_cycle_phase_seconds).
+    phases = PhaseTimer()
     auto_price_mode = cfg.krw == 0
     all_order_count = db.get_waiting_trade_count_all_market()
 
-    skip_buy_within_ratio = 0.25
-    tp_ratio = 1.2
     if auto_price_mode:
-        log.warning(f"자동 거래 금액 모드 입니다. 현재 대기중인 주문수는 {all_order_count}개 입니다.")
-        if all_order_count < 10:
-            skip_buy_within_ratio = 0.2
-            tp_ratio = 2.0
-        elif all_order_count < 30:
-            skip_buy_within_ratio = 0.25
-            tp_ratio = 1.2
-        elif all_order_count < 60:
-            skip_buy_within_ratio = 0.5
-            tp_ratio = 1.0
-        elif all_order_count < 80:
-            skip_buy_within_ratio = 1.0
-            tp_ratio = 1.5
-        else:
-            skip_buy_within_ratio = 1.5
-            tp_ratio = 2.0
+        log.warning("자동 거래 금액 모드 입니다. 현재 대기중인 주문수는 %d개 입니다.", all_order_count)
+    skip_buy_within_ratio, tp_ratio = cycle_ratios(cfg.tier_table, auto_price_mode, all_order_count)
 
     check_pending_sell_orders(cfg, client, db, market)
+    phases.mark("check_pending")
     all_pending_count = db.get_waiting_trade_count_all_market()
-    log.info(f"현재 대기중 전체 거래 갯수 {all_pending_count}")
+    log.info("현재 대기중 전체 거래 갯수 %d", all_pending_count)
     
-    price = client.get_current_price(market)
-    log.info(f"[{market}] 현재가: {price:.8f} KRW")
+    # 스냅샷이 있으면 같은 사이클의 모든 마켓이 동일한 가격 벡터를 사용한다.
+    price = ticker.get_price(market) if ticker is not None else client.get_current_price(market)
+    emit(PRICE, market, price=price)
+    log.info("[%s] 현재가: %.8f KRW", market, price)
+    phases.mark("price")
     
     # Firestore에서 대기중인 가장 낮은 매수가를 가져와 비교
     waiting_count = db.get_waiting_trades_count_by_market(market)
     if waiting_count < 15:
         _modify_loss_order(cfg, client, db, market)
+    phases.mark("modify_loss")
 
     if waiting_count > 0:
         if skip_buy_within_ratio > 0:
             min_price_trade = db.get_min_price_waiting_trade(market)
-            log.info(f"Firestore 최저가 거래 정보: {min_price_trade}")
             if min_price_trade:
                 lowest_buy_price = min_price_trade.get('buy_price')
                 lowest_sell_price = min_price_trade.get('sell_price')
-                log.info(f"buy_price: {lowest_buy_price}, sell_price: {lowest_sell_price}")
+                emit(
+                    LOWEST_TRADE, market, debug=True,
+                    buy_uuid=min_price_trade.get('buy_uuid'), buy_price=lowest_buy_price, sell_price=lowest_sell_price,
+                )
                 if lowest_buy_price and lowest_buy_price > 0:
                     diff_ratio = abs(price - lowest_sell_price) / lowest_sell_price * 100.0
-                    if waiting_count > 1:
-                        if diff_ratio <= skip_buy_within_ratio + tp_ratio:
-                            log.info(
-                                f"현재가({price:.8f})가 Firestore의 최저 매수가({lowest_buy_price:.8f}) 대비 "
-                                f"변동 {diff_ratio:.4f}% <= {skip_buy_within_ratio:.4f}% 이므로 매수를 건너뜁니다."
-                            )
-                            return last_buy_price
-                    if waiting_count == 1:
-                        if diff_ratio <= skip_buy_within_ratio + tp_ratio and diff_ratio > skip_buy_within_ratio:
-                            log.info(
-                                f"현재가({price:.8f})가 Firestore의 최저 매수가({lowest_buy_price:.8f}) 대비 "
-                                f"변동 {diff_ratio:.4f}% <= {skip_buy_within_ratio:.4f}% 이므로 매수를 건너뜁니다."
-                            )
-                            return last_buy_price
-
-    # 최소 주문금액 체크
-    krw_balance = client.get_krw_balance()
-    log.info(f"보유 KRW: {krw_balance:.8f} KRW")
-
+                    if (waiting_count > 1 and diff_ratio <= skip_buy_within_ratio + tp_ratio) or (
+                        waiting_count == 1 and skip_buy_within_ratio < diff_ratio <= skip_buy_within_ratio + tp_ratio
+                    ):
+                        emit(
+                            SKIP, market, reason="near_lowest", price=price, lowest_buy_price=lowest_buy_price,
+                            lowest_sell_price=lowest_sell_price, diff_ratio=diff_ratio, skip_ratio=skip_buy_within_ratio,
+                            tp_ratio=tp_ratio, waiting_count=waiting_count,
+                        )
+                        log.info(
+                            "현재가(%.8f)가 Firestore의 최저 매수가(%.8f) 대비 변동 %.4f%% <= %.4f%% 이므로 매수를 건너뜁니다.",
+                            price, lowest_buy_price, diff_ratio, skip_buy_within_ratio,
+                        )
+                        phases.mark("skip_check")
+                        return last_buy_price
+
+    phases.mark("skip_check")
+
+    # 최소 주문금액 체크 및 시장가 매수
+    # 잔고는 로컬 장부에서 확인하고, 여러 마켓이 같은 잔고로 중복 매수하지 않도록 주문 금액을 예약한다.
+    if ledger is None:
+        ledger = BalanceLedger(client, reconcile_interval_sec=0)
+    krw_balance = ledger.available()
+    log.info("보유 KRW: %.8f KRW", krw_balance)
+
+    order_price: Optional[float] = None
     if auto_price_mode:
         if krw_balance < 10000:
-            log.warning(f"보유 KRW({krw_balance:.0f}) 이므로 매수를 건너뛰고, 기존 주문 변경을 시도합니다.")
-            _modify_highest_price_order(cfg, client, db, market, price)
-            return last_buy_price
+            emit(SKIP, market, reason="balance", krw_balance=krw_balance, all_order_count=all_order_count)
+            log.warning("보유 KRW(%.0f) 이므로 매수를 건너뛰고, 기존 주문 변경을 시도합니다.", krw_balance)
+        else:
+            order_price = _compute_order_price(cfg, krw_balance, all_order_count, ledger.share())
     else:
         if krw_balance < cfg.krw or waiting_count > cfg.max_order_count:
-            log.warning(f"보유 KRW({krw_balance:.0f}) < 구매금액({cfg.krw:.0f}) 또는 최대 주문 개수 초과({waiting_count} > {cfg.max_order_count})이므로 매수를 건너뛰고, 기존 주문 변경을 시도합니다.")
-            _modify_highest_price_order(cfg, client, db, market, price)
-            return last_buy_price
+            emit(
+                SKIP, market, reason="balance" if krw_balance < cfg.krw else "max_orders",
+                krw_balance=krw_balance, krw=cfg.krw, waiting_count=waiting_count, max_order_count=cfg.max_order_count,
+            )
+            log.warning(
+                "보유 KRW(%.0f) < 구매금액(%.0f) 또는 최대 주문 개수 초과(%d > %d)이므로 매수를 건너뛰고, 기존 주문 변경을 시도합니다.",
+                krw_balance, cfg.krw, waiting_count, cfg.max_order_count,
+            )
+        else:
+            order_price = _compute_order_price(cfg, krw_balance, all_order_count)
 
-    # 1) 시장가 매수
+    if order_price is not None and not ledger.reserve(order_price):
+        emit(SKIP, market, reason="reserved", order_price=order_price, krw_balance=krw_balance)
+        log.warning("다른 마켓의 매수 예약으로 KRW가 부족하여(%.0f) 매수를 건너뛰고, 기존 주문 변경을 시도합니다.", order_price)
+        order_price = None
+    phases.mark("balance")
 
-    order_price = 10000
-    if auto_price_mode:
-        #all_order_count = db.get_waiting_trade_count_all_market()
-        log.warning(f"자동 거래 금액 모드 입니다. 현재 대기중인 주문수는 {all_order_count}개 입니다.")
-        if all_order_count >= 100:
-            order_price = krw_balance // 10000 * 10000
-            log.warning(f"대기중인 주문이 90개 이상으로, 남은 잔액 {order_price} 만큰 주문합니다.")
-        else:
-            if all_order_count < 10:
-                order_price = (krw_balance / (100 - all_order_count)) // 10000 * 10000
-                log.warning(f"남은 잔액 ({krw_balance})과 가능한 주문수 ${100 -all_order_count}개 비례하여 {order_price} 만큼 주문합니다.")
-            elif all_order_count < 30:
-                order_price = (krw_balance / (70 - all_order_count)) // 10000 * 10000
-                log.warning(f"남은 잔액 ({krw_balance})과 가능한 주문수 ${100 -all_order_count}개 비례하여 {order_price} 만큼 주문합니다.")
-            elif all_order_count < 60:
-                order_price = (krw_balance / (80 - all_order_count)) // 10000 * 10000
-                log.warning(f"남은 잔액 ({krw_balance})과 가능한 주문수 ${100 -all_order_count}개 비례하여 {order_price} 만큼 주문합니다.")
-            elif all_order_count < 80:
-                order_price = (krw_balance / (90 - all_order_count)) // 10000 * 10000
-                log.warning(f"남은 잔액 ({krw_balance})과 가능한 주문수 ${100 -all_order_count}개 비례하여 {order_price} 만큼 주문합니다.")
-            else:
-                order_price = (krw_balance / (100 - all_order_count)) // 10000 * 10000
-                log.warning(f"남은 잔액 ({krw_balance})과 가능한 주문수 ${100 -all_order_count}개 비례하여 {order_price} 만큼 주문합니다.")
-    else:
-        order_price = cfg.krw
+    if order_price is None:
+        _modify_highest_price_order(cfg, client, db, market, price)
+        phases.mark("modify_highest")
+        return last_buy_price
 
-    buy_res = client.buy_market(market, order_price)
-    log.info(f"시장가 매수 요청: {buy_res}")
+    # 1) 시장가 매수
+    try:
+        buy_res = client.buy_market(market, order_price)
+    except Exception:
+        ledger.release(order_price)
+        ledger.invalidate()
+        raise
+    ordered_epoch = ledger.mark_ordered()
+    phases.mark("buy")
     buy_uuid = buy_res.get("uuid")
+    emit(ORDER_PLACED, market, side="bid", uuid=buy_uuid, amount=order_price, error=str(buy_res["error"]) if "error" in buy_res else None)
+    log.info("[%s] 시장가 매수 요청: %.0f KRW, uuid=%s", market, order_price, buy_uuid)
     if not buy_uuid:
         log.error("매수 주문 응답에 uuid가 없어 매도를 진행할 수 없습니다: %s", buy_res)
+        ledger.release(order_price)
+        ledger.invalidate()
         return last_buy_price
 
     # 1-1) 체결 결과 대기 (시장가 주문이므로 보통 즉시 완료되지만 부분체결 고려)
     executed_volume: Optional[float]
     avg_buy_price: Optional[float]
     buy_amount: Optional[float]
-    if cfg.dry_run:
-        executed_volume = round_volume(cfg.krw / price, 8)
-        avg_buy_price = price
-        buy_amount = cfg.krw
-    else:
-        executed_volume, avg_buy_price, buy_amount = wait_for_buy_fill(cfg, client, buy_uuid)
-        if executed_volume is None or executed_volume <= 0:
-            log.warning("매수 주문 체결 정보를 가져오지 못해 매도를 건너뜁니다. uuid=%s", buy_uuid)
-            return last_buy_price
+    # 드라이런도 모의 거래소의 체결 내역으로 같은 경로를 거친다.
+    executed_volume, avg_buy_price, buy_amount = wait_for_buy_fill(cfg, client, buy_uuid)
+    phases.mark("fill_wait")
+    if executed_volume is None or executed_volume <= 0:
+        log.warning("매수 주문 체결 정보를 가져오지 못해 매도를 건너뜁니다. uuid=%s", buy_uuid)
+        # 체결 여부를 알 수 없으므로 다음 조회에서 실제 잔고와 맞춘다.
+        ledger.release(order_price)
+        ledger.invalidate()
+        return last_buy_price
+
+    ledger.settle_buy(order_price, buy_amount if buy_amount is not None else order_price, ordered_epoch)
+    emit(FILL, market, side="bid", uuid=buy_uuid, volume=executed_volume, avg_price=avg_buy_price, amount=buy_amount)
 
     log.info(
         "매수 체결 결과: volume=%.8f, avg_price=%.8f, buy_amount=%.0f",
@@ -153,7 +174,12 @@ def run_once(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: s
         market=market,
     )
     sell_res = client.sell_limit(market, volume, target_price)
-    log.info(f"익절 지정가 매도 요청: price={target_price}, volume={volume} -> {sell_res}")
+    phases.mark("sell")
+    emit(
+        ORDER_PLACED, market, side="ask", uuid=sell_res.get('uuid'), price=target_price, volume=volume,
+        buy_uuid=buy_uuid, error=str(sell_res['error']) if 'error' in sell_res else None,
+    )
+    log.info("익절 지정가 매도 요청: price=%s, volume=%s, uuid=%s", target_price, volume, sell_res.get('uuid'))
 
     # 매수/매도 거래 정보를 Firestore에 기록
     trade_data = {
@@ -170,11 +196,37 @@ def run_once(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: s
         'market': market,
     }
     db.upsert_trade(trade_data)
-    log.info(f"Firestore에 거래 정보 업데이트: buy_uuid={buy_uuid}")
+    phases.mark("persist")
+    log.info("Firestore에 거래 정보 업데이트: buy_uuid=%s", buy_uuid)
 
     return avg_buy_price if avg_buy_price is not None else price
 
 
+def _compute_order_price(cfg: Settings, krw_balance: float, all_order_count: int, share: float = 1.0) -> float:
+    """
+    보유 KRW와 전체 대기 주문 수로 이번 매수 금액을 계산합니다.
+    :param share: krw_balance가 계좌 잔고 중 이 워커 몫이면 그 비율. 남은 주문 수도 같은 비율로 나눠 주문 금액이 분할 전과 같게 합니다.
+    """
+    auto_price_mode = cfg.krw == 0
+    order_price = 10000
+    if auto_price_mode:
+        #all_order_count = db.get_waiting_trade_count_all_market()
+        log.warning("자동 거래 금액 모드 입니다. 현재 대기중인 주문수는 %d개 입니다.", all_order_count)
+        tier = select_tier(cfg.tier_table, all_order_count)
+        if tier is None:
+            order_price = krw_balance // 10000 * 10000
+            log.warning("대기중인 주문이 %d개 이상으로, 남은 잔액 %s 만큼 주문합니다.", cfg.tier_table[-1].max_orders, order_price)
+        else:
+            slots = (tier.divisor - all_order_count) * share
+            order_price = (krw_balance / slots) // 10000 * 10000 if slots > 0 else 0
+            log.warning("남은 잔액 (%s)과 가능한 주문수 %d개 비례하여 %s 만큼 주문합니다.", krw_balance, tier.divisor - all_order_count, order_price)
+    else:
+        order_price = cfg.krw
+
+    return order_price
+
+
+@timed(BUY_FILL_WAIT_SECONDS)
 def wait_for_buy_fill(cfg: Settings, client: UpbitClient, uuid: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
     """매수 주문이 완전히 체결될 때까지 대기하고 (체결 수량, 평단, 총 비용)을 반환."""
     timeout_sec = max(cfg.buy_fill_timeout_sec, 0.0)
@@ -200,7 +252,7 @@ def wait_for_buy_fill(cfg: Settings, client: UpbitClient, uuid: str) -> Tuple[Op
         avg_price, total_cost = compute_order_details(order)
 
         if state != last_state:
-            log.info(f"매수 체결 상태: state={state}, executed_volume={executed_volume}")
+            log.info("매수 체결 상태: state=%s, executed_volume=%s", state, executed_volume)
             last_state = state
 
         last_executed_volume = executed_volume or last_executed_volume
@@ -232,7 +284,7 @@ def wait_for_buy_fill(cfg: Settings, client: UpbitClient, uuid: str) -> Tuple[Op
             )
             return None, None, None
 
-        time.sleep(poll_interval)
+        client.wait_order_update(uuid, deadline - time.time(), poll_interval)
 
 
 def compute_order_details(order: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
@@ -277,7 +329,7 @@ def check_pending_sell_orders(cfg: Settings, client: UpbitClient, db: "Firestore
     """
     시작시 대기중인 미체결 매도 주문들을 확인하고 상태를 업데이트합니다.
     """
-    log.info(f"--- [{market}] 대기중인 매도 주문 확인 시작 ---")
+    log.info("--- [%s] 대기중인 매도 주문 확인 시작 ---", market)
     # 1. 시작시 현재 대기중인 거래들이 있는지 목록을 가져온다.
     pending_trades = db.get_waiting_trades_by_market(market)
 
@@ -286,52 +338,101 @@ def check_pending_sell_orders(cfg: Settings, client: UpbitClient, db: "Firestore
         log.info("대기중인 매도 주문이 없습니다.")
         return
 
-    log.info(f"{len(pending_trades)}개의 대기중인 매도 주문을 확인합니다.")
-    
-    # 3. 목록을 sell_price가 낮은 순서대로 정렬한다.
-    # Firestore에서 'sell_price' 필드가 있다고 가정합니다.
+    log.info("%d개의 대기중인 매도 주문을 확인합니다.", len(pending_trades))
+
+    # 3. 마켓의 미체결 주문 목록을 한 번에 조회하여, 아직 대기중인 주문은 개별 조회를 생략한다.
+    #    목록 조회에 실패하면 기존처럼 sell_price 오름차순으로 개별 조회한다.
+    open_sell_uuids: Optional[set] = None
     try:
-        pending_trades.sort(key=lambda t: t.get('sell_price', float('inf')))
-    except (TypeError, ValueError):
-        log.error("Firestore에 'sell_price' 필드가 없거나 숫자 형식이 아니어서 정렬에 실패했습니다.")
-        return
+        open_sell_uuids = {o.get('uuid') for o in client.get_open_orders(market)}
+        log.info("미체결 주문 %d건을 일괄 조회했습니다.", len(open_sell_uuids))
+    except Exception as e:
+        log.error("미체결 주문 일괄 조회 실패, 개별 조회로 확인합니다: %s", e)
 
+    # 캐시 인덱스가 sell_price 오름차순으로 유지되므로 별도 정렬 없이 순회한다.
     for trade in pending_trades:
         sell_uuid = trade.get('sell_uuid')
         if not sell_uuid:
-            log.warning(f"거래에 sell_uuid가 없어 상태를 확인할 수 없습니다: {trade.get('buy_uuid')}")
+            log.warning("거래에 sell_uuid가 없어 상태를 확인할 수 없습니다: %s", trade.get('buy_uuid'))
+            continue
+
+        if open_sell_uuids is not None and sell_uuid in open_sell_uuids:
             continue
 
-        # 4. sell_uuid로 upbit에서 체결 상태를 확인한다.
-        log.info(f"주문 확인: sell_uuid={sell_uuid}")
+        # 4. 미체결 목록에 없는 주문만 sell_uuid로 체결 내역(trades)을 포함해 조회한다.
         order = client.get_order(sell_uuid)
         if not order:
-            log.warning(f"Upbit에서 주문 정보를 가져오지 못했습니다: {sell_uuid}")
+            log.warning("Upbit에서 주문 정보를 가져오지 못했습니다: %s", sell_uuid)
             continue
 
         state = order.get('state')
-        log.info(f"  -> 현재 상태: {state}")
+        emit(ORDER_CHECK, market, debug=True, sell_uuid=sell_uuid, state=state)
+        log.debug("주문 확인: sell_uuid=%s -> %s", sell_uuid, state)
 
         # 5. 체결이 done 또는 cancel이 되면 목록을 업데이트 한다.
         if state in {'done', 'cancel'}:
-            _, sell_amount = compute_order_details(order)
-            trade['state'] = state
-            trade['sell_amount'] = round(sell_amount, 2) if sell_amount is not None else 0.0
-            trade['sell_complete_time'] = int(time.time())
-            db.upsert_trade(trade)
-            log.info(f"  -> Firestore 상태 업데이트: {state}, sell_amount: {sell_amount}")
+            _apply_sell_result(db, trade, order)
         
-        # 6. 체결이 waiting 이라면 확인을 중단한다.
+        # 6. 개별 조회 중 체결이 waiting 이라면 확인을 중단한다.
         #    (가장 낮은 가격의 매도 주문이 아직 대기중이므로, 더 비싼 주문들은 확인할 필요가 없음)
-        elif state == 'wait':
+        elif state == 'wait' and open_sell_uuids is None:
             log.info("가장 낮은 가격의 매도 주문이 아직 대기중이므로 확인을 중단합니다.")
             break
     log.info("--- 대기중인 매도 주문 확인 완료 ---")
 
 
+def _apply_sell_result(db: "FirestoreCache", trade: dict, order: Dict[str, Any]) -> bool:
+    """
+    종료된 매도 주문(done/cancel)의 결과를 거래에 반영합니다.
+    주문 확인 사이클과 WebSocket 체결 이벤트가 같은 거래를 동시에 처리할 수 있으므로,
+    'waiting' 상태인 거래만 한 번 반영합니다.
+    """
+    state = order.get('state')
+    with _settle_lock:
+        if trade.get('state') != 'waiting':
+            return False
+        _, sell_amount = compute_order_details(order)
+        trade['state'] = state
+        trade['sell_amount'] = round(sell_amount, 2) if sell_amount is not None else 0.0
+        trade['sell_complete_time'] = int(time.time())
+        db.upsert_trade(trade)
+    emit(
+        FILL, trade.get('market'), side="ask", state=state, buy_uuid=trade.get('buy_uuid'),
+        uuid=order.get('uuid'), sell_amount=trade['sell_amount'], buy_amount=trade.get('buy_amount'),
+    )
+    log.info("  -> Firestore 상태 업데이트: %s, sell_amount: %s", state, sell_amount)
+    return True
+
+
+def settle_sell_order(client: UpbitClient, db: "FirestoreCache", sell_uuid: str) -> bool:
+    """WebSocket으로 체결 완료를 받은 매도 주문을 즉시 캐시에 반영합니다."""
+    trade = db.get_trade_by_sell_uuid(sell_uuid)
+    if not trade or trade.get('state') != 'waiting':
+        return False
+    order = client.get_order(sell_uuid)
+    if not order or order.get('state') != 'done':
+        return False
+    log.info("[%s] 매도 체결 이벤트 반영: sell_uuid=%s", trade.get('market'), sell_uuid)
+    return _apply_sell_result(db, trade, order)
+
+
+def backfill_sell_orders(cfg: Settings, client: UpbitClient, db: "FirestoreCache"):
+    """이벤트 스트림이 끊겨 있던 동안 체결된 매도 주문을 REST 조회로 보정합니다."""
+    for market in cfg.market:
+        try:
+            open_sell_uuids = {o.get('uuid') for o in client.get_open_orders(market)}
+        except Exception as e:
+            log.error("[%s] 체결 보정용 미체결 주문 조회 실패: %s", market, e)
+            continue
+        for trade in db.get_waiting_trades_by_market(market):
+            sell_uuid = trade.get('sell_uuid')
+            if sell_uuid and sell_uuid not in open_sell_uuids:
+                settle_sell_order(client, db, sell_uuid)
+
+
 def _modify_highest_price_order(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: str, current_price: float):
     """보유 KRW가 부족할 때 가장 높은 가격의 매도 주문을 현재가 기준으로 변경"""
-    log.info(f"[{market}] 기존 주문 변경을 시도합니다.")
+    log.info("[%s] 기존 주문 변경을 시도합니다.", market)
     
     # 1. 가장 높은 가격의 매도 주문 가져오기
     trade_to_modify = db.get_min_price_waiting_trade(market)
@@ -339,117 +440,356 @@ def _modify_highest_price_order(cfg: Settings, client: UpbitClient, db: "Firesto
         log.info("변경할 대기 중인 매도 주문이 없습니다.")
         return
 
-    old_sell_uuid = trade_to_modify.get('sell_uuid')
-    buy_quantity = trade_to_modify.get('buy_quantity')
-
-    if not old_sell_uuid or not buy_quantity:
-        log.error(f"주문 변경에 필요한 정보(sell_uuid, buy_quantity)가 부족합니다: {trade_to_modify.get('buy_uuid')}")
-        return
-
-    # 2. 기존 주문 취소
-    try:
-        log.info(f"기존 매도 주문 취소를 시도합니다: {old_sell_uuid}")
-        cancel_res = client.cancel_order(old_sell_uuid)
-        log.info(f"주문 취소 완료: {cancel_res.get('uuid')}")
-    except Exception as e:
-        # 이미 체결되었거나 취소된 경우 오류가 발생할 수 있음
-        log.error(f"주문 취소 중 오류 발생 (이미 처리되었을 수 있음): {e}")
-        return
-
-    # 3. 현재가 기준으로 새 매도가 계산 및 재주문
+    # 2. 현재가 기준으로 새 매도가 계산 후 취소/재주문
     new_sell_price = round_price_to_tick(
         current_price * (1.0 + cfg.tp_ratio * 0.01),
         method='up',
         market=market,
     )
-    
-    log.info(f"새로운 매도 주문을 시도합니다. 가격: {new_sell_price}")
-    new_sell_res = client.sell_limit(market, buy_quantity, new_sell_price)
-    new_sell_uuid = new_sell_res.get('uuid')
-    if not new_sell_uuid:
-        log.error("새로운 매도 주문에 실패했습니다.")
-        return
-    
-    # 4. 캐시 및 Firestore 정보 업데이트
-    trade_to_modify['sell_uuid'] = new_sell_uuid
-    trade_to_modify['sell_price'] = new_sell_price
-    db.upsert_trade(trade_to_modify)
-    
-    log.info(f"주문 변경 완료: {old_sell_uuid} -> {new_sell_uuid} (새로운 가격: {new_sell_price})")
+    reprice_orders(client, db, market, [(trade_to_modify, new_sell_price)])
 
 def _modify_loss_order(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: str):
-    """보유 KRW가 부족할 때 가장 높은 가격의 매도 주문을 현재가 기준으로 변경"""
-    log.info(f"[{market}] 기존 주문 변경을 시도합니다.")
+    """매도가가 매수가보다 낮은 대기 주문들을 매수가 기준 익절가로 한꺼번에 변경"""
+    log.info("[%s] 기존 주문 변경을 시도합니다.", market)
     
-    # 1. 가장 높은 가격의 매도 주문 가져오기
+    # 1. 손실 구간에 걸린 매도 주문 가져오기
     trades_to_modify = db.get_waiting_loss_trades_by_market(market)
     if not trades_to_modify:
         log.info("변경할 대기 중인 매도 주문이 없습니다.")
         return
-    
-    for trade_to_modify in trades_to_modify:
 
-        old_sell_uuid = trade_to_modify.get('sell_uuid')
-        buy_quantity = trade_to_modify.get('buy_quantity')
+    # 2. 매수가 기준으로 새 매도가 계산 후 일괄 취소/재주문
+    new_prices = round_prices_to_tick(
+        [t.get('buy_price') * (1.0 + cfg.tp_ratio * 0.01) for t in trades_to_modify],
+        method='up',
+        market=market,
+    )
+    reprice_orders(client, db, market, list(zip(trades_to_modify, new_prices)))
 
-        if not old_sell_uuid or not buy_quantity:
-            log.error(f"주문 변경에 필요한 정보(sell_uuid, buy_quantity)가 부족합니다: {trade_to_modify.get('buy_uuid')}")
-            continue
 
-        # 2. 기존 주문 취소
-        try:
-            log.info(f"기존 매도 주문 취소를 시도합니다: {old_sell_uuid}")
-            cancel_res = client.cancel_order(old_sell_uuid)
-            log.info(f"주문 취소 완료: {cancel_res.get('uuid')}")
-        except Exception as e:
-            # 이미 체결되었거나 취소된 경우 오류가 발생할 수 있음
-            log.error(f"주문 취소 중 오류 발생 (이미 처리되었을 수 있음): {e}")
-            return
-
-        # 3. 현재가 기준으로 새 매도가 계산 및 재주문
-        new_sell_price = round_price_to_tick(
-            trade_to_modify.get('buy_price') * (1.0 + cfg.tp_ratio * 0.01),
-            method='up',
-            market=market,
-        )
-        
-        log.info(f"새로운 매도 주문을 시도합니다. 가격: {new_sell_price}")
-        new_sell_res = client.sell_limit(market, buy_quantity, new_sell_price)
-        new_sell_uuid = new_sell_res.get('uuid')
+def reprice_orders(client: UpbitClient, db: "FirestoreCache", market: str, changes: List[Tuple[dict, float]]) -> List[Tuple[dict, str]]:
+    """
+    (거래, 새 매도가) 목록의 매도 주문을 취소 후 재주문 API로 한꺼번에 변경합니다.
+    주문들은 client.order_concurrency개까지 동시에 보내며 속도 제한은 RequestScheduler가 맞춥니다.
+    하나가 실패해도 나머지는 계속 진행하고, 성공한 변경은 캐시/저장소에 한 번의 배치로 기록합니다.
+    :return: 실패한 (거래, 사유) 목록
+    """
+    failures: List[Tuple[dict, str]] = []
+    jobs = []
+    for trade, new_price in changes:
+        if not trade.get('sell_uuid'):
+            log.error("주문 변경에 필요한 정보(sell_uuid)가 부족합니다: %s", trade.get('buy_uuid'))
+            failures.append((trade, "missing_fields"))
+            continue
+        jobs.append((trade, new_price))
+    if not jobs:
+        return failures
+
+    def replace(job: Tuple[dict, float]) -> Dict[str, Any]:
+        trade, new_price = job
+        # 일부 체결된 주문도 있으므로 수량은 거래소가 아는 남은 수량(remain_only)으로 다시 냅니다.
+        return client.cancel_and_new(trade['sell_uuid'], market, None, new_price)
+
+    concurrency = min(getattr(client, "order_concurrency", 1), len(jobs))
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="reprice") as pool:
+            futures = [pool.submit(replace, job) for job in jobs]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+    else:
+        results = []
+        for job in jobs:
+            try:
+                results.append(replace(job))
+            except Exception as e:
+                results.append(e)
+
+    updated = []
+    for (trade, new_price), res in zip(jobs, results):
+        old_sell_uuid = trade['sell_uuid']
+        new_sell_uuid = res.get('new_order_uuid') if isinstance(res, dict) else None
         if not new_sell_uuid:
-            log.error("새로운 매도 주문에 실패했습니다.")
-            return
-        
-        # 4. 캐시 및 Firestore 정보 업데이트
-        trade_to_modify['sell_uuid'] = new_sell_uuid
-        trade_to_modify['sell_price'] = new_sell_price
-        db.upsert_trade(trade_to_modify)
-        
-        log.info(f"주문 변경 완료: {old_sell_uuid} -> {new_sell_uuid} (새로운 가격: {new_sell_price})")
+            # 이미 체결되었거나 취소된 주문이면 오류가 날 수 있으며, 다음 사이클의 주문 확인에서 정리됩니다.
+            reason = str(res) if isinstance(res, Exception) else str((res or {}).get('error') or res)
+            emit(REPRICE, market, uuid=old_sell_uuid, price=new_price, error=reason)
+            log.error("매도 주문 변경 실패 (이미 처리되었을 수 있음): %s -> %s", old_sell_uuid, reason)
+            failures.append((trade, reason))
+            continue
+        emit(
+            REPRICE, market, uuid=old_sell_uuid, new_uuid=new_sell_uuid, buy_uuid=trade.get('buy_uuid'),
+            old_price=trade.get('sell_price'), price=new_price,
+        )
+        trade['sell_uuid'] = new_sell_uuid
+        trade['sell_price'] = new_price
+        updated.append(trade)
+        log.info("주문 변경 완료: %s -> %s (새로운 가격: %s)", old_sell_uuid, new_sell_uuid, new_price)
+
+    # 3. 캐시 및 Firestore 정보 일괄 업데이트
+    if updated:
+        db.upsert_trades(updated)
+    if failures:
+        log.warning("[%s] 매도 주문 변경 %d건 중 %d건 실패", market, len(changes), len(failures))
+    return failures
+
+def share_ledger(ledger: BalanceLedger, coordinator: ShardCoordinator) -> None:
+    """
+    분할 실행에서 워커들이 같은 KRW를 함께 예약하지 않도록 장부를 나눕니다.
+    - 장부는 계좌 잔고 중 맡은 마켓 비율만큼만 쓰고, 다른 워커의 매매가 반영되도록 사이클마다 잔고를 맞춥니다.
+    - 미체결 매도 조회는 맡은 마켓만 하고, lease가 바뀌면 몫이 달라지므로 다음 조회에서 다시 맞춥니다.
+    """
+    total = len(coordinator.markets)
+    ledger.budget_share = lambda: len(coordinator.owned()) / total if total else 0.0
+    ledger.reconcile_interval_sec = 0
+    ledger.markets = coordinator.owned()
+
+    def on_lease_change(acquired: List[str], lost: List[str]):
+        ledger.markets = coordinator.owned()
+        ledger.invalidate()
+
+    coordinator.add_listener(on_lease_change)
+
+
+def _run_market(cfg: Settings, client: UpbitClient, db: "FirestoreCache", market: str, last_buy_prices: Dict[str, Optional[float]], ticker: TickerSnapshot, ledger: BalanceLedger, coordinator: Optional[ShardCoordinator] = None) -> None:
+    """
+    한 마켓의 사이클을 실행합니다. 예외는 해당 마켓 안에서만 처리합니다.
+    분할 실행이면 사이클 도중 lease를 잃었을 때 거래를 기록하지 않도록 캐시를 감쌉니다.
+    """
+    if coordinator is not None:
+        db = LeaseGuardedCache(db, coordinator, market)
+    try:
+        with CYCLE_SECONDS.labels(market).time():
+            last_buy_prices[market] = run_once(cfg, client, db, market, last_buy_prices.get(market), ticker, ledger)
+    except LeaseLostError as e:
+        log.error(str(e))
+    except Exception as e:
+        log.exception("[%s] 사이클 오류: %s", market, e)
+
 
 def run_loop(cfg: Settings, db: "FirestoreCache") -> None:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s"
-    )
+    # 콘솔 로그는 백그라운드 리스너가 쓰고, 매매 판단/주문 기록은 이벤트 저널로 남긴다.
+    log_listener = start_log_listener(logging.INFO)
+    journal = None
+    if cfg.event_journal_path:
+        journal = EventJournal(
+            cfg.event_journal_path,
+            max_bytes=int(cfg.event_journal_max_mb * 1024 * 1024),
+            backups=cfg.event_journal_backups,
+            debug_sample=cfg.event_debug_sample,
+        ).start()
+        set_journal(journal)
 
     log.info("=== 업비트 자동 매수/익절 매도 루프 시작 ===")
     log.info(
         f"설정: market={','.join(cfg.market)}, krw={cfg.krw}, interval={cfg.interval_sec}s, "
-        f"tp={cfg.tp_ratio}% skip_within={cfg.skip_buy_within_ratio}% fill_timeout={cfg.buy_fill_timeout_sec}s dry_run={cfg.dry_run}"
+        f"tp={cfg.tp_ratio}% skip_within={cfg.skip_buy_within_ratio}% fill_timeout={cfg.buy_fill_timeout_sec}s "
+        f"workers={cfg.workers} dry_run={cfg.dry_run}"
+    )
+    sim = None
+    if cfg.dry_run:
+        sim = SimExchange(
+            krw=cfg.sim_krw,
+            fee_rate=cfg.sim_fee_rate,
+            process=PriceProcess(
+                start_price=cfg.sim_start_price,
+                volatility=cfg.sim_volatility,
+                liquidity_krw=cfg.sim_liquidity_krw or None,
+                step_sec=cfg.sim_step_sec,
+                seed=cfg.sim_seed,
+            ),
+        )
+    client = UpbitClient(
+        cfg.access_key,
+        cfg.secret_key,
+        dry_run=cfg.dry_run,
+        sim=sim,
+        http_backend=cfg.http_backend,
+        base_url=cfg.upbit_api_url,
     )
-    client = UpbitClient(cfg.access_key, cfg.secret_key, dry_run=cfg.dry_run)
     
+    ticker = TickerSnapshot(client, cfg.market, ttl_sec=cfg.ticker_ttl_sec)
+    ledger = BalanceLedger(client, reconcile_interval_sec=cfg.balance_reconcile_sec, markets=cfg.market)
+    # 매도 체결 금액은 캐시 상태 변화에서 장부에 가산한다.
+    db.add_listener(ledger.on_trade_update)
+    triggers = None
+    if cfg.event_trigger:
+        triggers = MarketTriggers(cfg, db, cfg.market, heartbeat_sec=cfg.heartbeat_sec)
+        db.add_listener(triggers.on_trade_update)
+    pnl = _start_pnl(cfg, db)
+    coordinator = None
+    if cfg.shard:
+        coordinator = ShardCoordinator(db.db, db, cfg.worker_id, cfg.market, lease_ttl_sec=cfg.lease_ttl_sec)
+        # lease를 얻은 마켓은 캐시 내용이 통째로 바뀌므로 경계와 미체결 노출을 다시 계산합니다.
+        if triggers is not None:
+            coordinator.add_listener(lambda acquired, lost: triggers.reset(acquired))
+        coordinator.add_listener(lambda acquired, lost: pnl.seed_open(db.get_all_waiting_trades()))
+        share_ledger(ledger, coordinator)
+        coordinator.start()
+        log.info(f"분할 실행: 워커 {cfg.worker_id}, 맡은 마켓 {','.join(coordinator.owned()) or '-'}")
+    market_data = _open_market_data(cfg)
+    if market_data is not None:
+        # 새로 조회한 현재가와 WebSocket ticker 가격이 분봉/틱 링 버퍼에 쌓입니다.
+        ticker.on_prices = market_data.add_ticks
     last_buy_prices: Dict[str, Optional[float]] = {m: None for m in cfg.market}
 
+    events = None
+    if cfg.websocket:
+        events = OrderEventHub(
+            cfg.market,
+            cfg.access_key,
+            cfg.secret_key,
+            url=cfg.ws_url,
+            private_url=cfg.ws_private_url,
+            on_price=ticker.update,
+            on_sell_done=lambda sell_uuid: settle_sell_order(client, db, sell_uuid),
+            on_reconnect=lambda: backfill_sell_orders(cfg, client, db),
+        )
+        client.events = events
+        events.start()
+
+    metrics_server = None
+    if cfg.metrics_port:
+        metrics_server = MetricsServer(cfg.metrics_port)
+        metrics_server.start()
+
+    try:
+        if cfg.workers > 1:
+            _run_loop_concurrent(cfg, client, db, last_buy_prices, ticker, ledger, triggers, pnl, coordinator)
+        else:
+            _run_loop_sequential(cfg, client, db, last_buy_prices, ticker, ledger, triggers, pnl, coordinator)
+    finally:
+        if coordinator is not None:
+            coordinator.stop()
+        pnl.checkpoint()
+        if events is not None:
+            events.stop()
+        if market_data is not None:
+            ticker.on_prices = None
+            market_data.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        client.close()
+        if journal is not None:
+            set_journal(None)
+            journal.close()
+        log_listener.stop()
+
+
+def _run_loop_sequential(cfg: Settings, client: UpbitClient, db: "FirestoreCache", last_buy_prices: Dict[str, Optional[float]], ticker: TickerSnapshot, ledger: BalanceLedger, triggers: Optional[MarketTriggers] = None, pnl: Optional[PnLAggregator] = None, coordinator: Optional[ShardCoordinator] = None) -> None:
     try:
         while True:
-            for market in cfg.market:
-                try:
-                    time.sleep(5)
-                    last_buy_prices[market] = run_once(cfg, client, db, market, last_buy_prices.get(market))
-                except Exception as e:
-                    log.exception(f"[{market}] 사이클 오류: {e}")
-            time.sleep(cfg.interval_sec)
+            _refresh_ticker(ticker)
+            for market in _due_markets(cfg, ticker, triggers, coordinator):
+                metrics.sleep(cfg.market_delay_sec, "market_delay")
+                _run_market(cfg, client, db, market, last_buy_prices, ticker, ledger, coordinator)
+            db.save_snapshot()
+            db.flush_archive()
+            if pnl is not None:
+                pnl.checkpoint_if_due()
+            metrics.sleep(cfg.interval_sec, "interval")
+    except KeyboardInterrupt:
+        log.info("종료 신호를 받아 루프를 종료합니다.")
+
+
+def _start_pnl(cfg: Settings, db: "FirestoreCache") -> PnLAggregator:
+    """손익 집계기를 체크포인트 + 보관소로 복원하고 캐시 상태 변화 리스너로 등록합니다."""
+    pnl = PnLAggregator(cfg.pnl_checkpoint_path, checkpoint_interval_sec=cfg.pnl_checkpoint_sec)
+    restored = pnl.restore()
+    archive = getattr(db, "archive", None)
+    # 분할 실행에서는 보관소를 여러 워커가 함께 쓰므로 다른 워커의 거래까지 세지 않도록 재생하지 않습니다.
+    if archive is not None and not cfg.shard:
+        since = None
+        if restored and pnl.watermark:
+            # 보관 파티션은 현지 날짜 기준이므로 하루 앞부터 읽고 watermark로 중복을 거릅니다.
+            since = time.strftime("%Y-%m-%d", time.gmtime(pnl.watermark - 86400))
+        try:
+            replayed = pnl.replay_closed(archive.iter_trades(since=since))
+            if replayed:
+                log.info(f"손익 체크포인트 이후 보관된 거래 {replayed}건을 반영했습니다.")
+        except Exception as e:
+            log.error(f"보관소에서 손익을 복원하지 못했습니다: {e}")
+    pnl.seed_open(db.get_all_waiting_trades())
+    db.add_listener(pnl.on_trade_update)
+    total = pnl.summary()["total"]
+    log.info(
+        f"손익 누계: 실현 {total['realized_pnl']:.0f} KRW, 체결 {total['done']}건, 취소 {total['cancelled']}건, "
+        f"미체결 {total['open_count']}건 / 노출 {total['open_exposure']:.0f} KRW"
+    )
+    return pnl
+
+
+def _due_markets(cfg: Settings, ticker: TickerSnapshot, triggers: Optional[MarketTriggers], coordinator: Optional[ShardCoordinator] = None) -> list[str]:
+    """
+    이번 주기에 사이클을 실행할 마켓. 이벤트 트리거를 쓰지 않거나 가격을 모르면 맡은 모든 마켓입니다.
+    분할 실행이면 이 워커가 lease를 가진 마켓만 대상입니다.
+    """
+    owned = coordinator.owned() if coordinator is not None else cfg.market
+    if triggers is None:
+        return owned
+    try:
+        prices = ticker.prices()
+    except Exception as e:
+        log.error("현재가 스냅샷이 없어 모든 마켓을 실행합니다: %s", e)
+        return owned
+    markets = triggers.due(prices, markets=owned)
+    if len(markets) < len(owned):
+        log.info("판단 경계를 넘은 마켓만 실행합니다: %s (%d/%d)", ','.join(markets) or '-', len(markets), len(owned))
+    return markets
+
+
+def _open_market_data(cfg: Settings) -> Optional[MarketDataWriter]:
+    """공유 시세 파일의 기록자를 엽니다. 다른 프로세스(수집기나 다른 워커)가 이미 기록 중이면 None."""
+    if not cfg.market_data_path:
+        return None
+    try:
+        writer = MarketDataWriter(cfg.market_data_path)
+    except (RuntimeError, ValueError, OSError) as e:
+        log.warning(f"공유 시세 파일에 기록하지 않습니다: {e}")
+        return None
+    log.info(f"현재가를 공유 시세 파일에 기록합니다: {cfg.market_data_path}")
+    return writer
+
+
+def _refresh_ticker(ticker: TickerSnapshot) -> None:
+    """
+    사이클 시작 시 현재가를 한 번에 갱신합니다. ticker 스트림으로 TTL 안에 가격을 받은 마켓은 건너뛰고,
+    스트림이 조용한(거래가 뜸한) 마켓만 모아 REST로 조회합니다.
+    """
+    markets = [m for m in ticker.markets if not ticker.is_streaming(m)]
+    if not markets:
+        return
+    try:
+        ticker.refresh(markets)
+    except Exception as e:
+        log.exception("현재가 스냅샷 갱신 오류: %s", e)
+
+
+def _run_loop_concurrent(cfg: Settings, client: UpbitClient, db: "FirestoreCache", last_buy_prices: Dict[str, Optional[float]], ticker: TickerSnapshot, ledger: BalanceLedger, triggers: Optional[MarketTriggers] = None, pnl: Optional[PnLAggregator] = None, coordinator: Optional[ShardCoordinator] = None) -> None:
+    """마켓별 사이클을 고정 크기 워커 풀에서 병렬로 실행합니다.
+
+    이전 사이클이 아직 끝나지 않은 마켓(예: 매수 체결 대기 중)은 이번 주기에 다시 제출하지 않으므로,
+    느린 마켓이 다른 마켓의 주기를 지연시키지 않습니다.
+    """
+    pool = ThreadPoolExecutor(max_workers=cfg.workers, thread_name_prefix="market")
+    running: Dict[str, Future] = {}
+    try:
+        while True:
+            _refresh_ticker(ticker)
+            for market in _due_markets(cfg, ticker, triggers, coordinator):
+                future = running.get(market)
+                if future is not None and not future.done():
+                    log.info("[%s] 이전 사이클이 아직 진행중이므로 이번 주기는 건너뜁니다.", market)
+                    continue
+                running[market] = pool.submit(_run_market, cfg, client, db, market, last_buy_prices, ticker, ledger, coordinator)
+            db.save_snapshot()
+            db.flush_archive()
+            if pnl is not None:
+                pnl.checkpoint_if_due()
+            metrics.sleep(cfg.interval_sec, "interval")
     except KeyboardInterrupt:
         log.info("종료 신호를 받아 루프를 종료합니다.")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
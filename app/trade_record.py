@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+캐시용 거래 레코드
+- 거래마다 11개 키를 가진 dict 대신 __slots__ 객체 하나로 보관하여 메모리를 줄입니다.
+- market은 프로세스 전역 번호(market_id)로, state는 정수 코드(state_code)로 저장하고 같은 문자열 객체를 공유합니다.
+- 기존 호출부가 그대로 동작하도록 dict처럼 trade['sell_uuid'], trade.get('state'), trade[...] = ... 를 지원합니다.
+- Firestore/저널/스냅샷에 쓸 때만 to_dict()로 dict를 만듭니다. 원본 dict에 없던 필드는 dict에도 넣지 않습니다.
+"""
+import sys
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# 원본 dict에 없던 필드 (to_dict에서 제외)
+MISSING: Any = type("Missing", (), {"__repr__": lambda self: "MISSING", "__slots__": ()})()
+
+FIELDS: Tuple[str, ...] = (
+    'buy_uuid',
+    'buy_price',
+    'buy_quantity',
+    'buy_amount',
+    'buy_create_time',
+    'sell_uuid',
+    'sell_price',
+    'sell_amount',
+    'sell_complete_time',
+    'updated_at',
+)
+_FIELD_SET = frozenset(FIELDS)
+
+# 자주 쓰는 상태는 고정 코드를 갖습니다. 그 밖의 상태 문자열은 처음 볼 때 코드를 추가합니다.
+STATE_WAITING = 0
+STATE_DONE = 1
+STATE_CANCEL = 2
+_state_names: list = ['waiting', 'done', 'cancel']
+_state_codes: Dict[str, int] = {name: i for i, name in enumerate(_state_names)}
+_market_names: list = []
+_market_ids: Dict[str, int] = {}
+_table_lock = threading.Lock()
+
+
+def _code(value: Any, names: list, codes: Dict[str, int]) -> int:
+    if value is None or value is MISSING:
+        return -1
+    code = codes.get(value)
+    if code is None:
+        with _table_lock:
+            code = codes.get(value)
+            if code is None:
+                names.append(sys.intern(str(value)))
+                code = codes[value] = len(names) - 1
+    return code
+
+
+def state_code(state: Optional[str]) -> int:
+    return _code(state, _state_names, _state_codes)
+
+
+def market_id(market: Optional[str]) -> int:
+    return _code(market, _market_names, _market_ids)
+
+
+def state_name(code: int) -> Optional[str]:
+    return _state_names[code] if code >= 0 else None
+
+
+def market_name(mid: int) -> Optional[str]:
+    return _market_names[mid] if mid >= 0 else None
+
+
+class TradeRecord:
+    """FirestoreCache가 보관하는 거래 한 건 (dict 호환)"""
+
+    __slots__ = FIELDS + ('market_id', 'state_code', 'extra')
+
+    def __init__(self):
+        for name in FIELDS:
+            setattr(self, name, MISSING)
+        self.market_id = -1
+        self.state_code = -1
+        # 알려진 필드 외의 값 (드묾)
+        self.extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TradeRecord":
+        record = cls()
+        for key, value in data.items():
+            record[key] = value
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """저장소 경계에서 쓸 dict. 값이 없는 필드는 넣지 않습니다."""
+        return dict(self.items())
+
+    # ---- 자주 쓰는 필드 ----
+
+    @property
+    def market(self) -> Optional[str]:
+        return _market_names[self.market_id] if self.market_id >= 0 else None
+
+    @property
+    def state(self) -> Optional[str]:
+        return _state_names[self.state_code] if self.state_code >= 0 else None
+
+    # ---- dict 호환 ----
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+        elif key == 'market':
+            value = self.market if self.market_id >= 0 else MISSING
+        elif key == 'state':
+            value = self.state if self.state_code >= 0 else MISSING
+        else:
+            value = self.extra.get(key, MISSING) if self.extra else MISSING
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        elif key == 'market':
+            self.market_id = market_id(value)
+        elif key == 'state':
+            self.state_code = state_code(value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, MISSING) is not MISSING
+
+    def keys(self) -> Iterator[str]:
+        return (key for key, _ in self.items())
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for name in FIELDS:
+            value = getattr(self, name)
+            if value is not MISSING:
+                yield name, value
+        if self.market_id >= 0:
+            yield 'market', self.market
+        if self.state_code >= 0:
+            yield 'state', self.state
+        if self.extra:
+            yield from self.extra.items()
+
+    def __iter__(self) -> Iterator[str]:
+        return self.keys()
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+거래 저장소 백엔드
+- FirestoreCache가 원본 저장소에 요구하는 메서드를 TradeStore로 정리하고, --store 값으로 구현을 고릅니다.
+  * firestore: FirestoreTradeDB (서비스 계정 키 필요, firebase_admin은 이때만 import)
+  * sqlite: SqliteTradeDB (로컬 파일 하나)
+  * memory: MemoryTradeDB (프로세스 메모리, 드라이런/백테스트 기본값)
+- 분할 실행(--shard)에 쓰는 lease 메서드도 세 구현이 모두 제공합니다. memory는 같은 프로세스 안에서만 공유됩니다.
+"""
+from typing import Optional, Protocol
+
+STORE_BACKENDS = ("firestore", "sqlite", "memory")
+
+
+class TradeStore(Protocol):
+    """FirestoreCache/ShardCoordinator가 사용하는 원본 저장소 메서드"""
+
+    def upsert_trade(self, data: dict) -> bool: ...
+
+    def upsert_trades_batch(self, items: list[dict]) -> bool: ...
+
+    def get_all_pending_trades(self) -> list[dict]: ...
+
+    def get_trades_updated_since(self, updated_at: float) -> Optional[list[dict]]: ...
+
+    def get_pending_trades_by_market(self, market: str) -> list[dict]: ...
+
+    def try_acquire_lease(self, market: str, worker_id: str, ttl_sec: float, now: float) -> bool: ...
+
+    def release_lease(self, market: str, worker_id: str) -> bool: ...
+
+    def get_leases(self) -> list[dict]: ...
+
+    def publish_worker(self, worker_id: str, status: dict) -> bool: ...
+
+    def get_workers(self) -> list[dict]: ...
+
+
+def open_trade_store(backend: str, credential_path: str = "", path: str = "") -> TradeStore:
+    """
+    backend 이름으로 저장소를 만듭니다. 무거운 SDK는 해당 백엔드를 고를 때만 import합니다.
+    :param credential_path: firestore 서비스 계정 키 파일
+    :param path: sqlite 파일 경로
+    """
+    if backend == "firestore":
+        from .firestore_trade_db import FirestoreTradeDB
+        return FirestoreTradeDB(credential_path=credential_path)
+    if backend == "sqlite":
+        from .sqlite_trade_db import SqliteTradeDB
+        return SqliteTradeDB(path)
+    if backend == "memory":
+        from .memory_trade_db import MemoryTradeDB
+        return MemoryTradeDB()
+    raise ValueError(f"알 수 없는 저장소: {backend} (가능: {', '.join(STORE_BACKENDS)})")
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+이벤트 기반 사이클 실행
+- 마켓마다 run_once의 판단이 바뀔 수 있는 가격 경계를 미리 계산해 둡니다.
+  * 매수 스킵 구간: 최저 매도가(sell_price) 대비 변동률이 skip+tp 이내 (대기 1건이면 skip 초과 ~ skip+tp 이내)
+  * 체결 가능 가격: 현재가 >= 최저 대기 매도가
+- 새 가격 스냅샷이 오면 모든 마켓을 한 번에 numpy 벡터 연산으로 경계와 비교하여,
+  경계를 넘은 마켓만 run_once를 실행합니다. 그 외 마켓은 heartbeat_sec마다 한 번씩 안전하게 실행합니다.
+- 경계는 캐시 리스너로 거래가 바뀐 마켓만 다시 계산합니다.
+  자동 금액 모드에서는 전체 대기 주문 수가 비율을 바꾸므로 대기 주문 수가 바뀌면 모든 마켓을 다시 계산합니다.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .config import Settings
+from .metrics import REGISTRY
+from .tiers import cycle_ratios
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None
+
+log = logging.getLogger("trade")
+
+# run_once가 손절 재주문(_modify_loss_order)을 시도하는 대기 주문 수 상한 (trade.run_once와 같은 값)
+LOSS_CHECK_MAX_WAITING = 15
+# 이보다 마켓이 적으면 numpy 배열을 만드는 비용이 비교보다 커서 루프로 계산합니다 (백테스트는 마켓 1개).
+VECTOR_MIN_MARKETS = 16
+
+CYCLE_TRIGGERS = REGISTRY.counter(
+    "coinbox_cycle_triggers_total", "run_once 실행/생략 사유별 횟수", ("reason",)
+)
+_T_SKIPPED = CYCLE_TRIGGERS.labels("skipped")
+
+
+class _Thresholds:
+    """한 마켓의 판단 경계. always=True면 가격과 무관하게 매 주기 실행합니다."""
+
+    __slots__ = ("always", "lowest_sell", "outer", "inner")
+
+    def __init__(self, always: bool, lowest_sell: float = math.nan, outer: float = math.inf, inner: float = -1.0):
+        self.always = always
+        # 스킵 구간 기준가. 체결 가능 경계이기도 합니다 (현재가 >= lowest_sell).
+        self.lowest_sell = lowest_sell
+        # 변동률(%)이 outer를 넘거나 inner 이하이면 매수 판단이 바뀝니다.
+        self.outer = outer
+        self.inner = inner
+
+
+class MarketTriggers:
+    """마켓별 경계를 유지하고, 가격 스냅샷마다 실행할 마켓을 고릅니다."""
+
+    def __init__(self, cfg: Settings, db, markets: List[str], heartbeat_sec: float = 300.0):
+        self.cfg = cfg
+        self.db = db
+        self.markets = list(markets)
+        self.heartbeat_sec = heartbeat_sec
+        self._thresholds: Dict[str, _Thresholds] = {}
+        self._stale = set(self.markets)
+        self._last_run: Dict[str, float] = {}
+        # 경계를 계산할 때 쓴 전체 대기 주문 수 (분할 실행에서는 다른 워커의 변화로도 바뀝니다)
+        self._all_order_count: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def on_trade_update(self, prev_state: Optional[str], trade: dict):
+        """FirestoreCache 리스너. 거래가 바뀐 마켓의 경계를 다음 평가 때 다시 계산합니다."""
+        market = trade.get('market')
+        with self._lock:
+            if self.cfg.krw == 0 and (prev_state == 'waiting') != (trade.get('state') == 'waiting'):
+                # 자동 금액 모드의 비율은 전체 대기 주문 수에 따라 달라집니다.
+                self._stale.update(self.markets)
+            elif market in self.markets:
+                self._stale.add(market)
+
+    def _compute(self, market: str, all_order_count: int) -> _Thresholds:
+        waiting_count = self.db.get_waiting_trades_count_by_market(market)
+        if waiting_count == 0:
+            return _Thresholds(True)
+        if waiting_count < LOSS_CHECK_MAX_WAITING and self.db.get_waiting_loss_trades_by_market(market):
+            return _Thresholds(True)
+        skip_ratio, tp_ratio = cycle_ratios(self.cfg.tier_table, self.cfg.krw == 0, all_order_count)
+        lowest = self.db.get_min_price_waiting_trade(market)
+        if skip_ratio <= 0 or not lowest or not lowest.get('buy_price') or not lowest.get('sell_price'):
+            return _Thresholds(True)
+        inner = skip_ratio if waiting_count == 1 else -1.0
+        return _Thresholds(False, float(lowest['sell_price']), skip_ratio + tp_ratio, inner)
+
+    def reset(self, markets: List[str]):
+        """마켓의 캐시 내용이 통째로 바뀌었을 때(분할 실행의 lease 획득) 처음 보는 마켓처럼 다시 실행합니다."""
+        with self._lock:
+            self._stale.update(markets)
+            for market in markets:
+                self._last_run.pop(market, None)
+
+    def _refresh_stale(self):
+        all_order_count = self.db.get_waiting_trade_count_all_market()
+        with self._lock:
+            if self.cfg.krw == 0 and all_order_count != self._all_order_count:
+                self._stale.update(self.markets)
+            self._all_order_count = all_order_count
+            stale, self._stale = self._stale, set()
+        if not stale:
+            return
+        for market in stale:
+            if market in self.markets:
+                self._thresholds[market] = self._compute(market, all_order_count)
+
+    def due(self, prices: Dict[str, float], now: Optional[float] = None, markets: Optional[List[str]] = None) -> List[str]:
+        """
+        이번 주기에 run_once를 실행할 마켓 목록을 반환합니다.
+        실행 대상으로 고른 마켓은 실행한 것으로 기록하고, 다음 평가 전에 경계를 다시 계산합니다.
+        :param markets: 평가할 마켓 (분할 실행에서 맡은 마켓). 없으면 전체
+        """
+        now = time.monotonic() if now is None else now
+        self._refresh_stale()
+        markets = self.markets if markets is None else [m for m in markets if m in self._thresholds]
+        thresholds = [self._thresholds[m] for m in markets]
+        price = [prices.get(m, math.nan) for m in markets]
+        lowest = [t.lowest_sell for t in thresholds]
+        outer = [t.outer for t in thresholds]
+        inner = [t.inner for t in thresholds]
+
+        # 변동률은 run_once와 같은 식으로 계산해 경계값에서 판단이 어긋나지 않게 합니다.
+        if np is not None and len(markets) >= VECTOR_MIN_MARKETS:
+            p, ls = np.asarray(price), np.asarray(lowest)
+            with np.errstate(invalid="ignore"):
+                diff = np.abs(p - ls) / ls * 100.0
+                crossed = ((diff > np.asarray(outer)) | (diff <= np.asarray(inner)) | (p >= ls)).tolist()
+        else:
+            # 마켓이 적거나 numpy를 불러오지 못한 환경에서는 같은 식을 루프로 계산합니다.
+            crossed = []
+            for p, ls, o, i in zip(price, lowest, outer, inner):
+                diff = abs(p - ls) / ls * 100.0 if ls == ls else math.nan
+                crossed.append(diff > o or diff <= i or p >= ls)
+
+        selected = []
+        for market, t, hit, p in zip(markets, thresholds, crossed, price):
+            last_run = self._last_run.get(market)
+            if last_run is None:
+                reason = "first"
+            elif t.always:
+                reason = "always"
+            elif p != p:
+                # 가격을 모르면 run_once가 직접 조회하도록 실행합니다.
+                reason = "no_price"
+            elif hit:
+                reason = "threshold"
+            elif now - last_run >= self.heartbeat_sec:
+                reason = "heartbeat"
+            else:
+                _T_SKIPPED.inc()
+                continue
+            CYCLE_TRIGGERS.labels(reason).inc()
+            self._last_run[market] = now
+            selected.append(market)
+        # 실행 결과(매수/주문 변경)는 리스너로 반영되지만, 아무 변화가 없어도 다음 평가에서 경계를 다시 확인합니다.
+        with self._lock:
+            self._stale.update(selected)
+        return selected
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Upbit API 인증 토큰 (HS256 JWT)
+- 헤더 조각과 HMAC 키 상태, access_key가 들어간 payload 앞부분을 미리 만들어 두고, 요청마다 nonce와 서명만 새로 계산합니다.
+- 같은 쿼리 문자열의 SHA512 query_hash는 캐시하여 주문 조회 폴링처럼 반복되는 요청에서 다시 계산하지 않습니다.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import uuid as uuid_lib
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from urllib.parse import unquote, urlencode
+
+
+def b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+_HEADER = b64url(b'{"alg":"HS256","typ":"JWT"}')
+
+
+@lru_cache(maxsize=4096)
+def query_hash(query_string: str) -> str:
+    return hashlib.sha512(query_string.encode("utf-8")).hexdigest()
+
+
+def build_query_string(params: Optional[Dict[str, Any]]) -> str:
+    """업비트 서명 규칙대로 (urlencode 후 unquote) 쿼리 문자열을 만듭니다."""
+    if not params:
+        return ""
+    return unquote(urlencode(params, doseq=True))
+
+
+class UpbitSigner:
+    """access/secret 키 한 쌍으로 요청마다 Authorization 토큰을 만듭니다."""
+
+    def __init__(self, access_key: str, secret_key: str):
+        self.access_key = access_key
+        self._mac = hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
+        # {"access_key":"...","nonce":" 까지는 항상 같습니다.
+        self._payload_prefix = '{"access_key":' + json.dumps(access_key) + ',"nonce":"'
+
+    def token(self, query_string: str = "") -> str:
+        payload = self._payload_prefix + str(uuid_lib.uuid4()) + '"'
+        if query_string:
+            payload += ',"query_hash":"' + query_hash(query_string) + '","query_hash_alg":"SHA512"'
+        signing_input = _HEADER + "." + b64url((payload + "}").encode())
+        mac = self._mac.copy()
+        mac.update(signing_input.encode())
+        return signing_input + "." + b64url(mac.digest())
+
+    def authorization(self, query_string: str = "") -> str:
+        return "Bearer " + self.token(query_string)
+
+
+def verify_token(token: str, secret_key: str) -> Optional[Dict[str, Any]]:
+    """서명을 확인하고 payload를 반환합니다. 서명이 틀리면 None (로컬 대역 서버용)."""
+    try:
+        header, payload, signature = token.split(".")
+    except ValueError:
+        return None
+    expected = b64url(hmac.new(secret_key.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(expected, signature):
+        return None
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
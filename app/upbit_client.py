@@ -1,72 +1,238 @@
 
 # -*- coding: utf-8 -*-
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import UPBIT_CALL_ERRORS, UPBIT_CALL_SECONDS, timed
+from .rate_limit import PRIORITY_BUY, PRIORITY_CANCEL, PRIORITY_QUERY, PRIORITY_SELL, RequestScheduler
+from .sim_exchange import SimExchange
+from .upbit_rest import UPBIT_API_URL, UpbitRestClient
+
+HTTP_BACKENDS = ("native", "pyupbit")
+
+
+def _with_req(res: Any):
+    """contain_req=True 응답 (결과, Remaining-Req)을 풀어 줍니다. pyupbit가 오류를 삼키면 None만 옵니다."""
+    if isinstance(res, tuple) and len(res) == 2:
+        return res
+    return res, None
+
+
+class PyupbitBackend:
+    """UpbitRestClient와 같은 메서드를 pyupbit 호출로 제공합니다 (--http-backend pyupbit)."""
+
+    def __init__(self, access_key: str, secret_key: str):
+        # pyupbit는 pandas까지 불러오므로 이 백엔드를 고를 때만 import합니다.
+        try:
+            import pyupbit  # type: ignore
+        except ImportError as e:
+            raise RuntimeError("pyupbit 모듈이 필요합니다. requirements.txt로 설치해 주세요.") from e
+        self._pyupbit = pyupbit
+        self._upbit = pyupbit.Upbit(access_key, secret_key)
+
+    def ticker(self, markets: List[str]):
+        prices, remaining = _with_req(self._pyupbit.get_current_price(list(markets), limit_info=True))
+        if prices is not None and not isinstance(prices, dict):
+            # 단일 마켓이면 pyupbit가 숫자를 반환합니다.
+            prices = {markets[0]: prices}
+        return prices, remaining
+
+    def accounts(self):
+        return _with_req(self._upbit.get_balances(contain_req=True))
+
+    def order(self, uuid: str):
+        return _with_req(self._upbit.get_order(uuid, contain_req=True))
+
+    def open_orders(self, market: str, page: int = 1, limit: int = 100):
+        return _with_req(self._upbit.get_order(market, state="wait", page=page, limit=limit, contain_req=True))
+
+    def buy_market(self, market: str, krw: float):
+        return _with_req(self._upbit.buy_market_order(market, krw, contain_req=True))
+
+    def sell_limit(self, market: str, volume: float, price: float):
+        return _with_req(self._upbit.sell_limit_order(market, price, volume, contain_req=True))
+
+    def cancel(self, uuid: str):
+        return _with_req(self._upbit.cancel_order(uuid, contain_req=True))
+
+    # pyupbit에는 취소 후 재주문 API가 없으므로 UpbitClient가 취소와 매도를 따로 보냅니다.
+
+    def close(self):
+        return
 
-try:
-    import pyupbit  # type: ignore
-except Exception as e:
-    pyupbit = None
 
 class UpbitClient:
     """
-    pyupbit 래퍼. 간단한 기능만 사용합니다.
+    Upbit 거래소 래퍼. 간단한 기능만 사용합니다.
+    실거래 요청은 기본적으로 keep-alive 세션을 재사용하는 UpbitRestClient로 보내고,
+    http_backend="pyupbit"이면 pyupbit로 보냅니다.
+    드라이런에서는 모든 호출을 인메모리 모의 거래소(SimExchange)로 보냅니다.
+    실거래 요청은 RequestScheduler를 거쳐 엔드포인트 그룹별 속도 제한과 우선순위에 맞춰 보냅니다.
     """
-    def __init__(self, access_key: str, secret_key: str, dry_run: bool = False):
+    def __init__(
+        self,
+        access_key: str,
+        secret_key: str,
+        dry_run: bool = False,
+        sim: Optional[SimExchange] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        http_backend: str = "native",
+        base_url: str = UPBIT_API_URL,
+    ):
         self.dry_run = dry_run
-        self._upbit = None
+        # 여러 주문을 한꺼번에 변경할 때 동시에 보낼 요청 수 (모의 거래소는 스레드 안전하지 않아 1)
+        self.order_concurrency = 1 if dry_run else 8
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self._backend = None
+        self._sim: Optional[SimExchange] = None
+        if dry_run:
+            self._sim = sim if sim is not None else SimExchange()
+        # 설정되면 주문 상태 변화를 WebSocket 이벤트로 기다립니다 (OrderEventHub).
+        self.events = None
         if not dry_run:
-            if pyupbit is None:
-                raise RuntimeError("pyupbit 모듈이 필요합니다. requirements.txt로 설치해 주세요.")
-            self._upbit = pyupbit.Upbit(access_key, secret_key)
+            if http_backend == "native":
+                self._backend = UpbitRestClient(access_key, secret_key, base_url=base_url)
+            elif http_backend == "pyupbit":
+                self._backend = PyupbitBackend(access_key, secret_key)
+            else:
+                raise ValueError(f"알 수 없는 http_backend: {http_backend} (가능: {', '.join(HTTP_BACKENDS)})")
+
+    def _exchange(self, group: str, priority: int, fn, key=None):
+        return self.scheduler.call(group, priority, fn, key=key)
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
 
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="get_current_price")
     def get_current_price(self, market: str) -> float:
-        if self.dry_run:
-            # 드라이런: 단순한 모의 가격 (시간 변동)
-            base = 100_000.0
-            return base + (time.time() % 60)  # 초에 따라 약간 변동
-        assert pyupbit is not None
-        p = pyupbit.get_current_price(market)
-        if p is None:
+        if self._sim is not None:
+            return self._sim.get_current_price(market)
+        assert self._backend is not None
+        prices = self._exchange("quotation", PRIORITY_QUERY, lambda: self._backend.ticker([market]), key=("ticker", market))
+        if not prices or prices.get(market) is None:
             raise RuntimeError(f"현재가 조회 실패: {market}")
-        return float(p)
+        return float(prices[market])
 
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="get_current_prices")
+    def get_current_prices(self, markets: List[str]) -> Dict[str, float]:
+        """여러 마켓의 현재가를 한 번의 ticker 요청으로 조회합니다."""
+        if self._sim is not None:
+            return self._sim.get_current_prices(markets)
+        assert self._backend is not None
+        prices = self._exchange(
+            "quotation", PRIORITY_QUERY, lambda: self._backend.ticker(list(markets)), key=("ticker", tuple(markets))
+        )
+        if prices is None:
+            raise RuntimeError(f"현재가 조회 실패: {','.join(markets)}")
+        return {m: float(p) for m, p in prices.items() if p is not None}
+
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="get_current_prices_and_volumes")
+    def get_current_prices_and_volumes(self, markets: List[str]) -> Tuple[Dict[str, float], Dict[str, float]]:
+        """
+        여러 마켓의 현재가와 당일 누적 거래량(acc_trade_volume)을 한 번의 ticker 요청으로 조회합니다.
+        누적 거래량을 주지 않는 백엔드(pyupbit, 모의 거래소)는 빈 거래량을 돌려줍니다.
+        """
+        if self._sim is not None or not hasattr(self._backend, "ticker_with_volumes"):
+            return self.get_current_prices(markets), {}
+        prices, volumes = self._exchange(
+            "quotation", PRIORITY_QUERY, lambda: self._backend.ticker_with_volumes(list(markets))
+        )
+        return {m: float(p) for m, p in prices.items() if p is not None}, volumes
+
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="get_krw_balance")
     def get_krw_balance(self) -> float:
-        if self.dry_run:
-            return 1_000_000.0
-        assert self._upbit is not None
-        balances = self._upbit.get_balances()
+        if self._sim is not None:
+            return self._sim.get_krw_balance()
+        assert self._backend is not None
+        balances = self._exchange("exchange", PRIORITY_QUERY, self._backend.accounts, key=("balances",))
         for b in balances:
             if b.get('currency') == 'KRW':
                 return float(b.get('balance') or 0.0)
         return 0.0
 
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="buy_market")
     def buy_market(self, market: str, krw: float) -> Dict[str, Any]:
-        if self.dry_run:
-            return {"uuid": f"dry-{time.time()}", "side": "bid", "market": market, "krw": krw}
-        assert self._upbit is not None
-        return self._upbit.buy_market_order(market, krw)
+        if self._sim is not None:
+            return self._sim.buy_market(market, krw)
+        assert self._backend is not None
+        return self._exchange("order", PRIORITY_BUY, lambda: self._backend.buy_market(market, krw))
 
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="sell_limit")
     def sell_limit(self, market: str, volume: float, price: float) -> Dict[str, Any]:
-        if self.dry_run:
-            return {"uuid": f"dry-{time.time()}", "side": "ask", "market": market, "price": price, "volume": volume}
-        assert self._upbit is not None
-        return self._upbit.sell_limit_order(market, price, volume)
+        if self._sim is not None:
+            return self._sim.sell_limit(market, volume, price)
+        assert self._backend is not None
+        return self._exchange("order", PRIORITY_SELL, lambda: self._backend.sell_limit(market, volume, price))
 
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="get_order")
     def get_order(self, uuid: str) -> Dict[str, Any]:
-        if self.dry_run:
-            # 드라이런에서는 즉시 체결로 가정
-            return {
-                "uuid": uuid,
-                "state": "done",
-                "executed_volume": "0",
-                "trades": [],
-            }
-        assert self._upbit is not None
-        return self._upbit.get_order(uuid)
+        if self._sim is not None:
+            return self._sim.get_order(uuid)
+        assert self._backend is not None
+        return self._exchange("exchange", PRIORITY_QUERY, lambda: self._backend.order(uuid), key=("order", uuid))
+
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="get_open_orders")
+    def get_open_orders(self, market: str, page_limit: int = 100) -> List[Dict[str, Any]]:
+        """market의 미체결(wait) 주문 목록을 페이지 단위로 모두 조회합니다. 응답에 trades는 포함되지 않습니다."""
+        if self._sim is not None:
+            return self._sim.get_open_orders(market, page_limit)
+        assert self._backend is not None
+        results: List[Dict[str, Any]] = []
+        page = 1
+        while True:
+            orders = self._exchange(
+                "exchange",
+                PRIORITY_QUERY,
+                lambda: self._backend.open_orders(market, page, page_limit),
+                key=("open_orders", market, page, page_limit),
+            )
+            if not isinstance(orders, list):
+                raise RuntimeError(f"미체결 주문 목록 조회 실패: {market} -> {orders}")
+            results.extend(orders)
+            if len(orders) < page_limit:
+                return results
+            page += 1
 
+    def wait_order_update(self, uuid: str, timeout: float, poll_interval: float = 1.0) -> None:
+        """
+        주문 상태가 바뀔 때까지 기다립니다.
+        주문 이벤트 스트림이 연결되어 있으면 종료 이벤트가 오는 즉시(최대 timeout초) 반환하고,
+        아니면 poll_interval초 쉬어 다음 REST 조회를 하도록 합니다.
+        """
+        if self._sim is not None:
+            # 모의 거래소는 기다리지 않고 바로 다음 조회를 하도록 합니다.
+            return
+        if self.events is not None and self.events.connected:
+            self.events.wait_for_order(uuid, max(timeout, poll_interval))
+            return
+        time.sleep(poll_interval)
+
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="cancel_order")
     def cancel_order(self, uuid: str) -> Dict[str, Any]:
-        if self.dry_run:
-            return {"uuid": uuid}
-        assert self._upbit is not None
-        return self._upbit.cancel_order(uuid)
+        if self._sim is not None:
+            return self._sim.cancel_order(uuid)
+        assert self._backend is not None
+        return self._exchange("order", PRIORITY_CANCEL, lambda: self._backend.cancel(uuid))
+
+    @timed(UPBIT_CALL_SECONDS, UPBIT_CALL_ERRORS, method="cancel_and_new")
+    def cancel_and_new(self, uuid: str, market: str, volume: Optional[float], price: float) -> Dict[str, Any]:
+        """
+        지정가 매도 주문을 취소하고 새 가격으로 다시 냅니다. 결과의 new_order_uuid가 새 주문입니다.
+        취소 후 재주문 API를 쓸 수 없는 백엔드(pyupbit)는 취소와 매도를 차례로 보냅니다.
+        :param volume: 새 주문 수량. None이면 기존 주문의 남은 수량
+        """
+        if self._sim is not None:
+            return self._sim.cancel_and_new(uuid, market, volume, price)
+        assert self._backend is not None
+        if hasattr(self._backend, "cancel_and_new"):
+            return self._exchange("order", PRIORITY_CANCEL, lambda: self._backend.cancel_and_new(uuid, volume, price))
+        cancelled = self._exchange("order", PRIORITY_CANCEL, lambda: self._backend.cancel(uuid))
+        if not cancelled or "error" in cancelled:
+            return cancelled or {}
+        if volume is None:
+            volume = float(cancelled.get("remaining_volume") or 0.0)
+        new_order = self._exchange("order", PRIORITY_SELL, lambda: self._backend.sell_limit(market, volume, price))
+        if not new_order or not new_order.get("uuid"):
+            return new_order or {}
+        return dict(cancelled, new_order_uuid=new_order["uuid"])
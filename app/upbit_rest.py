@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Upbit REST 클라이언트 (pyupbit 없이 직접 호출)
+- keep-alive 커넥션 풀(requests.Session)을 재사용하여 요청마다 TLS 핸드셰이크를 하지 않습니다.
+- 인증 토큰은 UpbitSigner로 만들며, 반복되는 쿼리의 query_hash는 캐시됩니다.
+- 응답 본문은 bytes 그대로 JSON 파싱하고 (orjson이 있으면 사용), Remaining-Req 헤더와 함께 반환합니다.
+- 모든 메서드는 (결과, Remaining-Req 헤더 문자열)을 반환하여 RequestScheduler가 버킷을 보정할 수 있게 합니다.
+- AsyncUpbitRestClient는 같은 요청을 aiohttp 세션으로 보냅니다 (aiohttp 설치 시).
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from .upbit_auth import UpbitSigner, build_query_string
+
+try:
+    import requests  # type: ignore
+    from requests.adapters import HTTPAdapter  # type: ignore
+except Exception:
+    requests = None
+
+try:
+    import orjson  # type: ignore
+    _loads = orjson.loads
+except Exception:
+    _loads = json.loads
+
+UPBIT_API_URL = "https://api.upbit.com"
+
+Response = Tuple[Any, Optional[str]]
+
+
+class UpbitApiError(RuntimeError):
+    """Upbit REST 오류 응답 (status_code 429는 속도 제한)"""
+
+    def __init__(self, status_code: int, name: str = "", message: str = ""):
+        super().__init__(f"Upbit API 오류 {status_code} {name}: {message}")
+        self.status_code = status_code
+        self.name = name
+        self.message = message
+
+
+def _parse_body(status_code: int, body: bytes) -> Any:
+    """성공 응답은 JSON으로, 오류 응답은 UpbitApiError로 바꿉니다."""
+    if status_code < 400:
+        return _loads(body) if body else None
+    name, message = "", ""
+    try:
+        error = _loads(body).get("error") or {}
+        name, message = error.get("name", ""), error.get("message", "")
+    except Exception:
+        # 429는 JSON이 아닌 텍스트 본문으로 오기도 합니다.
+        name = body.decode("utf-8", "replace")[:200]
+    raise UpbitApiError(status_code, name, message)
+
+
+class _UpbitRestBase:
+    """동기/비동기 클라이언트가 공유하는 요청 구성 (URL, 서명, 본문)"""
+
+    def __init__(self, access_key: str, secret_key: str, base_url: str = UPBIT_API_URL, timeout: float = 5.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._signer = UpbitSigner(access_key, secret_key) if access_key and secret_key else None
+
+    def _prepare(self, method: str, path: str, params: Optional[Dict[str, Any]], auth: bool) -> Tuple[str, Dict[str, str], Optional[bytes]]:
+        query_string = build_query_string(params)
+        headers: Dict[str, str] = {}
+        if auth:
+            if self._signer is None:
+                raise RuntimeError("인증이 필요한 요청에 UPBIT_ACCESS_KEY / UPBIT_SECRET_KEY가 없습니다.")
+            headers["Authorization"] = self._signer.authorization(query_string)
+        url = self.base_url + path
+        body = None
+        if method == "POST":
+            headers["Content-Type"] = "application/json; charset=utf-8"
+            body = json.dumps(params or {}, separators=(",", ":")).encode()
+        elif params:
+            url += "?" + urlencode(params, doseq=True)
+        return url, headers, body
+
+    # ---- 엔드포인트별 요청 정의: (method, path, params, auth) ----
+
+    @staticmethod
+    def _ticker_request(markets: List[str]):
+        return "GET", "/v1/ticker", {"markets": ",".join(markets)}, False
+
+    @staticmethod
+    def _accounts_request():
+        return "GET", "/v1/accounts", None, True
+
+    @staticmethod
+    def _order_request(uuid: str):
+        return "GET", "/v1/order", {"uuid": uuid}, True
+
+    @staticmethod
+    def _open_orders_request(market: str, page: int, limit: int):
+        return "GET", "/v1/orders/open", {"market": market, "state": "wait", "page": page, "limit": limit, "order_by": "desc"}, True
+
+    @staticmethod
+    def _buy_market_request(market: str, krw: float):
+        return "POST", "/v1/orders", {"market": market, "side": "bid", "ord_type": "price", "price": _fmt_number(krw)}, True
+
+    @staticmethod
+    def _sell_limit_request(market: str, volume: float, price: float):
+        return "POST", "/v1/orders", {
+            "market": market,
+            "side": "ask",
+            "ord_type": "limit",
+            "price": _fmt_number(price),
+            "volume": _fmt_number(volume),
+        }, True
+
+    @staticmethod
+    def _cancel_request(uuid: str):
+        return "DELETE", "/v1/order", {"uuid": uuid}, True
+
+    @staticmethod
+    def _cancel_and_new_request(uuid: str, volume: Optional[float], price: float):
+        return "POST", "/v1/orders/cancel_and_new", {
+            "prev_order_uuid": uuid,
+            "new_ord_type": "limit",
+            "new_price": _fmt_number(price),
+            "new_volume": "remain_only" if volume is None else _fmt_number(volume),
+        }, True
+
+
+def _fmt_number(value: float) -> str:
+    """지수 표기 없이 숫자를 문자열로 보냅니다 (업비트는 1e-05 같은 표기를 거부합니다)."""
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.8f}".rstrip("0").rstrip(".")
+
+
+def _ticker_prices(rows: list) -> Dict[str, float]:
+    return {row["market"]: float(row["trade_price"]) for row in rows}
+
+
+def _ticker_acc_volumes(rows: list) -> Dict[str, float]:
+    """마켓 -> 당일 누적 거래량 (응답에 없으면 빠집니다)"""
+    return {row["market"]: float(row["acc_trade_volume"]) for row in rows if row.get("acc_trade_volume") is not None}
+
+
+class UpbitRestClient(_UpbitRestBase):
+    """keep-alive 세션을 재사용하는 동기 클라이언트 (여러 스레드에서 공유 가능)"""
+
+    def __init__(self, access_key: str, secret_key: str, base_url: str = UPBIT_API_URL, timeout: float = 5.0, pool_size: int = 10):
+        if requests is None:
+            raise RuntimeError("requests 모듈이 필요합니다. requirements.txt로 설치해 주세요.")
+        super().__init__(access_key, secret_key, base_url, timeout)
+        self.session = requests.Session()
+        # 재시도는 RequestScheduler가 담당하므로 어댑터 재시도는 끕니다.
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+    def _send(self, method: str, path: str, params: Optional[Dict[str, Any]], auth: bool) -> Response:
+        url, headers, body = self._prepare(method, path, params, auth)
+        resp = self.session.request(method, url, headers=headers, data=body, timeout=self.timeout)
+        return _parse_body(resp.status_code, resp.content), resp.headers.get("Remaining-Req")
+
+    def ticker(self, markets: List[str]) -> Response:
+        rows, remaining = self._send(*self._ticker_request(markets))
+        return _ticker_prices(rows), remaining
+
+    def ticker_with_volumes(self, markets: List[str]) -> Response:
+        """((마켓 -> 현재가), (마켓 -> 누적 거래량))을 한 번의 ticker 요청으로 가져옵니다."""
+        rows, remaining = self._send(*self._ticker_request(markets))
+        return (_ticker_prices(rows), _ticker_acc_volumes(rows)), remaining
+
+    def accounts(self) -> Response:
+        return self._send(*self._accounts_request())
+
+    def order(self, uuid: str) -> Response:
+        return self._send(*self._order_request(uuid))
+
+    def open_orders(self, market: str, page: int = 1, limit: int = 100) -> Response:
+        return self._send(*self._open_orders_request(market, page, limit))
+
+    def buy_market(self, market: str, krw: float) -> Response:
+        return self._send(*self._buy_market_request(market, krw))
+
+    def sell_limit(self, market: str, volume: float, price: float) -> Response:
+        return self._send(*self._sell_limit_request(market, volume, price))
+
+    def cancel(self, uuid: str) -> Response:
+        return self._send(*self._cancel_request(uuid))
+
+    def cancel_and_new(self, uuid: str, volume: Optional[float], price: float) -> Response:
+        """기존 주문을 취소하고 지정가 주문을 새로 냅니다. 응답의 new_order_uuid가 새 주문입니다."""
+        return self._send(*self._cancel_and_new_request(uuid, volume, price))
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncUpbitRestClient(_UpbitRestBase):
+    """aiohttp 커넥션 풀을 쓰는 비동기 클라이언트. 같은 이벤트 루프 안에서 사용합니다."""
+
+    def __init__(self, access_key: str, secret_key: str, base_url: str = UPBIT_API_URL, timeout: float = 5.0, pool_size: int = 10):
+        try:
+            import aiohttp  # type: ignore
+        except Exception:
+            raise RuntimeError("aiohttp 모듈이 필요합니다. pip install aiohttp 로 설치해 주세요.")
+        super().__init__(access_key, secret_key, base_url, timeout)
+        self._aiohttp = aiohttp
+        self._pool_size = pool_size
+        self._session = None
+
+    async def _get_session(self):
+        if self._session is None:
+            self._session = self._aiohttp.ClientSession(
+                connector=self._aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=60),
+                timeout=self._aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Accept": "application/json"},
+            )
+        return self._session
+
+    async def _send(self, method: str, path: str, params: Optional[Dict[str, Any]], auth: bool) -> Response:
+        url, headers, body = self._prepare(method, path, params, auth)
+        session = await self._get_session()
+        async with session.request(method, url, headers=headers, data=body) as resp:
+            content = await resp.read()
+            return _parse_body(resp.status, content), resp.headers.get("Remaining-Req")
+
+    async def ticker(self, markets: List[str]) -> Response:
+        rows, remaining = await self._send(*self._ticker_request(markets))
+        return _ticker_prices(rows), remaining
+
+    async def ticker_with_volumes(self, markets: List[str]) -> Response:
+        rows, remaining = await self._send(*self._ticker_request(markets))
+        return (_ticker_prices(rows), _ticker_acc_volumes(rows)), remaining
+
+    async def accounts(self) -> Response:
+        return await self._send(*self._accounts_request())
+
+    async def order(self, uuid: str) -> Response:
+        return await self._send(*self._order_request(uuid))
+
+    async def open_orders(self, market: str, page: int = 1, limit: int = 100) -> Response:
+        return await self._send(*self._open_orders_request(market, page, limit))
+
+    async def buy_market(self, market: str, krw: float) -> Response:
+        return await self._send(*self._buy_market_request(market, krw))
+
+    async def sell_limit(self, market: str, volume: float, price: float) -> Response:
+        return await self._send(*self._sell_limit_request(market, volume, price))
+
+    async def cancel(self, uuid: str) -> Response:
+        return await self._send(*self._cancel_request(uuid))
+
+    async def cancel_and_new(self, uuid: str, volume: Optional[float], price: float) -> Response:
+        return await self._send(*self._cancel_and_new_request(uuid, volume, price))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -1,11 +1,15 @@
-
 # -*- coding: utf-8 -*-
 """
 Upbit 호가단위(틱) 반올림/내림 유틸리티
 - KRW 마켓 기준
+- 호가단위 테이블은 정수 고정소수점(단위 수, 배율)으로 미리 컴파일하고 bisect로 찾습니다.
+- 결과는 Decimal(str(x)) 기반 계산과 비트 단위로 같으며, 범위를 벗어난 값만 Decimal로 계산합니다.
 """
+import bisect
+import math
 from decimal import Decimal, ROUND_DOWN, ROUND_UP
-from typing import Optional
+from functools import lru_cache
+from typing import Iterable, Optional
 
 
 CUSTOM_MARKET_TICK = {
@@ -15,27 +19,72 @@ CUSTOM_MARKET_TICK = {
     "KRW-ETH": Decimal("1000"),
 }
 
+# (가격 상한, 호가단위): 가격이 상한 미만이면 해당 호가단위, 마지막 상한 이상이면 _KRW_TOP_TICK
+_KRW_TICK_TABLE = (
+    (10, Decimal('0.01')),
+    (100, Decimal('0.1')),
+    (1000, Decimal('1')),
+    (10000, Decimal('5')),
+    (100000, Decimal('10')),
+    (500000, Decimal('50')),
+    (1000000, Decimal('100')),
+    (2000000, Decimal('500')),
+)
+_KRW_TOP_TICK = Decimal('1000')
+
+# 상한 값은 모두 float로 정확히 표현되는 정수이므로, float 비교가 Decimal(str(p)) 비교와 같습니다.
+_TICK_BOUNDS = [float(bound) for bound, _ in _KRW_TICK_TABLE]
+_TICK_DECIMALS = [tick for _, tick in _KRW_TICK_TABLE] + [_KRW_TOP_TICK]
+
+# 배율을 곱한 값이 10^15 미만이면 float -> 10진 변환이 정확하므로 정수 연산을 사용합니다.
+_FAST_LIMIT = 10 ** 15
+
+
+@lru_cache(maxsize=None)
+def _compile_tick(tick: Decimal) -> tuple[int, int]:
+    """호가단위를 (단위 수, 배율) 정수 쌍으로 바꿉니다. 예: 0.01 -> (1, 100), 5 -> (5, 1)"""
+    exponent = tick.as_tuple().exponent
+    scale = 10 ** max(0, -exponent)
+    return int(tick * scale), scale
+
+
+_TICK_UNITS = [_compile_tick(tick) for tick in _TICK_DECIMALS]
+
 
 def krw_tick_size(price: float) -> Decimal:
+    return _TICK_DECIMALS[bisect.bisect_right(_TICK_BOUNDS, price)]
+
+
+def _floor_scaled(x: float, scale: int) -> tuple[int, bool]:
+    """
+    x의 최단 10진 표현 d에 대해 (floor(d * scale), d * scale이 정수인지)를 반환합니다.
+    x >= 0 이고 x * scale < 10^15 일 때만 사용합니다.
+    """
+    k = math.floor(x * scale)
+    # x * scale 곱셈의 반올림 오차를 보정합니다. k / scale은 올바르게 반올림되는 나눗셈이고,
+    # 15자리 이하의 10진수는 서로 다른 float로 표현되므로 float 비교가 10진 비교와 같습니다.
+    while (k + 1) / scale <= x:
+        k += 1
+    while k / scale > x:
+        k -= 1
+    return k, k / scale == x
+
+
+def _round_scaled(price: float, units: int, scale: int, method: str) -> float:
+    k, exact = _floor_scaled(price, scale)
+    n = k // units
+    if method != 'down' and not (exact and k % units == 0):
+        n += 1
+    return n * units / scale
+
+
+def _round_price_to_tick_decimal(price: float, method: str, t: Decimal) -> float:
     p = Decimal(str(price))
-    if p < Decimal('10'):
-        return Decimal('0.01')
-    elif p < Decimal('100'):
-        return Decimal('0.1')
-    elif p < Decimal('1000'):
-        return Decimal('1')
-    elif p < Decimal('10000'):
-        return Decimal('5')
-    elif p < Decimal('100000'):
-        return Decimal('10')
-    elif p < Decimal('500000'):
-        return Decimal('50')
-    elif p < Decimal('1000000'):
-        return Decimal('100')
-    elif p < Decimal('2000000'):
-        return Decimal('500')
+    if method == 'down':
+        q = (p / t).to_integral_value(rounding=ROUND_DOWN)
     else:
-        return Decimal('1000')
+        q = (p / t).to_integral_value(rounding=ROUND_UP)
+    return float(q * t)
 
 
 def round_price_to_tick(price: float, method: str = 'up', market: Optional[str] = None) -> float:
@@ -46,16 +95,38 @@ def round_price_to_tick(price: float, method: str = 'up', market: Optional[str]
     """
     if market and market in CUSTOM_MARKET_TICK:
         t = CUSTOM_MARKET_TICK[market]
+        units, scale = _compile_tick(t)
     else:
-        t = krw_tick_size(price)
-    p = Decimal(str(price))
-    if method == 'down':
-        q = (p / t).to_integral_value(rounding=ROUND_DOWN)
-    else:
-        q = (p / t).to_integral_value(rounding=ROUND_UP)
-    return float(q * t)
+        i = bisect.bisect_right(_TICK_BOUNDS, price)
+        t = _TICK_DECIMALS[i]
+        units, scale = _TICK_UNITS[i]
+    if 0 < price and price * scale < _FAST_LIMIT:
+        return _round_scaled(price, units, scale, method)
+    return _round_price_to_tick_decimal(price, method, t)
+
+
+def round_prices_to_tick(prices: Iterable[float], method: str = 'up', market: Optional[str] = None) -> list[float]:
+    """여러 가격(리스트나 numpy 배열)을 한 번에 호가단위로 맞춥니다. 결과는 round_price_to_tick을 각각 호출한 것과 같은 float 리스트입니다."""
+    if market and market in CUSTOM_MARKET_TICK:
+        # 마켓 호가단위가 고정이면 테이블 조회를 한 번만 합니다.
+        t = CUSTOM_MARKET_TICK[market]
+        units, scale = _compile_tick(t)
+        return [
+            _round_scaled(p, units, scale, method) if 0 < p and p * scale < _FAST_LIMIT
+            else _round_price_to_tick_decimal(p, method, t)
+            for p in prices
+        ]
+    return [round_price_to_tick(p, method) for p in prices]
 
 
 def round_volume(v: float, digits: int = 8) -> float:
     # 업비트는 보통 8자리 소수 지원
+    scale = 10 ** digits
+    if 0 <= v and v * scale < _FAST_LIMIT:
+        return _floor_scaled(v, scale)[0] / scale
     return float(Decimal(str(v)).quantize(Decimal('1.' + '0' * digits), rounding=ROUND_DOWN))
+
+
+def round_volumes(volumes: Iterable[float], digits: int = 8) -> list[float]:
+    """여러 수량(리스트나 numpy 배열)을 한 번에 소수점 digits자리로 내림합니다."""
+    return [round_volume(v, digits) for v in volumes]
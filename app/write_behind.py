@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Firestore write-behind 저장
+- upsert는 로컬 저널(fsync)에 먼저 기록하고, Firestore에는 백그라운드에서 배치로 반영합니다.
+- 같은 buy_uuid에 대한 연속 업데이트는 마지막 값 하나로 합쳐집니다.
+- 반영되지 않은 기록은 다음 시작 시 저널에서 복구되어 다시 전송됩니다.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+log = logging.getLogger("trade")
+
+
+class TradeJournal:
+    """fsync된 append-only JSONL 저널.
+
+    각 줄은 {"seq": n, "data": {...}} 형태의 upsert 기록이거나,
+    seq 이하의 모든 기록이 Firestore에 반영되었음을 뜻하는 {"seq": n, "commit": true} 입니다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._seq = 0
+        self._fp = None
+
+    def open(self) -> list[tuple[int, dict]]:
+        """저널을 열고 아직 반영되지 않은 (seq, data) 목록을 기록 순서대로 반환합니다."""
+        pending: dict[str, tuple[int, dict]] = {}
+        committed = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as fp:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 마지막 줄이 쓰는 도중 끊긴 경우
+                        log.warning(f"저널의 손상된 줄을 무시합니다: {self.path}")
+                        continue
+                    seq = int(record.get("seq", 0))
+                    self._seq = max(self._seq, seq)
+                    if record.get("commit"):
+                        committed = max(committed, seq)
+                        continue
+                    data = record.get("data") or {}
+                    buy_uuid = data.get("buy_uuid")
+                    if buy_uuid:
+                        pending[buy_uuid] = (seq, data)
+        self._fp = open(self.path, "a", encoding="utf-8")
+        replay = [item for item in pending.values() if item[0] > committed]
+        replay.sort(key=lambda item: item[0])
+        return replay
+
+    def _write(self, record: dict):
+        self._write_many([record])
+
+    def _write_many(self, records: list[dict]):
+        self._fp.write("".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in records))
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    def append(self, data: dict) -> int:
+        self._seq += 1
+        self._write({"seq": self._seq, "data": data})
+        return self._seq
+
+    def append_many(self, items: list[dict]) -> list[int]:
+        """여러 기록을 한 번의 fsync로 추가하고 각 seq를 반환합니다."""
+        start = self._seq + 1
+        self._seq += len(items)
+        self._write_many([{"seq": start + i, "data": data} for i, data in enumerate(items)])
+        return list(range(start, self._seq + 1))
+
+    def commit(self, seq: int):
+        self._write({"seq": seq, "commit": True})
+
+    def size(self) -> int:
+        return self._fp.tell() if self._fp else 0
+
+    def compact(self, pending: list[tuple[int, dict]]):
+        """반영되지 않은 기록만 남기도록 저널을 원자적으로 다시 씁니다."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            for seq, data in pending:
+                fp.write(json.dumps({"seq": seq, "data": data}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._fp.close()
+        os.replace(tmp_path, self.path)
+        self._fp = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+
+class WriteBehindWriter:
+    """저널에 기록한 upsert를 모아 Firestore 배치 쓰기로 반영하는 백그라운드 작성기"""
+
+    def __init__(self, db_instance, journal: TradeJournal, flush_size: int = 100, flush_interval_sec: float = 1.0,
+                 compact_bytes: int = 4 * 1024 * 1024):
+        self.db = db_instance
+        self.journal = journal
+        self.flush_size = flush_size
+        self.flush_interval_sec = flush_interval_sec
+        self.compact_bytes = compact_bytes
+        # buy_uuid -> (seq, data). 같은 거래의 업데이트는 마지막 값으로 덮어씁니다.
+        self._pending: dict[str, tuple[int, dict]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> list[dict]:
+        """저널을 복구하고 백그라운드 작성기를 시작합니다. 복구된 거래 목록을 반환합니다."""
+        replay = self.journal.open()
+        with self._lock:
+            for seq, data in replay:
+                self._pending[data["buy_uuid"]] = (seq, data)
+        if replay:
+            print(f"저널에서 Firestore에 반영되지 않은 거래 {len(replay)}건을 복구했습니다.")
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        return [data for _, data in replay]
+
+    def submit(self, data: dict) -> bool:
+        """거래를 저널에 기록하고 Firestore 반영 대기열에 넣습니다."""
+        # 호출부가 dict를 계속 수정하므로 현재 값을 복사해 둡니다.
+        data = dict(data)
+        with self._lock:
+            seq = self.journal.append(data)
+            self._pending[data["buy_uuid"]] = (seq, data)
+            if len(self._pending) >= self.flush_size:
+                self._wakeup.set()
+        return True
+
+    def submit_many(self, items: list[dict]) -> bool:
+        """여러 거래를 한 번의 저널 기록(fsync 1회)으로 대기열에 넣습니다."""
+        items = [dict(data) for data in items]
+        with self._lock:
+            for seq, data in zip(self.journal.append_many(items), items):
+                self._pending[data["buy_uuid"]] = (seq, data)
+            if len(self._pending) >= self.flush_size:
+                self._wakeup.set()
+        return True
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def pending_trades(self) -> list[dict]:
+        """아직 Firestore에 반영되지 않은 거래들의 최신 값을 반환합니다."""
+        with self._lock:
+            return [data for _, data in sorted(self._pending.values(), key=lambda item: item[0])]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval_sec)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> bool:
+        """대기중인 모든 거래를 Firestore 배치 쓰기로 반영합니다."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                items = self._pending
+                self._pending = {}
+            max_seq = max(seq for seq, _ in items.values())
+
+            ok = self.db.upsert_trades_batch([data for _, data in items.values()])
+
+            with self._lock:
+                if not ok:
+                    # 실패한 항목은 그 사이 더 새로운 값이 들어오지 않았다면 다시 대기열에 넣습니다.
+                    for buy_uuid, item in items.items():
+                        self._pending.setdefault(buy_uuid, item)
+                    log.error(f"Firestore 배치 쓰기 실패, {len(items)}건을 다음 주기에 재시도합니다.")
+                    return False
+                self.journal.commit(max_seq)
+                if self.journal.size() > self.compact_bytes:
+                    self.journal.compact(sorted(self._pending.values(), key=lambda item: item[0]))
+            return True
+
+    def close(self):
+        """작성기를 멈추고 남은 거래를 반영합니다."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        self.journal.close()
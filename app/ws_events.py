@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Upbit WebSocket 이벤트 수신
+- 공개 ticker 스트림으로 현재가를, 개인 myOrder 스트림으로 주문 상태 변화를 받습니다.
+- 연결이 끊기면 지수 백오프로 재연결하고, 재연결 시 on_reconnect 콜백으로 REST 보정(backfill)을 요청합니다.
+- 이벤트 루프는 별도 스레드에서 동작하며, 매매 로직은 스레드 안전한 메서드로만 접근합니다.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid as uuid_lib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .upbit_auth import UpbitSigner
+
+try:
+    from websockets.asyncio.client import connect as ws_connect  # type: ignore
+except Exception:
+    ws_connect = None
+
+log = logging.getLogger("trade")
+
+UPBIT_WS_URL = "wss://api.upbit.com/websocket/v1"
+UPBIT_WS_PRIVATE_URL = "wss://api.upbit.com/websocket/v1/private"
+
+TERMINAL_ORDER_STATES = {"done", "cancel"}
+
+
+def make_ws_token(access_key: str, secret_key: str) -> str:
+    """개인 스트림 인증용 HS256 JWT (query 없음)"""
+    return UpbitSigner(access_key, secret_key).token()
+
+
+class OrderEventHub:
+    """ticker/myOrder 스트림을 구독하고 주문 체결 이벤트를 대기자에게 전달합니다."""
+
+    def __init__(
+        self,
+        markets: list[str],
+        access_key: str = "",
+        secret_key: str = "",
+        url: str = UPBIT_WS_URL,
+        private_url: str = UPBIT_WS_PRIVATE_URL,
+        on_price: Optional[Callable[[str, float], None]] = None,
+        on_sell_done: Optional[Callable[[str], None]] = None,
+        on_reconnect: Optional[Callable[[], None]] = None,
+    ):
+        if ws_connect is None:
+            raise RuntimeError("websockets 모듈이 필요합니다. requirements.txt로 설치해 주세요.")
+        self.markets = list(markets)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.url = url
+        self.private_url = private_url
+        self.on_price = on_price
+        self.on_sell_done = on_sell_done
+        self.on_reconnect = on_reconnect
+
+        self._lock = threading.Lock()
+        # uuid -> 종료 상태 이벤트 대기자
+        self._waiters: Dict[str, threading.Event] = {}
+        # 대기자가 등록되기 전에 도착한 종료 상태 (uuid -> 수신 시각)
+        self._terminal: Dict[str, float] = {}
+        self._connected = {"ticker": False, "myOrder": False}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # 체결 반영/보정 콜백은 이벤트 루프를 막지 않도록 별도 스레드에서 순서대로 실행합니다.
+        self._callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ws-callback")
+
+    # ---- 매매 스레드에서 호출하는 메서드 ----
+
+    @property
+    def connected(self) -> bool:
+        """주문 스트림이 연결되어 있어 체결 이벤트를 신뢰할 수 있는지 여부"""
+        return self._connected["myOrder"]
+
+    @property
+    def ticker_connected(self) -> bool:
+        return self._connected["ticker"]
+
+    def wait_for_order(self, uuid: str, timeout: float) -> bool:
+        """주문이 종료 상태(done/cancel)가 될 때까지 최대 timeout초 기다립니다."""
+        with self._lock:
+            if self._terminal.pop(uuid, None) is not None:
+                return True
+            event = self._waiters.setdefault(uuid, threading.Event())
+        try:
+            return event.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters.pop(uuid, None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_loop, name="ws-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        if self._loop is not None and self._loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+            except Exception as e:
+                log.warning(f"WebSocket 이벤트 루프 종료 중 오류: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._callbacks.shutdown(wait=False)
+
+    # ---- 이벤트 루프 ----
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        streams = [self._stream("ticker", self.url, None)]
+        # 로컬 대역 서버(private_url 지정)는 인증 없이도 주문 스트림을 보내 줍니다.
+        if (self.access_key and self.secret_key) or self.private_url != UPBIT_WS_PRIVATE_URL:
+            streams.append(self._stream("myOrder", self.private_url, self._auth_headers))
+        else:
+            log.warning("API 키가 없어 주문(myOrder) 스트림은 구독하지 않습니다.")
+        for coro in streams:
+            self._loop.create_task(coro)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _shutdown(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _auth_headers(self) -> Dict[str, str]:
+        if not (self.access_key and self.secret_key):
+            return {}
+        return {"Authorization": f"Bearer {make_ws_token(self.access_key, self.secret_key)}"}
+
+    async def _stream(self, kind: str, url: str, headers_factory: Optional[Callable[[], Dict[str, str]]]):
+        backoff = 1.0
+        first = True
+        while not self._stopping:
+            try:
+                headers = headers_factory() if headers_factory else None
+                async with ws_connect(url, additional_headers=headers, ping_interval=20) as ws:
+                    await ws.send(json.dumps([
+                        {"ticket": f"coinbox-{uuid_lib.uuid4()}"},
+                        {"type": kind, "codes": self.markets},
+                        {"format": "DEFAULT"},
+                    ]))
+                    self._connected[kind] = True
+                    log.info(f"WebSocket {kind} 스트림 연결: {url}")
+                    if not first:
+                        self._handle_reconnect(kind)
+                    first = False
+                    backoff = 1.0
+                    async for raw in ws:
+                        self._dispatch(json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"WebSocket {kind} 스트림 오류, {backoff:.0f}초 후 재연결합니다: {e}")
+            finally:
+                if self._connected[kind]:
+                    self._connected[kind] = False
+                    self._release_waiters()
+            if self._stopping:
+                break
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _handle_reconnect(self, kind: str):
+        # 끊겨 있던 동안의 이벤트는 REST로 보정합니다.
+        if kind == "myOrder" and self.on_reconnect is not None:
+            self._callbacks.submit(self._safe_call, self.on_reconnect)
+
+    @staticmethod
+    def _safe_call(fn: Callable, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            log.exception(f"WebSocket 이벤트 처리 오류: {e}")
+
+    def _release_waiters(self):
+        # 연결이 끊기면 대기 중인 매수 체결 확인을 REST 조회로 돌려보냅니다.
+        with self._lock:
+            for event in self._waiters.values():
+                event.set()
+
+    def _dispatch(self, msg: Dict[str, Any]):
+        kind = msg.get("type") or msg.get("ty")
+        if kind == "ticker":
+            market = msg.get("code") or msg.get("cd")
+            price = msg.get("trade_price", msg.get("tp"))
+            if market and price is not None and self.on_price is not None:
+                self.on_price(market, float(price))
+        elif kind == "myOrder":
+            self._on_order(msg)
+
+    def _on_order(self, msg: Dict[str, Any]):
+        order_uuid = msg.get("uuid")
+        state = msg.get("state")
+        if not order_uuid or state not in TERMINAL_ORDER_STATES:
+            return
+        with self._lock:
+            event = self._waiters.get(order_uuid)
+            if event is not None:
+                event.set()
+            else:
+                now = time.time()
+                self._terminal[order_uuid] = now
+                # 오래된 기록은 정리합니다.
+                if len(self._terminal) > 1000:
+                    self._terminal = {k: v for k, v in self._terminal.items() if now - v < 600}
+        # 매도 체결(done)만 즉시 반영합니다. 취소(cancel)는 재주문 과정에서도 발생하므로
+        # 다음 사이클의 미체결 주문 확인에서 처리합니다.
+        if msg.get("ask_bid") == "ASK" and state == "done" and self.on_sell_done is not None:
+            self._callbacks.submit(self._safe_call, self.on_sell_done, order_uuid)
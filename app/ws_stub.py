@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+오프라인 테스트용 Upbit WebSocket 대역 서버
+- 구독 요청을 받은 뒤 publish()로 넣은 ticker/myOrder 메시지를 구독 타입에 맞춰 전달합니다.
+- 인증 헤더는 검사하지 않으므로 OrderEventHub의 url/private_url을 이 서버로 지정해 사용합니다.
+
+예) python -m app.ws_stub --port 8765 --market KRW-BTC
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+from typing import Any, Dict, Optional, Set
+
+try:
+    from websockets.asyncio.server import serve  # type: ignore
+except Exception:
+    serve = None
+
+
+class StubUpbitWebSocketServer:
+    """Upbit ticker/myOrder 스트림을 흉내 내는 로컬 WebSocket 서버"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        if serve is None:
+            raise RuntimeError("websockets 모듈이 필요합니다. requirements.txt로 설치해 주세요.")
+        self.host = host
+        self.port = port
+        self._clients: Set[Any] = set()
+        self._subscriptions: Dict[Any, Set[str]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self) -> "StubUpbitWebSocketServer":
+        """백그라운드 스레드에서 서버를 시작하고, 포트가 열릴 때까지 기다립니다."""
+        self._thread = threading.Thread(target=self._run, name="ws-stub", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def publish(self, message: Dict[str, Any]):
+        """구독 타입이 일치하는 모든 연결에 메시지를 보냅니다 (스레드 안전)."""
+        assert self._loop is not None
+        asyncio.run_coroutine_threadsafe(self._broadcast(message), self._loop)
+
+    def disconnect_all(self):
+        """재연결/보정 경로를 시험하기 위해 모든 연결을 끊습니다."""
+        assert self._loop is not None
+        for ws in list(self._clients):
+            asyncio.run_coroutine_threadsafe(ws.close(), self._loop)
+
+    def publish_ticker(self, market: str, price: float):
+        self.publish({"type": "ticker", "code": market, "trade_price": price, "stream_type": "REALTIME"})
+
+    def publish_order(self, market: str, uuid: str, ask_bid: str, state: str, **fields):
+        self.publish({"type": "myOrder", "code": market, "uuid": uuid, "ask_bid": ask_bid, "state": state, **fields})
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start_server())
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _start_server(self):
+        self._server = await serve(self._handler, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _shutdown(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handler(self, ws):
+        self._clients.add(ws)
+        try:
+            async for raw in ws:
+                request = json.loads(raw)
+                self._subscriptions[ws] = {item["type"] for item in request if "type" in item}
+        except Exception:
+            # 클라이언트가 비정상 종료해도 서버는 계속 동작합니다.
+            pass
+        finally:
+            self._clients.discard(ws)
+            self._subscriptions.pop(ws, None)
+
+    async def _broadcast(self, message: Dict[str, Any]):
+        # 실제 서버처럼 바이너리 프레임으로 전송합니다.
+        payload = json.dumps(message).encode()
+        for ws in list(self._clients):
+            if message.get("type") in self._subscriptions.get(ws, set()):
+                try:
+                    await ws.send(payload)
+                except Exception:
+                    self._clients.discard(ws)
+
+
+def main():
+    p = argparse.ArgumentParser(description="오프라인 테스트용 Upbit WebSocket 대역 서버")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--market", nargs="+", default=["KRW-BTC"])
+    p.add_argument("--interval", type=float, default=1.0, help="모의 ticker 전송 주기(초)")
+    args = p.parse_args()
+
+    server = StubUpbitWebSocketServer(args.host, args.port).start()
+    print(f"Upbit WebSocket 대역 서버 시작: {server.url}")
+    prices = {m: 100_000.0 for m in args.market}
+    rng = random.Random(0)
+    stop = threading.Event()
+    try:
+        while not stop.wait(args.interval):
+            for market in args.market:
+                prices[market] *= 1.0 + rng.gauss(0.0, 0.001)
+                server.publish_ticker(market, round(prices[market]))
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from app.archive import TradeArchive
+from app.firestore_trade_db import FirestoreCache
+from app.memory_trade_db import MemoryTradeDB
+
+MARKET = "KRW-BTC"
+
+
+def _trade(i: int, state: str = 'done') -> dict:
+    return {
+        'buy_uuid': f'b{i}', 'buy_price': 100000, 'buy_quantity': 0.1, 'buy_amount': 10005.0,
+        'buy_create_time': 0, 'sell_uuid': f's{i}', 'sell_price': 101000.0, 'sell_amount': 10094.9,
+        'sell_complete_time': 1_700_000_000, 'state': state, 'market': MARKET,
+    }
+
+
+class _LockCheckingArchive(TradeArchive):
+    """flush가 캐시 잠금을 쥔 채 불리는지 다른 스레드에서 잠금을 잡아 확인합니다."""
+
+    def __init__(self, root, **kwargs):
+        super().__init__(root, **kwargs)
+        self.cache = None
+        self.flushed_under_lock = []
+
+    def flush(self):
+        acquired = []
+
+        def probe():
+            got = self.cache._lock.acquire(timeout=0.2)
+            if got:
+                self.cache._lock.release()
+            acquired.append(got)
+
+        t = threading.Thread(target=probe)
+        t.start()
+        t.join()
+        self.flushed_under_lock.append(not acquired[0])
+        return super().flush()
+
+
+def test_add_only_buffers(tmp_path):
+    archive = TradeArchive(str(tmp_path), flush_size=2)
+
+    assert archive.add(_trade(1)) is False
+    assert archive.add(_trade(2)) is True
+    assert list(archive.iter_trades()) == []
+    assert archive.flush() == 2
+    assert [t['buy_uuid'] for t in archive.iter_trades(MARKET)] == ['b1', 'b2']
+
+
+def test_cache_flushes_full_archive_outside_lock(tmp_path):
+    archive = _LockCheckingArchive(str(tmp_path), flush_size=2)
+    cache = FirestoreCache(MemoryTradeDB(), archive=archive)
+    archive.cache = cache
+
+    cache.upsert_trade(_trade(1, 'waiting'))
+    cache.upsert_trade(_trade(1))
+    assert archive.flushed_under_lock == []
+    cache.upsert_trades([_trade(2), _trade(3, 'waiting')])
+
+    assert archive.flushed_under_lock == [False]
+    assert sorted(t['buy_uuid'] for t in archive.iter_trades(MARKET)) == ['b1', 'b2']
+    assert cache.get_waiting_trades_count_by_market(MARKET) == 1
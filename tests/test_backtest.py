@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import argparse
+import sys
+import threading
+
+from app import backtest, metrics
+from app.backtest import run_backtest, settings_for_backtest
+from app.firestore_trade_db import FirestoreCache
+from app.ledger import BalanceLedger
+from app.memory_trade_db import MemoryTradeDB
+from app.sim_exchange import SimExchange
+from app.trade import reprice_orders, run_once
+from app.util import round_price_to_tick
+
+MARKET = "KRW-BTC"
+
+
+def _settings(**overrides):
+    args = dict(
+        market=MARKET, krw=10000.0, interval=60, tp=1.0, skip_buy_within=0.0,
+        max_order_count=1, tier_table="",
+    )
+    args.update(overrides)
+    return settings_for_backtest(argparse.Namespace(**args))
+
+
+def test_run_once_reprices_loss_order_on_bare_sim_exchange():
+    # 백테스트처럼 SimExchange를 클라이언트 자리에 그대로 넘깁니다.
+    sim = SimExchange(krw=1_000_000.0)
+    sim.set_price(MARKET, 90000.0)
+    sim.assets[MARKET] = 0.1
+    sell = sim.sell_limit(MARKET, 0.1, 95000.0)
+    db = FirestoreCache(MemoryTradeDB())
+    db.upsert_trade({
+        'buy_uuid': 'b1', 'buy_price': 100000, 'buy_quantity': 0.1, 'buy_amount': 10005.0,
+        'buy_create_time': 0, 'sell_uuid': sell['uuid'], 'sell_price': 95000.0, 'sell_amount': None,
+        'sell_complete_time': None, 'state': 'waiting', 'market': MARKET,
+    })
+    cfg = _settings(max_order_count=0)
+
+    run_once(cfg, sim, db, MARKET, None, None, BalanceLedger(sim, reconcile_interval_sec=0))
+
+    trade = db.get_trade_by_sell_uuid(sim.get_open_orders(MARKET)[0]['uuid'])
+    assert trade['buy_uuid'] == 'b1'
+    # 손실 구간 주문은 매수가 기준 익절가로 바뀌고, 잔고 부족 경로의 최고가 주문 변경은 현재가 기준으로 다시 내립니다.
+    assert sim.orders[sell['uuid']]['state'] == 'cancel'
+    assert sum(1 for o in sim.orders.values() if o['side'] == 'ask' and o['state'] == 'cancel') == 2
+    assert trade['sell_price'] == round_price_to_tick(90000.0 * 1.01, method='up', market=MARKET)
+    assert sim.open_order_count() == 1
+
+
+
+def test_reprice_keeps_remaining_volume_after_partial_fill():
+    sim = SimExchange(krw=1_000_000.0)
+    sim.set_price(MARKET, 90000.0)
+    sim.assets[MARKET] = 0.1
+    sell = sim.sell_limit(MARKET, 0.1, 95000.0)
+    # 고가가 주문가에 닿았지만 0.04만 체결됩니다.
+    sim.set_price(MARKET, 90000.0, high=95000.0, liquidity=0.04)
+    db = FirestoreCache(MemoryTradeDB())
+    trade = {
+        'buy_uuid': 'b1', 'buy_price': 100000, 'buy_quantity': 0.1, 'buy_amount': 10005.0,
+        'buy_create_time': 0, 'sell_uuid': sell['uuid'], 'sell_price': 95000.0, 'sell_amount': None,
+        'sell_complete_time': None, 'state': 'waiting', 'market': MARKET,
+    }
+    db.upsert_trade(dict(trade))
+
+    failures = reprice_orders(sim, db, MARKET, [(db.get_trade_by_sell_uuid(sell['uuid']), 91000.0)])
+
+    assert failures == []
+    new_order = sim.get_open_orders(MARKET)[0]
+    assert float(new_order['volume']) == 0.06
+    assert float(new_order['price']) == 91000.0
+    assert db.get_trade_by_sell_uuid(new_order['uuid'])['buy_uuid'] == 'b1'
+
+def test_sim_exchange_does_not_overdraw_under_concurrent_workers():
+    # --dry-run --workers N처럼 여러 스레드가 같은 SimExchange로 동시에 매수합니다.
+    # 잔고 확인과 차감 사이에 다른 스레드가 끼어들면 잔고보다 많이 매수됩니다.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(50):
+            sim = SimExchange(krw=100 * 1000.0, fee_rate=0.0)
+            sim.set_price(MARKET, 1000.0)
+            filled = []
+
+            def worker():
+                for _ in range(100):
+                    if "error" not in sim.buy_market(MARKET, 1000.0):
+                        filled.append(1)
+
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            assert len(filled) == 100
+            assert sim.krw == 0.0
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_backtest_fills_repriced_order():
+    # 100000에 1건, 90000에 1건 매수한 뒤 80000에서 주문 수 상한에 걸려 가장 낮은 매도 주문을 현재가 +1%로 내립니다.
+    # 다음 캔들 고가가 그 가격에 닿으면 변경된 주문만 체결되고, 대기 주문이 1건으로 줄어 한 번 더 매수합니다.
+    # 변경이 실패하면 매도는 0건입니다.
+    candles = [
+        (0.0, 100000.0, 100000.0, 100000.0, 100000.0),
+        (60.0, 90000.0, 90000.0, 90000.0, 90000.0),
+        (120.0, 80000.0, 80000.0, 80000.0, 80000.0),
+        (180.0, 80000.0, 81000.0, 80000.0, 80000.0),
+    ]
+    report = run_backtest(_settings(), candles)
+
+    assert report['buys'] == 3
+    assert report['sells'] == 1
+    assert report['open_orders'] == 2
+    # 90000에 10000원 매수(수수료 5원) 후 변경된 가격에 매도(수수료 0.05%)
+    repriced = round_price_to_tick(80000.0 * 1.01, method='up', market=MARKET)
+    volume = 10000.0 / 90000.0
+    proceeds = repriced * volume * (1 - 0.0005)
+    assert abs(report['realized_pnl'] - round(proceeds - 10005.0, 2)) < 0.02
+
+
+def test_backtest_take_profit_round_trip_pnl():
+    # 100000에 10000원 매수(수수료 5원), 익절가는 수수료 포함 단가 100050의 +1%를 호가단위로 올린 102000입니다.
+    # 다음 캔들 고가가 102000에 닿아 체결되고, 같은 실행에서 체결을 기록한 뒤 한 번 더 매수합니다.
+    candles = [
+        (0.0, 100000.0, 100000.0, 100000.0, 100000.0),
+        (60.0, 100000.0, 102000.0, 100000.0, 101000.0),
+    ]
+    report = run_backtest(_settings(), candles)
+
+    assert report['buys'] == 2
+    assert report['sells'] == 1
+    assert report['open_orders'] == 1
+    # 102000 * 0.1 * (1 - 0.0005) - 10005 = 189.9
+    assert report['realized_pnl'] == 189.9
+    # 백테스트 동안 꺼 둔 지표 기록은 끝나면 원래대로 켜집니다.
+    assert metrics.set_enabled(True) is True
+
+
+def test_backtest_skips_idle_candles(monkeypatch):
+    # 100000에 매수하면 익절가는 102000이고, 101000은 매수 스킵 구간(0.3% 초과 ~ 1.3% 이내)입니다.
+    # 스킵 구간에 머무는 캔들은 run_once를 실행하지 않고, 고가로 체결된 캔들에서만 다시 실행합니다.
+    calls = []
+    monkeypatch.setattr(backtest, "run_once", lambda *a, **k: calls.append(a[0]) or run_once(*a, **k))
+    candles = [(0.0, 100000.0, 100000.0, 100000.0, 100000.0)]
+    candles += [(60.0 * i, 101000.0, 101000.0, 101000.0, 101000.0) for i in range(1, 1000)]
+    candles.append((60000.0, 101000.0, 102000.0, 101000.0, 101000.0))
+    report = run_backtest(_settings(skip_buy_within=0.3), candles)
+
+    assert len(calls) == 2
+    assert report['buys'] == 2
+    assert report['sells'] == 1
+    assert report['realized_pnl'] == 189.9
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import json
+import sys
+import threading
+
+from app.events import _STOP, EventJournal
+
+
+def test_stop_sentinel_mid_batch_writes_rest_and_exits(tmp_path):
+    path = tmp_path / "events.jsonl"
+    journal = EventJournal(str(path), flush_interval_sec=0.05)
+    # 기록 스레드가 한 배치로 가져가도록 시작 전에 큐를 채웁니다. 종료 표시 뒤에도 이벤트가 있습니다.
+    journal.emit("price", "KRW-BTC", price=100.0)
+    journal._queue.put(_STOP)
+    journal.emit("price", "KRW-BTC", price=101.0)
+    journal.start()
+    thread = journal._thread
+
+    thread.join(timeout=2.0)
+
+    assert not thread.is_alive()
+    with open(path, encoding="utf-8") as fp:
+        prices = [json.loads(line)["price"] for line in fp]
+    assert prices == [100.0, 101.0]
+    journal.close()
+
+
+def test_debug_sampling_is_exact_across_threads(tmp_path):
+    # 마켓/재호가 스레드가 함께 emit()해도 100건 중 정확히 1건만 남아야 합니다.
+    journal = EventJournal(str(tmp_path / "events.jsonl"), debug_sample=0.01)
+    kept = []
+
+    def worker():
+        kept.append(sum(journal._sampled("skip") for _ in range(50_000)))
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert sum(kept) == 8 * 50_000 // 100
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from app.ledger import BalanceLedger
+
+MARKET = "KRW-BTC"
+
+
+class FakeExchange:
+    def __init__(self, krw):
+        self.krw = krw
+        self.open = {}
+
+    def get_krw_balance(self):
+        return self.krw
+
+    def get_open_orders(self, market):
+        return [{"uuid": u, "side": "ask"} for u, m in self.open.items() if m == market]
+
+    def place_sell(self, uuid):
+        self.open[uuid] = MARKET
+
+    def fill_sell(self, uuid, proceeds):
+        del self.open[uuid]
+        self.krw += proceeds
+
+
+def _closed(sell_uuid, amount):
+    return {"sell_uuid": sell_uuid, "state": "done", "sell_amount": amount}
+
+
+def _waiting(sell_uuid):
+    return {"sell_uuid": sell_uuid, "state": "waiting"}
+
+
+def test_sell_filled_before_reconcile_is_not_credited_twice():
+    exchange = FakeExchange(100_000.0)
+    exchange.place_sell("s1")
+    ledger = BalanceLedger(exchange, reconcile_interval_sec=300, markets=[MARKET])
+    assert ledger.available() == 100_000.0
+
+    # 거래소에서 체결된 뒤, 사이클이 'done'을 보기 전에 주기 보정이 먼저 실행됩니다.
+    exchange.fill_sell("s1", 10_100.0)
+    ledger.reconcile()
+    assert ledger.available() == 110_100.0
+    ledger.on_trade_update("waiting", _closed("s1", 10_100.0))
+    assert ledger.available() == 110_100.0
+
+
+def test_sell_open_at_reconcile_is_credited_when_it_fills():
+    exchange = FakeExchange(100_000.0)
+    exchange.place_sell("s1")
+    ledger = BalanceLedger(exchange, reconcile_interval_sec=300, markets=[MARKET])
+    ledger.reconcile()
+    exchange.fill_sell("s1", 10_100.0)
+    ledger.on_trade_update("waiting", _closed("s1", 10_100.0))
+    assert ledger.available() == exchange.krw
+    # 같은 종료 이벤트가 다시 와도 한 번만 가산합니다.
+    ledger.on_trade_update("waiting", _closed("s1", 10_100.0))
+    assert ledger.available() == exchange.krw
+
+
+def test_sell_placed_or_repriced_after_reconcile_is_credited():
+    exchange = FakeExchange(100_000.0)
+    exchange.place_sell("s1")
+    ledger = BalanceLedger(exchange, reconcile_interval_sec=300, markets=[MARKET])
+    ledger.reconcile()
+    # 보정 뒤에 낸 주문과 재주문으로 바뀐 주문
+    exchange.place_sell("s2")
+    ledger.on_trade_update(None, _waiting("s2"))
+    del exchange.open["s1"]
+    exchange.place_sell("s1b")
+    ledger.on_trade_update("waiting", _waiting("s1b"))
+
+    exchange.fill_sell("s2", 5_000.0)
+    ledger.on_trade_update("waiting", _closed("s2", 5_000.0))
+    exchange.fill_sell("s1b", 7_000.0)
+    ledger.on_trade_update("waiting", _closed("s1b", 7_000.0))
+    assert ledger.available() == exchange.krw == 112_000.0
+
+
+def test_reconcile_between_buy_and_settle_does_not_debit_twice():
+    exchange = FakeExchange(100_000.0)
+    ledger = BalanceLedger(exchange, reconcile_interval_sec=300, markets=[MARKET])
+    assert ledger.available() == 100_000.0
+    assert ledger.reserve(10_000.0)
+
+    # 시장가 매수가 거래소에서 체결된 직후 보정이 끼어듭니다.
+    exchange.krw -= 10_005.0
+    epoch = ledger.mark_ordered()
+    ledger.reconcile()
+    ledger.settle_buy(10_000.0, 10_005.0, epoch)
+    assert ledger.available() == exchange.krw == 89_995.0
+
+
+def test_buy_settled_without_reconcile_is_debited():
+    exchange = FakeExchange(100_000.0)
+    ledger = BalanceLedger(exchange, reconcile_interval_sec=300, markets=[MARKET])
+    ledger.available()
+    assert ledger.reserve(10_000.0)
+    assert ledger.available() == 90_000.0
+    exchange.krw -= 10_005.0
+    epoch = ledger.mark_ordered()
+    ledger.settle_buy(10_000.0, 10_005.0, epoch)
+    assert ledger.available() == exchange.krw
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from app.market_data import MarketDataReader, MarketDataWriter, volume_delta
+from app.upbit_client import UpbitClient
+
+MARKET = "KRW-BTC"
+
+
+def test_volume_delta_handles_first_value_and_daily_reset():
+    assert volume_delta(None, 120.0) == 0.0
+    assert volume_delta(120.0, 121.5) == 1.5
+    # 0시(KST)에 누적 거래량이 초기화되면 새 누적 값 전체가 그 사이 거래량입니다.
+    assert volume_delta(121.5, 0.25) == 0.25
+
+
+def test_bars_accumulate_volume_from_acc_trade_volume(tmp_path):
+    path = str(tmp_path / "md.bin")
+    writer = MarketDataWriter(path, bar_capacity=10, tick_capacity=10, max_markets=2)
+    try:
+        t0 = 1_700_000_040 + 20
+        writer.add_ticks({MARKET: 100.0}, ts=t0, acc_volumes={MARKET: 500.0})
+        writer.add_ticks({MARKET: 101.0}, ts=t0 + 10, acc_volumes={MARKET: 502.0})
+        writer.add_ticks({MARKET: 99.0}, ts=t0 + 50, acc_volumes={MARKET: 505.5})
+        # 누적 거래량이 없으면 거래량 0으로 기록합니다 (매매 루프의 현재가 기록).
+        writer.add_ticks({MARKET: 98.0}, ts=t0 + 55)
+        reader = MarketDataReader(path)
+        try:
+            bars = reader.bars(MARKET).tolist()
+            ticks = reader.ticks(MARKET)[:, 2].tolist()
+        finally:
+            reader.close()
+    finally:
+        writer.close()
+
+    assert ticks == [0.0, 2.0, 3.5, 0.0]
+    minute = t0 - t0 % 60
+    assert bars == [
+        [minute, 100.0, 101.0, 100.0, 101.0, 2.0],
+        [minute + 60, 99.0, 99.0, 98.0, 98.0, 3.5],
+    ]
+
+
+class _VolumeBackend:
+    def ticker_with_volumes(self, markets):
+        return ({m: 100.0 for m in markets}, {m: 42.0 for m in markets}), None
+
+    def close(self):
+        return
+
+
+def test_client_returns_prices_and_acc_volumes():
+    client = UpbitClient("", "")
+    client._backend = _VolumeBackend()
+
+    assert client.get_current_prices_and_volumes([MARKET]) == ({MARKET: 100.0}, {MARKET: 42.0})
+
+
+def test_dry_run_client_has_no_volumes():
+    client = UpbitClient("", "", dry_run=True)
+    client._sim.set_price(MARKET, 100.0)
+
+    assert client.get_current_prices_and_volumes([MARKET]) == ({MARKET: 100.0}, {})
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from app.config import Settings
+from app.firestore_trade_db import FirestoreCache
+from app.ledger import BalanceLedger
+from app.memory_trade_db import MemoryTradeDB
+from app.shard import LeaseGuardedCache, LeaseLostError, ShardCoordinator
+from app.sim_exchange import SimExchange
+from app.trade import run_once, share_ledger
+
+MARKET = "KRW-BTC"
+
+
+class _FlakyStore:
+    """fail이 True인 동안 모든 lease/워커 호출이 실패하는 저장소 래퍼"""
+
+    def __init__(self, store):
+        self._store = store
+        self.fail = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if self.fail:
+                raise ConnectionError("저장소 연결 끊김")
+            return attr(*args, **kwargs)
+        return call
+
+
+def _coordinator(store, worker_id):
+    return ShardCoordinator(store, FirestoreCache(MemoryTradeDB()), worker_id, [MARKET], lease_ttl_sec=30.0)
+
+
+def _cfg(markets):
+    return Settings(
+        access_key="", secret_key="", market=markets, krw=10000.0, interval_sec=0, tp_ratio=1.0,
+        firestore_credential_path="", buy_fill_timeout_sec=0.0, shard=True,
+    )
+
+
+def _trade(buy_uuid):
+    return {
+        'buy_uuid': buy_uuid, 'buy_price': 100000, 'buy_quantity': 0.1, 'buy_amount': 10005.0,
+        'buy_create_time': 0, 'sell_uuid': f's-{buy_uuid}', 'sell_price': 101000.0, 'sell_amount': None,
+        'sell_complete_time': None, 'state': 'waiting', 'market': MARKET,
+    }
+
+
+def test_failed_heartbeats_drop_market_before_lease_expires():
+    shared = MemoryTradeDB()
+    flaky = _FlakyStore(shared)
+    a = _coordinator(flaky, "A")
+    b = _coordinator(shared, "B")
+
+    a.sync(now=1000.0)
+    assert a.owned(now=1000.0) == [MARKET]
+    flaky.fail = True
+    for now in (1010.0, 1020.0, 1030.0):
+        with pytest.raises(ConnectionError):
+            a.sync(now=now)
+    b.sync(now=1031.0)
+
+    assert b.owned(now=1040.0) == [MARKET]
+    assert a.owned(now=1040.0) == []
+    # 연장 실패 후에는 만료(1030)보다 lease_margin_sec 먼저 빠집니다.
+    assert a.owned(now=1019.0) == [MARKET]
+    assert a.owned(now=1020.0) == []
+
+
+def test_guarded_cache_refuses_writes_after_lease_lost():
+    store = MemoryTradeDB()
+    coordinator = _coordinator(store, "A")
+    coordinator.sync(now=time.time())
+    guarded = LeaseGuardedCache(coordinator.cache, coordinator, MARKET)
+
+    guarded.upsert_trade(_trade("b1"))
+    assert guarded.get_waiting_trades_count_by_market(MARKET) == 1
+
+    # 사이클 도중 lease를 잃었다가 다시 얻으면 lease는 유효해도 사이클 시작 때의 epoch와 달라 기록하지 않습니다.
+    store.release_lease(MARKET, "A")
+    other = _coordinator(store, "B")
+    other.sync(now=time.time())
+    coordinator.sync(now=time.time())
+    assert coordinator.owned() == []
+    other.stop()
+    coordinator.sync(now=time.time())
+    assert coordinator.owned() == [MARKET]
+    with pytest.raises(LeaseLostError):
+        guarded.upsert_trades([_trade("b2")])
+    assert coordinator.cache.get_trade_by_sell_uuid("s-b2") is None
+    LeaseGuardedCache(coordinator.cache, coordinator, MARKET).upsert_trades([_trade("b2")])
+    assert coordinator.cache.get_trade_by_sell_uuid("s-b2") is not None
+
+
+def test_shard_workers_split_account_krw():
+    # 두 워커가 같은 계좌(SimExchange)와 lease 저장소를 씁니다.
+    markets = ["KRW-BTC", "KRW-ETH"]
+    sim = SimExchange(krw=30000.0)
+    for m in markets:
+        sim.set_price(m, 100000.0)
+    store = MemoryTradeDB()
+    workers = {}
+    for worker_id in ("A", "B"):
+        coordinator = ShardCoordinator(store, FirestoreCache(store), worker_id, markets, lease_ttl_sec=30.0)
+        ledger = BalanceLedger(sim, reconcile_interval_sec=300.0, markets=markets)
+        share_ledger(ledger, coordinator)
+        workers[worker_id] = (coordinator, ledger)
+    now = time.time()
+    for worker_id in ("A", "B", "A", "B"):
+        workers[worker_id][0].sync(now=now)
+    assert workers["A"][0].owned() == ["KRW-BTC"]
+    assert workers["B"][0].owned() == ["KRW-ETH"]
+
+    # 두 워커가 동시에 잔고를 보고 예약해도 예약 합이 계좌 잔고를 넘지 않습니다.
+    available = {w: ledger.available() for w, (_, ledger) in workers.items()}
+    assert sum(available.values()) <= sim.krw
+    reserved = [15000.0 for _, ledger in workers.values() if ledger.reserve(15000.0)]
+    assert sum(reserved) <= sim.krw
+    for _, ledger in workers.values():
+        ledger.release(15000.0)
+
+    # 한 워커가 매수하면 다른 워커도 다음 사이클에서 줄어든 잔고 기준으로 몫을 잡습니다.
+    coordinator, ledger = workers["A"]
+    run_once(_cfg(markets), sim, coordinator.cache, "KRW-BTC", None, None, ledger)
+    assert sim.krw == 30000.0 - 10005.0
+    assert sum(ledger.available() for _, ledger in workers.values()) <= sim.krw
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from app.ticker_snapshot import TickerSnapshot
+
+
+class FakeClient:
+    def __init__(self, prices):
+        self.prices = dict(prices)
+        self.calls = []
+
+    def get_current_prices(self, markets):
+        self.calls.append(list(markets))
+        return {m: self.prices[m] for m in markets if m in self.prices}
+
+    def get_current_price(self, market):
+        self.calls.append([market])
+        return self.prices[market]
+
+
+def test_stream_tick_on_one_market_does_not_refresh_another(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.ticker_snapshot.time.monotonic", lambda: now[0])
+    client = FakeClient({"KRW-BTC": 100.0, "KRW-XYZ": 5.0})
+    ticker = TickerSnapshot(client, ["KRW-BTC", "KRW-XYZ"], ttl_sec=10.0)
+    ticker.refresh()
+    assert client.calls == [["KRW-BTC", "KRW-XYZ"]]
+
+    # 유동성 높은 마켓만 계속 스트리밍되고, 뜸한 마켓은 TTL이 지나면 REST로 다시 조회합니다.
+    client.prices["KRW-XYZ"] = 6.0
+    now[0] += 11.0
+    ticker.update("KRW-BTC", 101.0)
+    assert ticker.is_streaming("KRW-BTC")
+    assert not ticker.is_streaming("KRW-XYZ")
+    assert not ticker.is_streaming()
+    assert ticker.stale_markets() == ["KRW-XYZ"]
+    assert ticker.prices() == {"KRW-BTC": 101.0, "KRW-XYZ": 6.0}
+    assert client.calls[-1] == ["KRW-XYZ"]
+
+    # TTL 안에서는 다시 조회하지 않습니다.
+    calls = len(client.calls)
+    now[0] += 1.0
+    assert ticker.get_price("KRW-XYZ") == 6.0
+    assert len(client.calls) == calls
+
+
+def test_refresh_ticker_skips_only_streaming_markets(monkeypatch):
+    from app.trade import _refresh_ticker
+
+    now = [1000.0]
+    monkeypatch.setattr("app.ticker_snapshot.time.monotonic", lambda: now[0])
+    client = FakeClient({"KRW-BTC": 100.0, "KRW-XYZ": 5.0})
+    ticker = TickerSnapshot(client, ["KRW-BTC", "KRW-XYZ"], ttl_sec=10.0)
+    ticker.update("KRW-BTC", 100.0)
+    _refresh_ticker(ticker)
+    assert client.calls == [["KRW-XYZ"]]
+    ticker.update("KRW-XYZ", 5.0)
+    _refresh_ticker(ticker)
+    assert client.calls == [["KRW-XYZ"]]
+
+
+def test_on_prices_receives_fetched_and_streamed_prices():
+    client = FakeClient({"KRW-BTC": 100.0})
+    ticker = TickerSnapshot(client, ["KRW-BTC"], ttl_sec=10.0)
+    seen = []
+    ticker.on_prices = seen.append
+    ticker.refresh()
+    ticker.update("KRW-BTC", 101.0)
+    assert seen == [{"KRW-BTC": 100.0}, {"KRW-BTC": 101.0}]
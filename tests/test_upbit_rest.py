@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from app.http_stub import StubUpbitHttpServer
+from app.rate_limit import RateLimitError, RequestScheduler
+from app.sim_exchange import SimExchange
+from app.upbit_auth import UpbitSigner, build_query_string
+from app.upbit_client import UpbitClient
+from app.upbit_rest import UpbitApiError, UpbitRestClient
+
+MARKET = "KRW-BTC"
+ACCESS_KEY = "stub-access"
+SECRET_KEY = "stub-secret"
+
+
+@pytest.fixture
+def stub():
+    sim = SimExchange(krw=1_000_000.0)
+    sim.set_price(MARKET, 100000.0)
+    sim.assets[MARKET] = 1.0
+    server = StubUpbitHttpServer(sim, access_key=ACCESS_KEY, secret_key=SECRET_KEY).start()
+    yield server
+    server.stop()
+
+
+def _client(stub, secret_key=SECRET_KEY, scheduler=None):
+    return UpbitClient(ACCESS_KEY, secret_key, scheduler=scheduler, base_url=stub.url)
+
+
+def test_signed_requests_pass_jwt_and_query_hash_checks(stub):
+    client = _client(stub)
+    try:
+        assert client.get_krw_balance() == 1_000_000.0
+        # POST 본문과 GET 쿼리 모두 query_hash가 서버 계산과 같아야 200이 옵니다.
+        order = client.sell_limit(MARKET, 0.5, 110000.0)
+        assert client.get_order(order["uuid"])["state"] == "wait"
+        assert [o["uuid"] for o in client.get_open_orders(MARKET)] == [order["uuid"]]
+    finally:
+        client.close()
+
+
+def test_wrong_secret_is_rejected(stub):
+    client = _client(stub, secret_key="other-secret")
+    try:
+        with pytest.raises(UpbitApiError) as info:
+            client.get_krw_balance()
+        assert info.value.status_code == 401
+        assert info.value.name == "jwt_verification"
+    finally:
+        client.close()
+
+
+def test_query_hash_must_match_params(stub):
+    signer = UpbitSigner(ACCESS_KEY, SECRET_KEY)
+    signed = signer.authorization(build_query_string({"uuid": "a"}))
+
+    status, body, _ = stub.dispatch("GET", "/v1/order", {"uuid": "b"}, signed)
+
+    assert status == 401
+    assert body["error"]["name"] == "invalid_query_payload"
+
+
+def test_requests_reuse_one_keep_alive_connection(stub):
+    # 속도 제한 대기 없이 빠르게 보내도록 버킷을 넉넉히 잡습니다.
+    limits = {name: (1000.0, 1000.0) for name in ("order", "exchange", "quotation")}
+    client = _client(stub, scheduler=RequestScheduler(limits=limits))
+    try:
+        for _ in range(20):
+            client.get_current_price(MARKET)
+            client.get_krw_balance()
+            client.get_open_orders(MARKET)
+    finally:
+        client.close()
+
+    assert stub.requests == 60
+    assert stub.connections == 1
+
+
+def test_rate_limited_request_is_retried_by_scheduler(stub):
+    scheduler = RequestScheduler(backoff_base_sec=0.01, backoff_max_sec=0.02)
+    client = _client(stub, scheduler=scheduler)
+    try:
+        stub.fail_next(429, count=2)
+        assert client.get_krw_balance() == 1_000_000.0
+        assert stub.requests == 3
+    finally:
+        client.close()
+
+
+def test_rate_limit_gives_up_after_max_retries(stub):
+    scheduler = RequestScheduler(max_retries=1, backoff_base_sec=0.01, backoff_max_sec=0.02)
+    client = _client(stub, scheduler=scheduler)
+    try:
+        stub.fail_next(429, count=2)
+        with pytest.raises(RateLimitError):
+            client.get_krw_balance()
+        assert stub.requests == 2
+    finally:
+        client.close()
+
+
+def test_cancel_and_new_replaces_order(stub):
+    client = _client(stub)
+    try:
+        order = client.sell_limit(MARKET, 0.5, 110000.0)
+        result = client.cancel_and_new(order["uuid"], MARKET, None, 105000.0)
+    finally:
+        client.close()
+
+    new_uuid = result["new_order_uuid"]
+    assert stub.sim.orders[order["uuid"]]["state"] == "cancel"
+    new_order = stub.sim.orders[new_uuid]
+    assert new_order["state"] == "wait"
+    assert float(new_order["price"]) == 105000.0
+    assert float(new_order["remaining_volume"]) == 0.5
+    assert [o["uuid"] for o in stub.sim.get_open_orders(MARKET)] == [new_uuid]
+
+
+def test_rest_client_cancel_and_new_rejects_unknown_order(stub):
+    rest = UpbitRestClient(ACCESS_KEY, SECRET_KEY, base_url=stub.url)
+    try:
+        with pytest.raises(UpbitApiError) as info:
+            rest.cancel_and_new("missing", None, 105000.0)
+        assert info.value.status_code == 400
+    finally:
+        rest.close()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""고정소수점 호가단위/수량 계산이 기존 Decimal 구현과 같은 값을 내는지 무작위 입력으로 확인합니다."""
+import math
+import random
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+
+import pytest
+
+from app.util import CUSTOM_MARKET_TICK, round_price_to_tick, round_prices_to_tick, round_volume, round_volumes
+
+
+# ---- 기준 구현 (고정소수점 엔진 이전의 Decimal 코드) ----
+
+def _oracle_tick_size(price):
+    p = Decimal(str(price))
+    if p < Decimal('10'):
+        return Decimal('0.01')
+    elif p < Decimal('100'):
+        return Decimal('0.1')
+    elif p < Decimal('1000'):
+        return Decimal('1')
+    elif p < Decimal('10000'):
+        return Decimal('5')
+    elif p < Decimal('100000'):
+        return Decimal('10')
+    elif p < Decimal('500000'):
+        return Decimal('50')
+    elif p < Decimal('1000000'):
+        return Decimal('100')
+    elif p < Decimal('2000000'):
+        return Decimal('500')
+    else:
+        return Decimal('1000')
+
+
+def _oracle_round_price(price, method='up', market=None):
+    if market and market in CUSTOM_MARKET_TICK:
+        t = CUSTOM_MARKET_TICK[market]
+    else:
+        t = _oracle_tick_size(price)
+    p = Decimal(str(price))
+    if method == 'down':
+        q = (p / t).to_integral_value(rounding=ROUND_DOWN)
+    else:
+        q = (p / t).to_integral_value(rounding=ROUND_UP)
+    return float(q * t)
+
+
+def _oracle_round_volume(v, digits=8):
+    return float(Decimal(str(v)).quantize(Decimal('1.' + '0' * digits), rounding=ROUND_DOWN))
+
+
+# ---- 입력 생성 ----
+
+MARKETS = [None, "KRW-DOGE"] + sorted(CUSTOM_MARKET_TICK)
+BOUNDS = [10, 100, 1000, 10000, 100000, 500000, 1000000, 2000000]
+TICKS = [0.01, 0.1, 1, 5, 10, 50, 100, 500, 1000]
+
+
+def _neighbours(x):
+    """x와 바로 옆 float들"""
+    return [math.nextafter(x, -math.inf), x, math.nextafter(x, math.inf)]
+
+
+def _prices(rng, count):
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            # 10^-3 ~ 10^10 로그 균등
+            yield 10 ** rng.uniform(-3, 10)
+        elif kind < 0.6:
+            # 소수 자릿수가 짧은 '사람이 쓰는' 가격
+            yield round(10 ** rng.uniform(-2, 9), rng.randint(0, 4))
+        elif kind < 0.8:
+            # 호가단위의 정수배와 그 양옆
+            tick = rng.choice(TICKS)
+            yield from _neighbours(rng.randint(1, 10 ** 6) * tick)
+        elif kind < 0.9:
+            # 호가단위 테이블 경계와 그 양옆
+            yield from _neighbours(float(rng.choice(BOUNDS)))
+        else:
+            # 익절가 계산처럼 곱셈으로 만든 가격
+            yield rng.randint(1, 10 ** 7) * (1.0 + rng.choice([0.1, 0.3, 0.5, 1.0, 1.5, 2.0]) * 0.01)
+
+
+def test_round_price_to_tick_matches_decimal():
+    rng = random.Random(20240901)
+    mismatches = []
+    for price in _prices(rng, 15000):
+        for market in MARKETS:
+            for method in ('up', 'down'):
+                expected = _oracle_round_price(price, method, market)
+                actual = round_price_to_tick(price, method, market)
+                if actual != expected:
+                    mismatches.append((price, method, market, actual, expected))
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("market", MARKETS)
+@pytest.mark.parametrize("method", ["up", "down"])
+def test_round_prices_to_tick_matches_decimal(market, method):
+    rng = random.Random(f"{market}-{method}")
+    prices = list(_prices(rng, 5000))
+    assert round_prices_to_tick(prices, method, market) == [_oracle_round_price(p, method, market) for p in prices]
+
+
+@pytest.mark.parametrize("bound", BOUNDS)
+def test_tick_boundaries(bound):
+    for price in _neighbours(float(bound)) + [bound - 0.001, bound + 0.001]:
+        for method in ('up', 'down'):
+            assert round_price_to_tick(price, method) == _oracle_round_price(price, method)
+
+
+def test_round_volume_matches_decimal():
+    rng = random.Random(7)
+    values = []
+    for _ in range(20000):
+        kind = rng.random()
+        if kind < 0.5:
+            values.append(10 ** rng.uniform(-10, 8))
+        elif kind < 0.8:
+            # 매수 금액 / 체결가처럼 나눗셈으로 만든 수량
+            values.append(rng.randint(5000, 10 ** 7) / rng.randint(1, 10 ** 8))
+        else:
+            values.extend(_neighbours(rng.randint(1, 10 ** 9) / 10 ** rng.randint(0, 10)))
+    values += [0.0, 1e-9, 1e-8, 0.1, 0.3, 1e7]
+    for digits in (0, 2, 4, 8, 10):
+        expected = [_oracle_round_volume(v, digits) for v in values]
+        assert [round_volume(v, digits) for v in values] == expected
+        assert round_volumes(values, digits) == expected
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("websockets")
+
+from app.config import Settings
+from app.firestore_trade_db import FirestoreCache
+from app.memory_trade_db import MemoryTradeDB
+from app.sim_exchange import SimExchange
+from app.trade import backfill_sell_orders
+from app.upbit_client import UpbitClient
+from app.ws_events import OrderEventHub
+from app.ws_stub import StubUpbitWebSocketServer
+
+MARKET = "KRW-BTC"
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def stub():
+    server = StubUpbitWebSocketServer().start()
+    yield server
+    server.stop()
+
+
+def _hub(stub, **callbacks):
+    hub = OrderEventHub([MARKET], url=stub.url, private_url=stub.url, **callbacks)
+    hub.start()
+    assert _wait(lambda: hub.connected and hub.ticker_connected)
+    # 구독 요청이 서버에 도착할 때까지 기다립니다.
+    assert _wait(lambda: len(stub._subscriptions) == 2)
+    return hub
+
+
+def test_ticker_stream_updates_price(stub):
+    prices = []
+    hub = _hub(stub, on_price=lambda market, price: prices.append((market, price)))
+    try:
+        stub.publish_ticker(MARKET, 123.0)
+        assert _wait(lambda: prices == [(MARKET, 123.0)])
+    finally:
+        hub.stop()
+
+
+def test_wait_for_order_returns_on_terminal_event(stub):
+    hub = _hub(stub)
+    try:
+        result = {}
+        waiter = threading.Thread(target=lambda: result.setdefault("done", hub.wait_for_order("buy-1", 5.0)))
+        waiter.start()
+        time.sleep(0.05)
+        stub.publish_order(MARKET, "buy-1", "BID", "wait")
+        stub.publish_order(MARKET, "buy-1", "BID", "done")
+        waiter.join(5.0)
+        assert result["done"] is True
+
+        # 대기자가 등록되기 전에 도착한 종료 이벤트도 놓치지 않습니다.
+        stub.publish_order(MARKET, "buy-2", "BID", "done")
+        assert _wait(lambda: "buy-2" in hub._terminal)
+        assert hub.wait_for_order("buy-2", 0.0) is True
+        assert hub.wait_for_order("buy-3", 0.05) is False
+    finally:
+        hub.stop()
+
+
+def test_sell_done_event_settles_trade(stub):
+    settled = []
+    hub = _hub(stub, on_sell_done=settled.append)
+    try:
+        stub.publish_order(MARKET, "sell-1", "ASK", "cancel")
+        stub.publish_order(MARKET, "sell-1", "ASK", "done")
+        assert _wait(lambda: settled == ["sell-1"])
+    finally:
+        hub.stop()
+
+
+def test_reconnect_backfills_sells_filled_while_disconnected(stub):
+    sim = SimExchange()
+    sim.set_price(MARKET, 100000.0)
+    client = UpbitClient("", "", dry_run=True, sim=sim)
+    buy = client.buy_market(MARKET, 10000.0)
+    sell = client.sell_limit(MARKET, float(buy["executed_volume"]), 101000.0)
+    db = FirestoreCache(MemoryTradeDB())
+    db.upsert_trade({
+        'buy_uuid': buy["uuid"], 'buy_price': 100000, 'buy_quantity': float(buy["executed_volume"]),
+        'buy_amount': 10005.0, 'buy_create_time': 0, 'sell_uuid': sell["uuid"], 'sell_price': 101000.0,
+        'sell_amount': None, 'sell_complete_time': None, 'state': 'waiting', 'market': MARKET,
+    })
+    closed = []
+    db.add_listener(lambda prev_state, trade: closed.append(dict(trade)) if trade.get('state') != 'waiting' else None)
+    cfg = Settings(access_key="", secret_key="", market=[MARKET], krw=10000.0, interval_sec=60, tp_ratio=1.0,
+                   firestore_credential_path="")
+    reconnects = []
+
+    def on_reconnect():
+        backfill_sell_orders(cfg, client, db)
+        reconnects.append(True)
+
+    hub = _hub(stub, on_reconnect=on_reconnect)
+    try:
+        stub.disconnect_all()
+        assert _wait(lambda: not hub.connected)
+        # 끊겨 있는 동안 체결되어 체결 이벤트를 받지 못한 매도 주문
+        sim.set_price(MARKET, 101000.0)
+        assert _wait(lambda: reconnects, timeout=10.0)
+        assert db.get_waiting_trades_count_by_market(MARKET) == 0
+        assert [(t['sell_uuid'], t['state']) for t in closed] == [(sell["uuid"], 'done')]
+        assert closed[0]['sell_amount'] > 0
+    finally:
+        hub.stop()